@@ -1,14 +1,29 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import asyncio
 import uuid
 import json
-import traceback
+import hashlib
+import logging
 from copy import deepcopy
-from main import generate_roadmap
 from fastapi.middleware.cors import CORSMiddleware
-from ourgpt import router as gpt_router
+from ourgpt import router as gpt_router, conversations
+import os
+import sys
+from job_store import create_job_store
+from disk_cache import DiskCache
+from job_scheduler import JobScheduler, QueueFull, PRIORITY_CHEAP, PRIORITY_NORMAL
+import telemetry
+from log_config import configure_logging, correlation_scope
+from sse import SSE_HEADERS, format_sse
+
+# The roadmap stack (crawl4ai, Gemini, YouTube client) is imported on first use, so workers boot
+# fast, need no network to start, and chatbot-only deployments never load it.
+PREWARM_BROWSER_POOL = os.getenv("PREWARM_BROWSER_POOL", "true").lower() in ("1", "true", "yes")
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -27,11 +42,117 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class CorrelationIdMiddleware:
+    """Tags each request's log lines with its X-Request-ID header, or a new ID, and echoes it back."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        with correlation_scope(request_id):
+            await self.app(scope, receive, send_with_request_id)
+
+app.add_middleware(CorrelationIdMiddleware)
+
 # Include the GPT router
 app.include_router(gpt_router, tags=["chatbot"])
 
-# In-memory storage for jobs (use Redis or a database in production)
-jobs = {}
+# Strong references to background startup tasks
+_startup_tasks = set()
+
+async def warm_browser_pool():
+    # Launch Chromium once per worker instead of once per roadmap topic
+    try:
+        from browser_pool import start_browser_pool
+        await start_browser_pool()
+    except Exception as e:
+        # Scraping will retry the launch lazily on first use
+        logger.warning("Error pre-warming browser pool: %s", e)
+
+def loaded_stage_caches():
+    """The pipeline stages' disk caches, for the stage modules this worker has imported."""
+    caches = []
+    for module_name, attribute in (("web_scraper", "search_cache"), ("topic_generator", "topic_cache"),
+                                   ("youtube_api", "youtube_cache")):
+        if module_name in sys.modules:
+            caches.append(getattr(sys.modules[module_name], attribute))
+    return caches
+
+async def evict_expired_jobs():
+    # Finished jobs, idle chatbot conversations and expired cache rows are dropped after their TTLs
+    # so none of them piles up
+    while True:
+        try:
+            evicted = await jobs.evict_expired()
+            if evicted:
+                logger.info("Evicted %d expired jobs", evicted)
+        except Exception as e:
+            logger.exception("Error evicting expired jobs: %s", e)
+        try:
+            evicted = await conversations.evict_expired()
+            if evicted:
+                logger.info("Evicted %d idle conversations", evicted)
+        except Exception as e:
+            logger.exception("Error evicting idle conversations: %s", e)
+        # The stage caches have no max_entries bound, so rows past their stale window are only removed here
+        for cache in loaded_stage_caches():
+            purged = await asyncio.to_thread(cache.purge_expired)
+            if purged:
+                logger.info("Purged %d expired %s cache entries", purged, cache.name)
+        await asyncio.sleep(JOB_EVICTION_INTERVAL)
+
+@app.on_event("startup")
+async def schedule_warmup():
+    # Warm up in the background so the worker starts serving immediately
+    scheduler.start()
+    background = [evict_expired_jobs()]
+    if PREWARM_BROWSER_POOL:
+        background.append(warm_browser_pool())
+    for coroutine in background:
+        task = asyncio.create_task(coroutine)
+        _startup_tasks.add(task)
+        task.add_done_callback(_startup_tasks.discard)
+
+@app.on_event("shutdown")
+async def close_shared_clients():
+    for task in list(_startup_tasks):
+        task.cancel()
+    await scheduler.stop()
+    await jobs.close()
+    await conversations.close()
+    # Only close what this worker actually loaded
+    if "browser_pool" in sys.modules:
+        await sys.modules["browser_pool"].stop_browser_pool()
+    if "youtube_api" in sys.modules:
+        await sys.modules["youtube_api"].close_client()
+    if "llm_client" in sys.modules:
+        await sys.modules["llm_client"].close_client()
+
+# Job storage shared by every worker (see job_store.JOB_STORE_URL)
+jobs = create_job_store()
+JOB_EVICTION_INTERVAL = float(os.getenv("JOB_EVICTION_INTERVAL", "600"))
+
+# Bounds how many roadmap pipelines run at once in this worker (see job_scheduler)
+scheduler = JobScheduler()
+
+# Finished roadmaps keyed by request fingerprint, so repeat requests skip the whole pipeline
+ROADMAP_CACHE_TTL = float(os.getenv("ROADMAP_CACHE_TTL", str(24 * 3600)))
+ROADMAP_CACHE_MAX_ENTRIES = int(os.getenv("ROADMAP_CACHE_MAX_ENTRIES", "500"))
+roadmap_cache = DiskCache("roadmaps", ttl=ROADMAP_CACHE_TTL, max_entries=ROADMAP_CACHE_MAX_ENTRIES)
+
+# Progress streams poll the shared job store, since the job may be running on another worker
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "0.5"))
+EVENTS_KEEPALIVE_INTERVAL = float(os.getenv("EVENTS_KEEPALIVE_INTERVAL", "15"))
 
 def convert_to_serializable(obj):
     """Convert any object to a JSON serializable format"""
@@ -51,25 +172,106 @@ class RoadmapRequest(BaseModel):
     include_paid: bool = True
     preferred_language: str | None = None
 
+def request_fingerprint(request: RoadmapRequest) -> str:
+    """Canonical hash of the parameters that determine a roadmap"""
+    def normalize(value):
+        return " ".join(value.lower().split()) if value else ""
+    canonical = json.dumps({
+        "degree": normalize(request.degree),
+        "country": normalize(request.country),
+        "language": normalize(request.language),
+        "include_paid": bool(request.include_paid),
+        "preferred_language": normalize(request.preferred_language),
+    }, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+async def request_priority(request: RoadmapRequest) -> int:
+    """Jobs whose topics are already cached skip the topic LLM call, so they run first"""
+    from topic_generator import get_cached_topics
+    if await get_cached_topics(request.degree, country=request.country, preferred_language=request.preferred_language):
+        return PRIORITY_CHEAP
+    return PRIORITY_NORMAL
+
 @app.post("/generate-roadmap")
-async def start_generation(request: RoadmapRequest, background_tasks: BackgroundTasks):
+async def start_generation(request: RoadmapRequest, inline: bool = False):
+    fingerprint = request_fingerprint(request)
     job_id = str(uuid.uuid4())
-    jobs[job_id] = {"status": "processing"}
-    background_tasks.add_task(run_generation, job_id, request)
+    
+    # A finished roadmap for the same parameters is returned as an already-completed job
+    cached = await roadmap_cache.aget(fingerprint)
+    if cached is not None:
+        logger.info("Roadmap cache hit for '%s'", request.degree)
+        await jobs.set(job_id, {"status": "completed", "result": cached.value})
+        response = {"job_id": job_id, "status": "completed", "cached": True}
+        if inline:
+            response["result"] = cached.value
+        return response
+    
+    await jobs.set(job_id, {"status": "processing"})
+    
+    # Identical requests already in flight (on any worker sharing the job store) get that job's ID
+    owner = await jobs.claim(fingerprint, job_id)
+    if owner != job_id:
+        existing = await jobs.get(owner)
+        if existing and existing.get("status") == "processing":
+            logger.info("Coalescing roadmap request for '%s' into running job %s", request.degree, owner)
+            await jobs.delete(job_id)
+            return {"job_id": owner}
+        # The holder finished or vanished without releasing its claim; take over
+        await jobs.release(fingerprint, owner)
+        owner = await jobs.claim(fingerprint, job_id)
+        if owner != job_id:
+            await jobs.delete(job_id)
+            return {"job_id": owner}
+    
+    try:
+        scheduler.submit(job_id, run_generation, job_id, request, fingerprint,
+                         priority=await request_priority(request), on_drop=drop_generation)
+    except QueueFull as e:
+        logger.warning("Rejecting roadmap request for '%s': %s", request.degree, e)
+        # Failed rather than deleted, so requests that coalesced onto it meanwhile see why
+        await fail_generation(job_id, fingerprint, "Too many roadmaps were being generated, please retry later")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many roadmaps are being generated, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     return {"job_id": job_id}
 
-async def run_generation(job_id: str, request: RoadmapRequest):
+async def fail_generation(job_id: str, fingerprint: str | None, error: str):
+    # Mark the job failed and free its fingerprint, so identical requests start afresh instead of
+    # coalescing onto a job that will never finish
+    await jobs.set(job_id, {"status": "failed", "error": error})
+    if fingerprint:
+        await jobs.release(fingerprint, job_id)
+
+async def drop_generation(job_id: str, request: RoadmapRequest, fingerprint: str | None = None):
+    # Still queued when this worker shut down
+    await fail_generation(job_id, fingerprint, "The server restarted before this roadmap started, please retry")
+
+async def run_generation(job_id: str, request: RoadmapRequest, fingerprint: str | None = None):
+    # Scheduler workers outlive jobs, so scope the job ID to this run for every module's log lines
+    with correlation_scope(job_id):
+        await _run_generation(job_id, request, fingerprint)
+
+async def _run_generation(job_id: str, request: RoadmapRequest, fingerprint: str | None = None):
     # First, set the job status to processing
-    jobs[job_id] = {"status": "processing"}
+    await jobs.set(job_id, {"status": "processing"})
+    
+    async def record_progress(event, data):
+        await jobs.append_event(job_id, {"event": event, "data": data})
     
     try:
+        from main import generate_roadmap
+        
         # Call the roadmap generation function
         roadmap = await generate_roadmap(
             degree=request.degree,
             country=request.country,
             language=request.language,
             include_paid=request.include_paid,
-            preferred_language=request.preferred_language
+            preferred_language=request.preferred_language,
+            on_progress=record_progress
         )
         
         # Create a completely new dictionary to avoid reference issues
@@ -113,24 +315,32 @@ async def run_generation(job_id: str, request: RoadmapRequest):
                     if "platform" in topic and topic["platform"] == "YouTube":
                         youtube_count += 1
             
-            print(f"Final roadmap contains {youtube_count} YouTube resources")
+            logger.info("Final roadmap contains %d YouTube resources", youtube_count)
             
             # Store the safely constructed roadmap
-            jobs[job_id] = {"status": "completed", "result": safe_roadmap}
+            await jobs.set(job_id, {"status": "completed", "result": safe_roadmap})
+            if fingerprint:
+                await roadmap_cache.aset(fingerprint, safe_roadmap)
         else:
-            print("Generated roadmap is not a dictionary")
-            jobs[job_id] = {"status": "failed", "error": "Invalid roadmap structure generated"}
+            logger.error("Generated roadmap is not a dictionary")
+            await jobs.set(job_id, {"status": "failed", "error": "Invalid roadmap structure generated"})
     
+    except asyncio.CancelledError:
+        # The scheduler cancels running jobs on shutdown
+        await jobs.set(job_id, {"status": "failed", "error": "The server restarted while generating this roadmap, please retry"})
+        raise
     except Exception as e:
-        print(f"Error generating roadmap: {str(e)}")
-        traceback.print_exc()
-        jobs[job_id] = {"status": "failed", "error": str(e)}
+        logger.exception("Error generating roadmap: %s", e)
+        await jobs.set(job_id, {"status": "failed", "error": str(e)})
+    finally:
+        if fingerprint:
+            await jobs.release(fingerprint, job_id)
 
 @app.get("/roadmap/{job_id}")
 async def get_roadmap(job_id: str):
     try:
         # Get job information
-        job = jobs.get(job_id)
+        job = await jobs.get(job_id)
         if not job:
             return JSONResponse(content={"error": "Job not found"})
         
@@ -146,7 +356,150 @@ async def get_roadmap(job_id: str):
             return JSONResponse(content={"status": "failed", "error": error_msg})
             
     except Exception as e:
-        print(f"Error retrieving roadmap: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error retrieving roadmap: %s", e)
         # Always return a valid response
         return JSONResponse(content={"status": "failed", "error": "Internal server error"})
+
+@app.get("/roadmap/{job_id}/events")
+async def stream_roadmap_events(job_id: str, request: Request):
+    """
+    Server-sent events for a roadmap job, replacing polling of GET /roadmap/{job_id}.
+    
+    Emits "stage", "topics" and per-topic "topic" events as generation progresses, then a final
+    "completed" event carrying the roadmap (or "failed"). Reconnecting clients resume after the
+    Last-Event-ID they received.
+    """
+    job = await jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        last_seq = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        last_seq = 0
+    
+    async def event_stream():
+        nonlocal last_seq
+        idle = 0.0
+        while True:
+            # Read the status before the events so nothing logged before completion is missed
+            current = await jobs.get(job_id)
+            for seq, event in await jobs.get_events(job_id, after=last_seq):
+                last_seq = seq
+                idle = 0.0
+                yield format_sse(event.get("event", "message"), event.get("data", {}), seq)
+            
+            if not current:
+                yield format_sse("failed", {"status": "failed", "error": "Job not found"})
+                return
+            if current["status"] == "completed" and "result" in current:
+                yield format_sse("completed", current["result"])
+                return
+            if current["status"] != "processing":
+                error_msg = current.get("error", "Unknown error occurred")
+                yield format_sse("failed", {"status": "failed", "error": error_msg})
+                return
+            
+            if await request.is_disconnected():
+                return
+            if idle >= EVENTS_KEEPALIVE_INTERVAL:
+                # Comment line keeps proxies from closing an idle connection
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+            idle += EVENTS_POLL_INTERVAL
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters for this worker's caches."""
+    from web_scraper import search_cache
+    from topic_generator import topic_cache
+    from youtube_api import youtube_cache
+    return {"caches": [roadmap_cache.stats(), search_cache.stats(), topic_cache.stats(), youtube_cache.stats(),
+                       conversations.stats()]}
+
+@app.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Queue depth, running jobs and queue wait vs. run time for this worker."""
+    return scheduler.stats()
+
+@app.get("/llm/stats")
+async def get_llm_stats():
+    """Gemini call counts, retries, rate-limit waits and latency percentiles for this worker."""
+    import llm_client
+    return llm_client.stats()
+
+@app.get("/youtube/quota")
+async def get_youtube_quota():
+    """Remaining YouTube Data API budget and the degradation mode it implies."""
+    from youtube_api import quota
+    return await quota.asnapshot()
+
+async def collect_stats_metrics():
+    """Render the cache, scheduler, Gemini and YouTube quota stats as Prometheus metric families."""
+    render = telemetry.render_metric
+    families = []
+
+    # Only report on modules this worker has loaded; scraping /metrics must not import the roadmap stack
+    caches = [roadmap_cache, conversations, *loaded_stage_caches()]
+    cache_stats = [cache.stats() for cache in caches]
+    for field in ("hits", "stale_hits", "misses", "writes", "evictions", "errors"):
+        families.append(render(
+            f"cache_{field}_total", "counter", f"Cache {field.replace('_', ' ')} in this worker.",
+            [({"cache": stats["name"]}, stats[field]) for stats in cache_stats if field in stats],
+        ))
+    conversation_stats = conversations.stats()
+    families.append(render("conversation_cache_bytes", "gauge", "JSON size of the conversations held in this worker.",
+                           [({}, conversation_stats["cached_bytes"])]))
+    families.append(render("conversation_cache_entries", "gauge", "Conversations held in this worker.",
+                           [({}, conversation_stats["cached_conversations"])]))
+
+    stats = scheduler.stats()
+    families.append(render("scheduler_running_jobs", "gauge", "Roadmap jobs running in this worker.",
+                           [({}, stats["running"])]))
+    families.append(render("scheduler_queued_jobs", "gauge", "Roadmap jobs waiting in this worker's queue.",
+                           [({"priority": name}, count) for name, count in stats["queued_by_priority"].items()]
+                           or [({}, stats["queued"])]))
+    families.append(render("scheduler_jobs_total", "counter", "Roadmap jobs by what became of them.",
+                           [({"result": key}, stats[key]) for key in ("submitted", "rejected", "completed", "failed", "dropped")]))
+    for phase, doing in (("wait", "waiting in the queue"), ("run", "running")):
+        families.append(render(f"scheduler_job_{phase}_seconds_total", "counter", f"Total time roadmap jobs spent {doing}.",
+                               [({}, stats[phase]["total_seconds"])]))
+        families.append(render(f"scheduler_job_{phase}_seconds_max", "gauge", f"Longest time a roadmap job spent {doing}.",
+                               [({}, stats[phase]["max_seconds"])]))
+
+    if "llm_client" in sys.modules:
+        llm_stats = sys.modules["llm_client"].stats()
+        for name, field, help in (
+            ("llm_calls_total", "calls", "Gemini calls, including failed ones."),
+            ("llm_errors_total", "errors", "Gemini calls that failed after retries."),
+            ("llm_retries_total", "retries", "Gemini call retries."),
+            ("llm_throttled_seconds_total", "throttled_seconds", "Seconds spent waiting on client-side rate limits."),
+            ("llm_prompt_tokens_total", "prompt_tokens", "Gemini prompt tokens."),
+            ("llm_output_tokens_total", "output_tokens", "Gemini output tokens."),
+            ("llm_cancelled_total", "cancelled", "Streamed Gemini calls stopped early, e.g. by a client disconnect."),
+        ):
+            families.append(render(name, "counter", help,
+                                   [({"model": model}, values[field]) for model, values in llm_stats.items()]))
+
+    if "youtube_api" in sys.modules:
+        quota = await sys.modules["youtube_api"].quota.asnapshot()
+        families.append(render("youtube_quota_remaining_units", "gauge", "YouTube Data API units left today.",
+                               [({"key_id": key["key_id"]}, key["remaining"]) for key in quota["keys"]]))
+        families.append(render("youtube_quota_mode", "gauge", "Current YouTube degradation mode (1 = active).",
+                               [({"mode": quota["mode"]}, 1)]))
+    return families
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics for this worker: pipeline stage spans plus cache, scheduler, Gemini and quota stats."""
+    return PlainTextResponse(
+        telemetry.render_prometheus(await collect_stats_metrics()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
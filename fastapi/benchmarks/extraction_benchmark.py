@@ -0,0 +1,304 @@
+"""
+Throughput and accuracy benchmark for the Class Central extraction engines.
+
+Every engine is run over the recorded search pages in benchmarks/classcentral/ (one `<topic>.md`
+page and one `<topic>.json` golden course list per topic) and scored field by field against the
+golden lists. Engines:
+
+    regex         web_scraper.extract_courses_with_regex
+    parser        classcentral_markdown.parse_topic_markdown
+    llm_single    web_scraper.extract_courses_from_markdown, Gemini path forced
+    llm_batch     web_scraper.extract_all_courses_from_markdowns, Gemini path forced
+    hybrid_batch  web_scraper.extract_all_courses_from_markdowns at the configured confidence threshold
+
+The Gemini engines run against an in-process stub that answers with the golden courses, so no
+network or API key is needed. Their accuracy measures what the pipeline around the model keeps
+or loses (prompt compaction, reference IDs, schema validation, post-processing), not the model.
+
+Usage:
+    python benchmarks/extraction_benchmark.py [--runs 20] [--llm-latency 0] [--output extraction.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "classcentral")
+
+# The stub answers instantly, so the client-side rate limits would be the only thing measured
+os.environ["GEMINI_DEFAULT_RPM"] = "1000000000"
+os.environ["GEMINI_DEFAULT_TPM"] = "1000000000"
+os.environ["GEMINI_RATE_LIMITS"] = ""
+sys.path.insert(0, SERVICE_DIR)
+
+import llm_client  # noqa: E402
+import web_scraper  # noqa: E402
+from classcentral_markdown import parse_topic_markdown  # noqa: E402
+
+# Fields scored against the golden lists; a golden course only scores the fields it lists
+SCORED_FIELDS = ["course_name", "platform", "course_type", "duration", "overview", "url", "thumbnail",
+                 "instructors", "reviews_count"]
+TOPIC_RE = re.compile(r"^\s*TOPIC:\s*(.+?)\s*$", re.MULTILINE)
+
+
+def load_fixtures(fixture_dir=FIXTURE_DIR):
+    pages = []
+    for golden_path in sorted(glob.glob(os.path.join(fixture_dir, "*.json"))):
+        with open(golden_path, encoding="utf-8") as f:
+            golden = json.load(f)
+        with open(golden_path[:-len(".json")] + ".md", encoding="utf-8") as f:
+            golden["markdown"] = f.read()
+        golden["thumbnails"] = web_scraper.find_thumbnail_urls(golden["markdown"])
+        pages.append(golden)
+    return pages
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None  # llm_client falls back to its own token estimates
+
+
+class StubModel:
+    """Stands in for GenerativeModel and answers extraction prompts with the golden courses."""
+
+    def __init__(self, stub, model_name):
+        self.stub = stub
+        self.model_name = model_name
+
+    async def generate_content_async(self, prompt, generation_config=None, **kwargs):
+        self.stub.calls += 1
+        if self.stub.latency:
+            await asyncio.sleep(self.stub.latency)
+        schema = (generation_config or {}).get("response_schema")
+        if schema is not None and "results" in schema.model_fields:
+            results = [
+                {"topic": topic, "courses": self.stub.answer(topic)}
+                for topic in TOPIC_RE.findall(prompt)
+            ]
+            return StubResponse(json.dumps({"results": results}))
+        return StubResponse(json.dumps({"courses": self.stub.answer(self.stub.topic_for(prompt))}))
+
+
+class StubGenAI:
+    """Replaces the google.generativeai module held by llm_client."""
+
+    def __init__(self, pages, latency=0.0):
+        self.golden = {page["topic"]: page["courses"] for page in pages}
+        self.latency = latency
+        self.calls = 0
+
+    def GenerativeModel(self, model_name):
+        return StubModel(self, model_name)
+
+    def topic_for(self, prompt):
+        # Single-page prompts don't name the topic; pick the page whose course titles appear in it
+        return max(self.golden, key=lambda topic: sum(c["course_name"] in prompt for c in self.golden[topic]))
+
+    def answer(self, topic):
+        # Full URLs pass through UrlRefs.restore unchanged, so the stub doesn't need the reference IDs
+        return [
+            {
+                "course_name": course["course_name"],
+                "platform": course.get("platform", "Not available"),
+                "course_type": course.get("course_type", "Not available"),
+                "duration": course.get("duration", "Not available"),
+                "overview": course.get("overview", "Not available"),
+                "url": course["url"],
+                "instructors": course.get("instructors", []),
+                "reviews_count": course.get("reviews_count", "Not available"),
+                "thumbnail": course.get("thumbnail", "Not available"),
+            }
+            for course in self.golden.get(topic, [])
+        ]
+
+
+@contextlib.contextmanager
+def confidence_threshold(value):
+    saved = web_scraper.PARSER_CONFIDENCE_THRESHOLD
+    web_scraper.PARSER_CONFIDENCE_THRESHOLD = value
+    try:
+        yield
+    finally:
+        web_scraper.PARSER_CONFIDENCE_THRESHOLD = saved
+
+
+# Each engine takes the fixture pages and returns {topic: courses}
+async def run_regex(pages):
+    return {
+        page["topic"]: web_scraper.extract_courses_with_regex(page["markdown"], page["num_courses"], page["thumbnails"])
+        for page in pages
+    }
+
+
+async def run_parser(pages):
+    return {page["topic"]: parse_topic_markdown(page["markdown"], page["num_courses"]).courses for page in pages}
+
+
+async def run_llm_single(pages):
+    with confidence_threshold(float("inf")):
+        return {
+            page["topic"]: await web_scraper.extract_courses_from_markdown(
+                page["markdown"], page["num_courses"], page["thumbnails"]
+            )
+            for page in pages
+        }
+
+
+async def run_batch(pages):
+    # The batch call takes a single course count for every topic
+    num_courses = max(page["num_courses"] for page in pages)
+    return await web_scraper.extract_all_courses_from_markdowns(
+        {page["topic"]: page["markdown"] for page in pages},
+        num_courses,
+        {page["topic"]: page["thumbnails"] for page in pages},
+    )
+
+
+async def run_llm_batch(pages):
+    with confidence_threshold(float("inf")):
+        return await run_batch(pages)
+
+
+ENGINES = {
+    "regex": run_regex,
+    "parser": run_parser,
+    "llm_single": run_llm_single,
+    "llm_batch": run_llm_batch,
+    "hybrid_batch": run_batch,
+}
+
+
+def normalize(field, value):
+    if field == "instructors":
+        return [" ".join(str(name).split()) for name in value or []]
+    value = " ".join(str(value).split())
+    if field == "reviews_count":
+        value = value.replace(",", "")
+    return value
+
+
+def score(pages, results):
+    """Field-level accuracy against the golden lists, matching courses by position."""
+    fields = {field: {"correct": 0, "total": 0} for field in SCORED_FIELDS}
+    expected_courses = returned_courses = 0
+    for page in pages:
+        returned = results.get(page["topic"]) or []
+        expected_courses += len(page["courses"])
+        returned_courses += min(len(returned), page["num_courses"])
+        for i, expected in enumerate(page["courses"]):
+            actual = returned[i] if i < len(returned) else {}
+            for field in SCORED_FIELDS:
+                if field not in expected:
+                    continue
+                fields[field]["total"] += 1
+                if field in actual and normalize(field, actual[field]) == normalize(field, expected[field]):
+                    fields[field]["correct"] += 1
+    correct = sum(counts["correct"] for counts in fields.values())
+    total = sum(counts["total"] for counts in fields.values())
+    return {
+        "courses_expected": expected_courses,
+        "courses_returned": returned_courses,
+        "overall": round(correct / total, 4) if total else 0.0,
+        "fields": {
+            field: round(counts["correct"] / counts["total"], 4) if counts["total"] else None
+            for field, counts in fields.items()
+        },
+    }
+
+
+async def bench_engine(engine, pages, runs, stub):
+    blocks = sum(len(page["courses"]) for page in pages)
+    calls_before = stub.calls
+    # One untimed pass to warm up regex caches and lazy imports, and to score
+    results = await engine(pages)
+    accuracy = score(pages, results)
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await engine(pages)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        await engine(pages)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(timings)
+    return {
+        "pages": len(pages),
+        "course_blocks": blocks,
+        "pages_per_second": round(len(pages) * runs / total, 2) if total else None,
+        "us_per_course_block": round(total / (blocks * runs) * 1e6, 2),
+        "run_ms": {
+            "min": round(min(timings) * 1000, 3),
+            "median": round(sorted(timings)[len(timings) // 2] * 1000, 3),
+            "max": round(max(timings) * 1000, 3),
+        },
+        "peak_memory_kib": round(peak / 1024, 1),
+        "llm_calls_per_run": round((stub.calls - calls_before) / (runs + 2), 2),
+        "accuracy": accuracy,
+    }
+
+
+async def run_benchmark(engines, runs, latency, fixture_dir):
+    pages = load_fixtures(fixture_dir)
+    if not pages:
+        raise SystemExit(f"No fixtures found in {fixture_dir}")
+    stub = StubGenAI(pages, latency)
+    llm_client._genai = stub
+    llm_client._models.clear()
+
+    report = {}
+    for name in engines:
+        # The engines log every step; keep stdout for the JSON report
+        with contextlib.redirect_stdout(io.StringIO()):
+            report[name] = await bench_engine(ENGINES[name], pages, runs, stub)
+    return pages, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20, help="Timed passes over the corpus per engine")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Comma-separated engines to run")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the Gemini stub waits per call")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR, help="Directory of <topic>.md pages and <topic>.json golden lists")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout")
+    args = parser.parse_args()
+
+    engines = [name.strip() for name in args.engines.split(",") if name.strip()]
+    unknown = [name for name in engines if name not in ENGINES]
+    if unknown:
+        parser.error(f"Unknown engines: {', '.join(unknown)}")
+
+    pages, results = asyncio.run(run_benchmark(engines, max(1, args.runs), args.llm_latency, args.fixtures))
+    report = {
+        "benchmark": "extraction",
+        "runs": args.runs,
+        "python": sys.version.split()[0],
+        "llm_latency_seconds": args.llm_latency,
+        "parser_confidence_threshold": web_scraper.PARSER_CONFIDENCE_THRESHOLD,
+        "fixtures": [{"topic": page["topic"], "layout": page["layout"], "courses": len(page["courses"])} for page in pages],
+        "engines": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""
+End-to-end benchmark for `main.generate_roadmap` against local stand-ins for every outside service.
+
+The parent process serves three stubs on 127.0.0.1:
+
+    Gemini        POST /v1beta/models/{model}:generateContent, answers any response schema with
+                  generated JSON after `--gemini-latency` plus `--gemini-output-tokens` at
+                  `--gemini-tokens-per-second`
+    YouTube       GET /search and /videos, charging 100 and 1 units per call against
+                  `--youtube-quota` per key and answering 403 quotaExceeded past it
+    Class Central GET /search?q=..., static HTML pages rendered from benchmarks/classcentral/
+
+Each concurrency level runs in a fresh child interpreter pointed at the stubs through
+GEMINI_API_ENDPOINT, YOUTUBE_API_BASE_URL and CLASSCENTRAL_BASE_URL, with an empty CACHE_DIR and
+a unique degree per roadmap so every run is cold. The child starts all roadmaps at once and
+reports per-roadmap latency, time to its first "topic" event, time spent in each pipeline stage and its peak RSS (browsers
+launched by crawl4ai are reported separately as child processes). Outbound calls are counted by
+the stubs.
+
+Class Central pages are fetched through crawl4ai, so scraping needs Playwright's Chromium; without
+it the pipeline falls back to placeholder courses and the report shows no Class Central pages served.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--concurrency 1,8,32,128] [--output pipeline.json]
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import html
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "classcentral")
+
+STAGES = ["topics", "resources", "assembly"]
+YOUTUBE_COSTS = {"search": 100, "videos": 1}
+TOPIC_COUNT_RE = re.compile(r"list of (\d+) key topics")
+TOPIC_RE = re.compile(r"^\s*TOPIC:\s*(.+?)\s*$", re.MULTILINE)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p * len(values)))], 3)
+
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values), 3) if values else None,
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    """A threaded HTTP server with per-route call counters."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, handler, **settings):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.reset()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+            self.spent = {}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_body(self, status, body, content_type="application/json"):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# --- Gemini -------------------------------------------------------------------------------------
+
+def fake_from_schema(schema, defs, name, prompt, index=0):
+    """Build a value matching a JSON Schema, with plausible content for the fields the app reads."""
+    if "$ref" in schema:
+        schema = defs[schema["$ref"].split("/")[-1]]
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            key: fake_from_schema(value, defs, key, prompt, index)
+            for key, value in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        if name == "topics":
+            match = TOPIC_COUNT_RE.search(prompt)
+            digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:6]
+            return [f"Benchmark Topic {digest} {i + 1}" for i in range(int(match.group(1)) if match else 6)]
+        if name == "results":
+            return [
+                {"topic": topic, "courses": fake_from_schema(schema["items"], defs, "", prompt)["courses"]}
+                for topic in TOPIC_RE.findall(prompt)
+            ]
+        if name == "selected_resources":
+            return [0, 1, 2, 3]
+        if name == "instructors":
+            return []
+        return [fake_from_schema(schema["items"], defs, name, prompt, i) for i in range(5)]
+    if kind == "integer":
+        return index
+    if kind == "number":
+        return 4.5
+    if kind == "boolean":
+        return True
+    if name == "url":
+        return f"https://www.classcentral.com/course/benchmark-{index + 1}"
+    if name == "thumbnail":
+        return f"https://d3f1iyfxxz8i1e.cloudfront.net/courses/course_image/benchmark-{index + 1}.jpg"
+    if name == "reviews_count":
+        return str(10 * (index + 1))
+    return f"Benchmark {name.replace('_', ' ')} {index + 1}"
+
+
+class GeminiHandler(StubHandler):
+    def do_POST(self):
+        model = self.path.split("/models/", 1)[-1].split(":", 1)[0]
+        self.server.count(model)
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        settings = self.server.settings
+        time.sleep(settings["latency"] + settings["output_tokens"] / settings["tokens_per_second"])
+
+        prompt = "\n".join(
+            part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", [])
+        )
+        schema = request.get("generationConfig", {}).get("responseJsonSchema")
+        if schema:
+            text = json.dumps(fake_from_schema(schema, schema.get("$defs", {}), "", prompt))
+        else:
+            text = ("benchmark " * settings["output_tokens"])[: settings["output_tokens"] * 4]
+        self.send_body(200, json.dumps({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4 + 1,
+                "candidatesTokenCount": settings["output_tokens"],
+            },
+        }))
+
+
+# --- YouTube ------------------------------------------------------------------------------------
+
+class YouTubeHandler(StubHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        resource_name = url.path.strip("/").split("/")[-1]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        settings = self.server.settings
+        cost = YOUTUBE_COSTS.get(resource_name)
+        if cost is None:
+            self.server.count("not_found")
+            return self.send_body(404, json.dumps({"error": {"code": 404, "message": "Not found"}}))
+
+        key = params.get("key", "")
+        with self.server.lock:
+            spent = self.server.spent.get(key, 0)
+            allowed = spent + cost <= settings["quota"]
+            if allowed:
+                self.server.spent[key] = spent + cost
+        if not allowed:
+            self.server.count("quota_exceeded")
+            return self.send_body(403, json.dumps({"error": {
+                "code": 403,
+                "message": "The request cannot be completed because you have exceeded your quota.",
+                "errors": [{"reason": "quotaExceeded", "domain": "youtube.quota"}],
+            }}))
+
+        self.server.count(resource_name)
+        time.sleep(settings["latency"])
+        if resource_name == "search":
+            body = self.search(params)
+        else:
+            body = self.videos(params)
+        self.send_body(200, json.dumps(body))
+
+    @staticmethod
+    def search(params):
+        query = params.get("q", "")
+        digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:8]
+        items = []
+        for i in range(int(params.get("maxResults", 10))):
+            snippet = {
+                "title": f"{query} tutorial {i + 1}",
+                "description": f"Learn {query} in this benchmark video.",
+                "thumbnails": {"default": {"url": f"https://i.ytimg.com/vi/{digest}{i}/default.jpg"}},
+            }
+            if i == 0:
+                items.append({"id": {"kind": "youtube#playlist", "playlistId": f"PL{digest}"}, "snippet": snippet})
+            else:
+                items.append({"id": {"kind": "youtube#video", "videoId": f"{digest}{i}"}, "snippet": snippet})
+        return {"items": items}
+
+    @staticmethod
+    def videos(params):
+        items = []
+        for i, video_id in enumerate(filter(None, params.get("id", "").split(","))):
+            items.append({
+                "id": video_id,
+                "contentDetails": {"duration": f"PT{10 + i}M{i}S"},
+                "statistics": {"viewCount": str(5000 * (i + 1))},
+            })
+        return {"items": items}
+
+
+# --- Class Central ------------------------------------------------------------------------------
+
+def render_listing(course):
+    escape = html.escape
+    url = escape(course["url"])
+    parts = [f'<li class="course-list-course"><a href="{url}">']
+    if course.get("thumbnail"):
+        parts.append(f'<img src="{escape(course["thumbnail"])}" alt="{escape(course["course_name"])}">')
+    parts.append("</a>")
+    if course.get("instructors"):
+        slug = course["instructors"][0].lower().replace(" ", "-")
+        parts.append(f'<a href="https://www.classcentral.com/institution/{escape(slug)}">{escape(course["instructors"][0])}</a>')
+    parts.append(f'<h2><a href="{url}">{escape(course["course_name"])}</a></h2>')
+    if course.get("reviews_count"):
+        parts.append(f'<a href="{url}#reviews">{escape(course["reviews_count"])} reviews</a>')
+    if course.get("overview"):
+        parts.append(f'<p><a href="{url}">{escape(course["overview"])}</a></p>')
+    parts.append("<button>Add to list</button><ul>")
+    if course.get("platform"):
+        slug = course["platform"].lower().replace(" ", "")
+        parts.append(f'<li><a href="https://www.classcentral.com/provider/{escape(slug)}">{escape(course["platform"])}</a></li>')
+    for field in ("duration", "course_type"):
+        if course.get(field):
+            parts.append(f"<li>{escape(course[field])}</li>")
+    parts.append("</ul></li>")
+    return "".join(parts)
+
+
+def render_search_page(query, courses):
+    listings = "".join(render_listing(course) for course in courses)
+    return (
+        f"<!DOCTYPE html><html><head><title>{html.escape(query)} courses | Class Central</title></head><body>"
+        f"<nav><a href='/'>Class Central</a> <a href='/subjects'>Subjects</a></nav>"
+        f"<h1>{html.escape(query)} Courses</h1>"
+        f"<div>Show {len(courses)} courses <a href='?'>Clear Filters</a></div>"
+        f"<ol>{listings}</ol>"
+        f"<footer>Class Central is learner-supported.</footer></body></html>"
+    )
+
+
+class ClassCentralHandler(StubHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/search":
+            self.server.count("not_found")
+            return self.send_body(404, "Not found", "text/plain")
+        self.server.count("search")
+        time.sleep(self.server.settings["latency"])
+        query = parse_qs(url.query).get("q", [""])[0]
+        pages = self.server.settings["pages"]
+        courses = pages[int(hashlib.sha1(query.encode("utf-8")).hexdigest(), 16) % len(pages)]
+        self.send_body(200, render_search_page(query, courses), "text/html; charset=utf-8")
+
+
+def load_course_pages(fixture_dir=FIXTURE_DIR):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(fixture_dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append(json.load(f)["courses"])
+    return pages
+
+
+# --- Child: runs one concurrency level ----------------------------------------------------------
+
+async def run_roadmaps(concurrency, label):
+    from main import generate_roadmap
+    from browser_pool import stop_browser_pool
+    from youtube_api import close_client as close_youtube_client
+    import llm_client
+
+    async def one(index):
+        started = time.perf_counter()
+        marks = []
+        topic_times = []
+
+        async def on_progress(event, data):
+            if event == "stage":
+                marks.append((data["stage"], time.perf_counter()))
+            elif event == "topic":
+                topic_times.append(time.perf_counter() - started)
+
+        error = None
+        try:
+            await generate_roadmap(f"Benchmark Role {label} {index}", on_progress=on_progress)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finished = time.perf_counter()
+        stages = {}
+        for (stage, at), (_, next_at) in zip(marks, marks[1:] + [(None, finished)]):
+            stages[stage] = next_at - at
+        return {
+            "latency": finished - started,
+            "first_topic": topic_times[0] if topic_times else None,
+            "stages": stages,
+            "error": error,
+        }
+
+    started = time.perf_counter()
+    try:
+        runs = await asyncio.gather(*(one(i) for i in range(concurrency)))
+    finally:
+        await stop_browser_pool()
+        await close_youtube_client()
+        await llm_client.close_client()
+    return runs, time.perf_counter() - started
+
+
+def child_main(concurrency, label):
+    import contextlib
+    import io
+
+    # The pipeline logs every step; keep stdout for the result line
+    with contextlib.redirect_stdout(io.StringIO()):
+        runs, wall = asyncio.run(run_roadmaps(concurrency, label))
+    print(json.dumps({
+        "runs": runs,
+        "wall_seconds": wall,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_child_rss_mib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+# --- Parent: stubs and sweep --------------------------------------------------------------------
+
+def run_level(args, concurrency, stubs):
+    for stub in stubs.values():
+        stub.reset()
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-") as cache_dir:
+        env = dict(os.environ)
+        env.update({
+            "GEMINI_API_ENDPOINT": stubs["gemini"].url,
+            "GEMINI_API_KEY": "benchmark",
+            "GEMINI_DEFAULT_RPM": str(args.gemini_rpm),
+            "GEMINI_DEFAULT_TPM": str(args.gemini_tpm),
+            "GEMINI_RATE_LIMITS": "",
+            "YOUTUBE_API_BASE_URL": stubs["youtube"].url,
+            "YOUTUBE_API_KEYS": "benchmark-key",
+            "YOUTUBE_DAILY_QUOTA": str(args.youtube_quota),
+            "CLASSCENTRAL_BASE_URL": stubs["classcentral"].url,
+            "CACHE_DIR": cache_dir,
+            "CACHE_DB_PATH": os.path.join(cache_dir, "cache.sqlite3"),
+            "NO_PROXY": "127.0.0.1,localhost",
+            "no_proxy": "127.0.0.1,localhost",
+        })
+        completed = subprocess.run(
+            [args.python, os.path.abspath(__file__), "--child", str(concurrency), "--label", f"c{concurrency}"],
+            cwd=SERVICE_DIR, env=env, capture_output=True, text=True, timeout=args.timeout,
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark run at concurrency {concurrency} failed:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    runs = result["runs"]
+    calls = {name: dict(sorted(stub.counts.items())) for name, stub in stubs.items()}
+    total_calls = sum(sum(counts.values()) for counts in calls.values())
+    return {
+        "concurrency": concurrency,
+        "wall_seconds": round(result["wall_seconds"], 3),
+        "roadmaps_per_second": round(concurrency / result["wall_seconds"], 3),
+        "errors": sum(1 for run in runs if run["error"]),
+        "latency_seconds": summarize([run["latency"] for run in runs]),
+        "first_topic_seconds": summarize([run["first_topic"] for run in runs if run["first_topic"] is not None]),
+        "stages_seconds": {
+            stage: summarize([run["stages"][stage] for run in runs if stage in run["stages"]])
+            for stage in STAGES
+        },
+        "peak_rss_mib": round(result["peak_rss_mib"], 1),
+        "peak_child_rss_mib": round(result["peak_child_rss_mib"], 1),
+        "outbound_calls": calls,
+        "outbound_calls_per_roadmap": round(total_calls / concurrency, 2),
+        "youtube_units_spent": sum(stubs["youtube"].spent.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32,128", help="Comma-separated numbers of simultaneous roadmaps")
+    parser.add_argument("--gemini-latency", type=float, default=0.4, help="Seconds before the Gemini stub starts answering")
+    parser.add_argument("--gemini-output-tokens", type=int, default=300, help="Output tokens reported per Gemini call")
+    parser.add_argument("--gemini-tokens-per-second", type=float, default=600, help="Simulated Gemini generation speed")
+    parser.add_argument("--gemini-rpm", type=int, default=100000, help="Client-side Gemini requests per minute")
+    parser.add_argument("--gemini-tpm", type=int, default=100000000, help="Client-side Gemini tokens per minute")
+    parser.add_argument("--youtube-latency", type=float, default=0.05, help="Seconds per YouTube stub call")
+    parser.add_argument("--youtube-quota", type=int, default=10000, help="YouTube units per key for each level")
+    parser.add_argument("--classcentral-latency", type=float, default=0.2, help="Seconds per Class Central page")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to run the pipeline with")
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds allowed per concurrency level")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--label", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, SERVICE_DIR)
+        child_main(args.child, args.label)
+        return
+
+    stubs = {
+        "gemini": StubServer(
+            GeminiHandler,
+            latency=args.gemini_latency,
+            output_tokens=args.gemini_output_tokens,
+            tokens_per_second=args.gemini_tokens_per_second,
+        ).start(),
+        "youtube": StubServer(YouTubeHandler, latency=args.youtube_latency, quota=args.youtube_quota).start(),
+        "classcentral": StubServer(
+            ClassCentralHandler, latency=args.classcentral_latency, pages=load_course_pages()
+        ).start(),
+    }
+    try:
+        levels = [run_level(args, int(level), stubs) for level in args.concurrency.split(",") if level.strip()]
+    finally:
+        for stub in stubs.values():
+            stub.shutdown()
+
+    report = {
+        "benchmark": "pipeline",
+        "python": sys.version.split()[0],
+        "stubs": {
+            "gemini_latency_seconds": args.gemini_latency,
+            "gemini_output_tokens": args.gemini_output_tokens,
+            "gemini_tokens_per_second": args.gemini_tokens_per_second,
+            "youtube_latency_seconds": args.youtube_latency,
+            "youtube_quota": args.youtube_quota,
+            "classcentral_latency_seconds": args.classcentral_latency,
+        },
+        "levels": levels,
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Startup-time benchmark for the FastAPI service.
+
+Each run starts a fresh interpreter, imports `api`, and serves one request in-process, so the numbers
+reflect what a new gunicorn worker or Cloud Run instance pays before it can answer traffic. The
+child process is given unroutable proxy settings, so any accidental network access at import time
+shows up as a failure instead of a silent delay.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 10] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should only be loaded once a roadmap is actually generated
+HEAVY_MODULES = [
+    "crawl4ai",
+    "playwright",
+    "google.generativeai",
+    "googleapiclient",
+    "pycountry",
+    "main",
+    "web_scraper",
+    "youtube_api",
+    "topic_generator",
+]
+
+# Runs in the child interpreter; argv[1] is the JSON list of heavy modules to look for
+CHILD_SCRIPT = r"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+
+async def first_request():
+    import httpx
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get("/health")
+        return response.status_code
+
+status = asyncio.run(first_request())
+served = time.perf_counter()
+# Log lines are written from a background thread; flush them so they can't interleave with the result line
+import log_config
+log_config.stop_logging()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (served - start) * 1000,
+    "status": status,
+    "heavy_modules_loaded": [m for m in json.loads(sys.argv[1]) if m in sys.modules],
+}))
+"""
+
+
+def run_once(python):
+    env = dict(os.environ)
+    # Unroutable proxies: network use during startup fails fast instead of hiding in the timings
+    env.update({
+        "HTTP_PROXY": "http://127.0.0.1:9",
+        "HTTPS_PROXY": "http://127.0.0.1:9",
+        "NO_PROXY": "bench",
+        "PREWARM_BROWSER_POOL": "false",
+    })
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [python, "-c", CHILD_SCRIPT, json.dumps(HEAVY_MODULES)], cwd=SERVICE_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"Startup run failed:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_wall_ms"] = wall_ms
+    return result
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "min": round(values[0], 2),
+        "median": round(statistics.median(values), 2),
+        "mean": round(statistics.fmean(values), 2),
+        "max": round(values[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="Number of cold starts to measure")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to benchmark")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout")
+    args = parser.parse_args()
+
+    runs = [run_once(args.python) for _ in range(args.runs)]
+    report = {
+        "benchmark": "startup",
+        "runs": args.runs,
+        "python": subprocess.run([args.python, "--version"], capture_output=True, text=True).stdout.strip(),
+        "import_ms": summarize([run["import_ms"] for run in runs]),
+        "first_request_ms": summarize([run["first_request_ms"] for run in runs]),
+        "process_wall_ms": summarize([run["process_wall_ms"] for run in runs]),
+        "heavy_modules_loaded": sorted({m for run in runs for m in run["heavy_modules_loaded"]}),
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing (overridable per deployment)
+POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))  # Chromium instances kept warm
+MAX_CONCURRENT_PAGES = int(os.getenv("BROWSER_POOL_MAX_PAGES", "4"))  # Pages open at once across the pool
+RECYCLE_AFTER_PAGES = int(os.getenv("BROWSER_POOL_RECYCLE_AFTER", "50"))  # Restart a browser after this many pages
+PAGE_TIMEOUT = int(os.getenv("BROWSER_POOL_PAGE_TIMEOUT", "60"))  # Seconds
+
+# Resource types we never need to turn a search page into markdown
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+
+
+class _PooledCrawler:
+    """A started crawler plus the bookkeeping the pool needs to recycle it."""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.pages_served = 0
+        self.active = 0
+        self.retired = False
+
+
+class BrowserPool:
+    """
+    Process-wide pool of pre-warmed crawl4ai browsers.
+
+    Pages are handed out through `arun`, which is bounded by a semaphore so a burst of
+    roadmaps cannot open more than `max_concurrent_pages` pages at once. Each browser is
+    retired and replaced after `recycle_after` pages to keep Chromium memory in check.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_concurrent_pages=MAX_CONCURRENT_PAGES,
+                 recycle_after=RECYCLE_AFTER_PAGES, page_timeout=PAGE_TIMEOUT):
+        self.size = max(1, size)
+        self.max_concurrent_pages = max(1, max_concurrent_pages)
+        self.recycle_after = max(1, recycle_after)
+        self.page_timeout = page_timeout
+        self._slots: List[_PooledCrawler] = []
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_pages)
+        self._lock = asyncio.Lock()  # Guards the slot bookkeeping; never held while a browser starts
+        self._launches = set()  # Replacement browsers being started
+        self._started = False
+        # Imported here so that importing this module doesn't pull in crawl4ai/Playwright
+        from crawl4ai import BrowserConfig, CrawlerRunConfig
+        self._browser_config = BrowserConfig(
+            headless=True,
+            text_mode=True,  # Also disables image loading at the browser level
+            verbose=False,
+        )
+        self._run_config = CrawlerRunConfig(page_timeout=self.page_timeout * 1000)
+
+    async def start(self):
+        """Launch `size` browsers. Safe to call more than once."""
+        async with self._lock:
+            if self._started:
+                return
+            logger.info("Starting browser pool with %d browser(s), %d concurrent pages", self.size, self.max_concurrent_pages)
+            for _ in range(self.size):
+                self._slots.append(await self._launch())
+            self._started = True
+
+    async def close(self):
+        """Close every browser in the pool."""
+        async with self._lock:
+            slots, self._slots = self._slots, []
+            self._started = False
+        for slot in slots:
+            await self._close_crawler(slot)
+
+    async def arun(self, url: str, timeout: Optional[float] = None):
+        """
+        Fetch a URL on one of the pooled browsers.
+
+        Args:
+            url (str): The page to crawl.
+            timeout (float, optional): Seconds to wait for the page before giving up.
+
+        Returns:
+            The crawl4ai CrawlResult for the page.
+        """
+        if not self._started:
+            await self.start()
+
+        async with self._semaphore:
+            slot = await self._checkout()
+            try:
+                crawl = slot.crawler.arun(url=url, config=self._run_config)
+                if timeout:
+                    return await asyncio.wait_for(crawl, timeout)
+                return await crawl
+            finally:
+                await self._checkin(slot)
+
+    def stats(self):
+        """Return a snapshot of pool usage."""
+        return {
+            "browsers": len(self._slots),
+            "active_pages": sum(slot.active for slot in self._slots),
+            "pages_served": [slot.pages_served for slot in self._slots],
+            "max_concurrent_pages": self.max_concurrent_pages,
+        }
+
+    async def _launch(self):
+        from crawl4ai import AsyncWebCrawler
+        crawler = AsyncWebCrawler(config=self._browser_config)
+        crawler.crawler_strategy.set_hook("on_page_context_created", _block_heavy_resources)
+        await crawler.start()
+        return _PooledCrawler(crawler)
+
+    async def _checkout(self):
+        while True:
+            async with self._lock:
+                if self._slots:
+                    slot = min(self._slots, key=lambda s: s.active)
+                    slot.active += 1
+                    slot.pages_served += 1
+                    if slot.pages_served >= self.recycle_after:
+                        # That was its last page: take it out of rotation and start a fresh browser.
+                        # The old one closes once its open pages finish.
+                        logger.info("Recycling browser after %d pages", slot.pages_served)
+                        slot.retired = True
+                        self._slots.remove(slot)
+                        self._add_browser()
+                    return slot
+                # Every browser is being replaced; wait for a launch rather than starting one each
+                launch = next(iter(self._launches), None) or self._add_browser()
+            if await asyncio.shield(launch) is None:
+                raise RuntimeError("No browser available in the pool")
+
+    async def _checkin(self, slot):
+        async with self._lock:
+            slot.active -= 1
+            close_slot = slot.retired and slot.active == 0
+        if close_slot:
+            await self._close_crawler(slot)
+
+    def _add_browser(self) -> asyncio.Task:
+        """Launch a browser in the background and add it to the pool. Call with the lock held."""
+        async def launch():
+            try:
+                slot = await self._launch()
+            except Exception as e:
+                logger.warning("Error launching replacement browser: %s", e)
+                return None
+            async with self._lock:
+                if self._started:
+                    self._slots.append(slot)
+                    return slot
+            # The pool was closed while the browser started
+            await self._close_crawler(slot)
+            return None
+
+        task = asyncio.create_task(launch())
+        self._launches.add(task)
+        task.add_done_callback(self._launches.discard)
+        return task
+
+    async def _close_crawler(self, slot):
+        try:
+            await slot.crawler.close()
+        except Exception as e:
+            logger.warning("Error closing pooled browser: %s", e)
+
+
+async def _block_heavy_resources(page, context=None, **kwargs):
+    """crawl4ai hook: abort requests for images, fonts and CSS on every new page."""
+    async def handle_route(route):
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await page.route("**/*", handle_route)
+    return page
+
+
+_pool: Optional[BrowserPool] = None
+
+
+def get_browser_pool() -> BrowserPool:
+    """Return the process-wide browser pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool()
+    return _pool
+
+
+async def start_browser_pool():
+    """Pre-warm the shared pool (called from the app's startup hook)."""
+    await get_browser_pool().start()
+
+
+async def stop_browser_pool():
+    """Close the shared pool (called from the app's shutdown hook)."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List
+from dotenv import load_dotenv
+import llm_client
+from llm_client import FAST_MODEL, estimate_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Each chat turn sends at most CHAT_CONTEXT_TOKENS of history (estimated), summary included.
+# Messages that no longer fit are folded into a running summary stored with the conversation.
+# A fold shrinks the verbatim history to CHAT_CONTEXT_TARGET of the budget, so the next few turns
+# fit without folding again.
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "4000"))
+CHAT_CONTEXT_TARGET = float(os.getenv("CHAT_CONTEXT_TARGET", "0.6"))
+CHAT_SUMMARY_WORDS = int(os.getenv("CHAT_SUMMARY_WORDS", "250"))  # Length the summary is kept to
+CHAT_SUMMARY_MESSAGE_TOKENS = int(os.getenv("CHAT_SUMMARY_MESSAGE_TOKENS", "1500"))  # Per message folded in
+
+SUMMARY_PROMPT = """
+You keep a running summary of a conversation between a student and an educational assistant.
+Update the summary with the new messages below. Keep what later answers depend on: the student's
+goals, level and open questions, the concepts, definitions and conclusions covered, and the names
+of any code, functions or resources discussed. Leave out greetings and filler.
+Reply with the updated summary only, in at most {words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+SUMMARY_INTRO = "Summary of our conversation so far:\n"
+SUMMARY_ACK = "Understood, I'll keep that context in mind."
+
+
+def message_tokens(message: Dict) -> int:
+    return estimate_tokens(message["content"])
+
+
+def first_unsummarized(conversation: Dict) -> int:
+    """Index into `messages` of the first message the summary doesn't cover."""
+    return max(0, conversation.get("summary_upto", 0) - conversation.get("trimmed", 0))
+
+
+def window_start(conversation: Dict, budget: int) -> int:
+    """Index of the oldest message in the newest run of messages that fits in `budget` tokens."""
+    messages = conversation["messages"]
+    start = len(messages)
+    used = 0
+    while start > 0 and used + message_tokens(messages[start - 1]) <= budget:
+        start -= 1
+        used += message_tokens(messages[start])
+    # Open on a user turn so the history after the summary exchange alternates roles
+    while start < len(messages) and messages[start]["role"] != "user":
+        start += 1
+    return start
+
+
+def needs_fold(conversation: Dict, reserve: int = 0) -> bool:
+    """Whether the summary plus the unsummarized messages (plus `reserve` tokens) exceed the budget."""
+    unsummarized = conversation["messages"][first_unsummarized(conversation):]
+    used = estimate_tokens(conversation.get("summary", "")) + reserve + sum(map(message_tokens, unsummarized))
+    return used > CHAT_CONTEXT_TOKENS
+
+
+def format_message_history(messages: List[Dict]) -> List[Dict]:
+    """Format stored messages as Gemini chat turns"""
+    return [
+        # Map 'assistant' to 'model' for Gemini API
+        {"role": "model" if message["role"] == "assistant" else "user", "parts": [message["content"]]}
+        for message in messages
+    ]
+
+
+def format_for_summary(messages: List[Dict]) -> str:
+    limit = CHAT_SUMMARY_MESSAGE_TOKENS * 4  # estimate_tokens counts about four characters per token
+    lines = []
+    for message in messages:
+        speaker = "Assistant" if message["role"] == "assistant" else "Student"
+        content = message["content"]
+        if len(content) > limit:
+            content = content[:limit] + " [...]"
+        lines.append(f"{speaker}: {content}")
+    return "\n\n".join(lines)
+
+
+class ChatContext:
+    """
+    Builds token-budgeted Gemini history for conversations in a ConversationStore.
+
+    The running summary is stored on the conversation ("summary", plus "summary_upto": how many
+    messages, counted from the very first one, it covers), so every worker reuses it and each fold
+    only sends the summary and the messages that have just left the window.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._folds: Dict[str, asyncio.Task] = {}  # conversation_id -> fold in progress in this worker
+
+    async def history(self, conversation_id: str, conversation: Dict, message: str) -> List[Dict]:
+        """
+        Gemini chat history for the next turn of a conversation.
+
+        Args:
+            conversation_id (str): The conversation's ID.
+            conversation (dict): The stored conversation, without the new message.
+            message (str): The new user message, which counts against the budget.
+
+        Returns:
+            list: Turns as [{"role": "user"|"model", "parts": [str]}], the summary first if there is one.
+        """
+        reserve = estimate_tokens(message)
+        pending = self._folds.get(conversation_id)
+        if pending is not None:
+            # wait() rather than await, so a fold cancelled by `cancel` doesn't cancel this turn
+            await asyncio.wait({pending})
+            if not pending.cancelled():
+                conversation = pending.result() or conversation
+        if needs_fold(conversation, reserve):
+            conversation = await self.fold(conversation_id, conversation, reserve) or conversation
+
+        history = []
+        summary = conversation.get("summary")
+        if summary:
+            history.append({"role": "user", "parts": [SUMMARY_INTRO + summary]})
+            history.append({"role": "model", "parts": [SUMMARY_ACK]})
+        messages = conversation["messages"]
+        start = first_unsummarized(conversation)
+        if needs_fold(conversation, reserve):
+            # The fold failed; fall back to the newest messages that fit
+            start = max(start, window_start(conversation, CHAT_CONTEXT_TOKENS - reserve - estimate_tokens(summary or "")))
+        return history + format_message_history(messages[start:])
+
+    def refresh(self, conversation_id: str, conversation: Dict):
+        """After a turn is stored, fold in the background if the history has outgrown the budget."""
+        if needs_fold(conversation) and conversation_id not in self._folds:
+            self.fold(conversation_id, conversation)
+
+    def fold(self, conversation_id: str, conversation: Dict, reserve: int = 0) -> asyncio.Task:
+        """
+        Fold the messages that don't fit the target window into the summary and store it.
+
+        Returns:
+            asyncio.Task: Resolves to the updated conversation, or None if summarizing failed or the
+            conversation was reset or folded by someone else in the meantime.
+        """
+        task = asyncio.create_task(self._fold(conversation_id, conversation, reserve))
+        self._folds[conversation_id] = task
+
+        def done(_):
+            if self._folds.get(conversation_id) is task:
+                del self._folds[conversation_id]
+
+        task.add_done_callback(done)
+        return task
+
+    def cancel(self, conversation_id: str):
+        """Abandon any fold in progress for a conversation, e.g. because it is being cleared."""
+        task = self._folds.pop(conversation_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _fold(self, conversation_id: str, conversation: Dict, reserve: int):
+        summary = conversation.get("summary", "")
+        budget = int(CHAT_CONTEXT_TOKENS * CHAT_CONTEXT_TARGET) - reserve - estimate_tokens(summary)
+        first = first_unsummarized(conversation)
+        start = max(first, window_start(conversation, budget))
+        folded = conversation["messages"][first:start]
+        if not folded:
+            return conversation
+        prompt = SUMMARY_PROMPT.format(
+            words=CHAT_SUMMARY_WORDS, summary=summary or "(none yet)", messages=format_for_summary(folded)
+        )
+        try:
+            response = await llm_client.generate(prompt, FAST_MODEL)
+            # Skip the write if the conversation was reset or folded elsewhere in the meantime
+            updated = await self.store.update_if(
+                conversation_id,
+                {"created_at": conversation.get("created_at"), "summary_upto": conversation.get("summary_upto")},
+                summary=response.text.strip(),
+                summary_upto=conversation.get("trimmed", 0) + start,
+            )
+            if updated is None:
+                logger.debug("Dropped stale summary for conversation %s", conversation_id)
+            return updated
+        except Exception as e:
+            logger.warning("Error summarizing conversation %s: %s", conversation_id, e)
+            return None
@@ -0,0 +1,347 @@
+import os
+import re
+from typing import Dict, List, NamedTuple, Tuple
+from llm_client import estimate_tokens
+
+# Class Central search results arrive as crawl4ai markdown. Before it goes into an extraction
+# prompt it is cut down to the course listings themselves: navigation and "Add to list" chrome
+# are dropped, provider/institution links become plain text, and every URL we need back is
+# replaced by a short reference ID (U1, U2, ...) that is swapped back after extraction.
+
+# Used when no numbered course listings can be found in a page
+RAW_MARKDOWN_LIMIT = 12000
+# Listing descriptions are cut to this many characters
+OVERVIEW_MAX_CHARS = 300
+# Cap on a compacted listing; the last listing on a page otherwise carries the page footer with it
+BLOCK_MAX_CHARS = 1200
+
+# A course listing starts with "1. [", "2. [", ... at the beginning of a line
+COURSE_START_RE = re.compile(r"^[ \t]*\d+\.[ \t]+\[", re.MULTILINE)
+# Link text may contain one level of brackets ("Modern React with Redux [2024 Update]") or escapes
+_LINK_TEXT = r"((?:\\.|[^\[\]\\]|\[(?:\\.|[^\[\]\\])*\])*)"
+_LINK_TARGET = r"\(\s*([^\s)]+)(?:\s+\"[^\"]*\")?\s*\)"
+IMAGE_RE = re.compile(r"!\[" + _LINK_TEXT + r"\]" + _LINK_TARGET)
+LINK_RE = re.compile(r"(?<!!)\[" + _LINK_TEXT + r"\]" + _LINK_TARGET)
+CHROME_LINE_RE = re.compile(r"^\s*Add to list\s*$", re.IGNORECASE)
+# Links to these pages are labels (provider, university, instructor), not the course itself
+LABEL_URL_RE = re.compile(r"/(?:provider|institution|university|subject|instructor)/")
+
+
+class UrlRefs:
+    """Two-way mapping between URLs and the short reference IDs used in prompts."""
+
+    def __init__(self):
+        self._ids: Dict[str, str] = {}
+        self._urls: Dict[str, str] = {}
+
+    def ref(self, url: str) -> str:
+        ref_id = self._ids.get(url)
+        if ref_id is None:
+            ref_id = f"U{len(self._ids) + 1}"
+            self._ids[url] = ref_id
+            self._urls[ref_id] = url
+        return ref_id
+
+    def restore(self, value):
+        """Return the URL behind a reference ID; any other value is returned unchanged."""
+        if isinstance(value, str):
+            return self._urls.get(value.strip(), value)
+        return value
+
+    def restore_course(self, course: dict, fields=("url", "thumbnail")) -> dict:
+        for field in fields:
+            if field in course:
+                course[field] = self.restore(course[field])
+        return course
+
+
+def split_course_blocks(markdown: str) -> List[str]:
+    """Split search results markdown into one string per numbered course listing."""
+    starts = [match.start() for match in COURSE_START_RE.finditer(markdown)]
+    return [markdown[start:end] for start, end in zip(starts, starts[1:] + [len(markdown)])]
+
+
+def compact_block(block: str, refs: UrlRefs) -> str:
+    """
+    Reduce one course listing to its text, a reference to its thumbnail and a reference to its page.
+
+    Args:
+        block (str): Markdown of a single numbered listing.
+        refs (UrlRefs): Shared reference table for the prompt being built.
+
+    Returns:
+        str: The compacted listing.
+    """
+    block = IMAGE_RE.sub(lambda m: f"![{m.group(1).strip()}]({refs.ref(m.group(2))})", block)
+
+    kept_course_link = False
+
+    def replace_link(match):
+        nonlocal kept_course_link
+        text, url = match.group(1).strip(), match.group(2)
+        if not kept_course_link and not LABEL_URL_RE.search(url):
+            # The first link to the course page (usually the one wrapping the thumbnail) is kept
+            kept_course_link = True
+            return f"[{text}]({refs.ref(url)})"
+        if len(text) > OVERVIEW_MAX_CHARS:
+            text = text[:OVERVIEW_MAX_CHARS].rstrip() + "..."
+        return text
+
+    block = LINK_RE.sub(replace_link, block)
+
+    lines = []
+    for line in block.splitlines():
+        if CHROME_LINE_RE.match(line):
+            continue
+        line = " ".join(line.split())
+        if line:
+            lines.append(line)
+    return "\n".join(lines)[:BLOCK_MAX_CHARS]
+
+
+def compact_markdown(markdown: str, max_courses: int, refs: UrlRefs) -> str:
+    """
+    Compact the first `max_courses` listings of a search results page.
+
+    Pages without recognizable listings fall back to the first RAW_MARKDOWN_LIMIT characters.
+    """
+    blocks = split_course_blocks(markdown)
+    if not blocks:
+        return markdown[:RAW_MARKDOWN_LIMIT]
+    return "\n\n".join(compact_block(block, refs) for block in blocks[:max_courses])
+
+
+def compact_topic_markdowns(topic_markdowns: Dict[str, str], max_courses: int) -> Tuple[Dict[str, str], UrlRefs, dict]:
+    """
+    Compact every topic's markdown for a single extraction prompt.
+
+    Args:
+        topic_markdowns (Dict[str, str]): Topic to raw search results markdown.
+        max_courses (int): Listings to keep per topic.
+
+    Returns:
+        tuple: (topic to compacted markdown, the shared UrlRefs, a report with estimated
+        tokens before and after compaction)
+    """
+    refs = UrlRefs()
+    compacted = {topic: compact_markdown(markdown, max_courses, refs) for topic, markdown in topic_markdowns.items()}
+    tokens_before = sum(estimate_tokens(markdown[:RAW_MARKDOWN_LIMIT]) for markdown in topic_markdowns.values())
+    tokens_after = sum(estimate_tokens(markdown) for markdown in compacted.values())
+    report = {
+        "topics": len(topic_markdowns),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "reduction": round(1 - tokens_after / tokens_before, 3) if tokens_before else 0.0,
+    }
+    return compacted, refs, report
+
+
+# ---------------------------------------------------------------------------------------------
+# Deterministic parser. Listings follow a fixed layout:
+#   N. [ ![Title](thumbnail) ](course url)
+#   [ Institution ](.../institution/...) ## [Title ](course url) [ 35 reviews ](course url)
+#   [ Description ](course url)
+#   Add to list
+#       * [ Provider ](.../provider/...)
+#       * 3 hours 30 minutes
+#       * On-Demand
+#       * Free Video
+# Every line is visited once and matched against a few precompiled patterns.
+
+PARSER_CONFIDENCE_THRESHOLD = float(os.getenv("PARSER_CONFIDENCE_THRESHOLD", "0.8"))
+
+HEADER_RE = re.compile(r"^\s*\d+\.\s+\[\s*!\[" + _LINK_TEXT + r"\]" + _LINK_TARGET + r"\s*\]" + _LINK_TARGET)
+TITLE_RE = re.compile(r"##\s*\[" + _LINK_TEXT + r"\]" + _LINK_TARGET)
+INSTITUTION_RE = re.compile(r"\[\s*([^\[\]]+?)\s*\]\(\s*[^\s)]*/(?:institution|university)/[^\s)]*\s*\)")
+REVIEWS_RE = re.compile(r"\[\s*([\d,]+)\s+(?:reviews?|ratings?)(?:\s+at\s+[^\]]*?)?\s*\]", re.IGNORECASE)
+RATING_RE = re.compile(r"(\d(?:\.\d+)?)\s*(?:rating|stars?)\b", re.IGNORECASE)
+DESCRIPTION_RE = re.compile(r"^\s*\[\s*(.{30,}?)\s*\]" + _LINK_TARGET + r"\s*$")
+BULLET_RE = re.compile(r"^\s*\*\s+(.*?)\s*$")
+PROVIDER_RE = re.compile(r"^\[\s*([^\[\]]+?)\s*\]\(\s*[^\s)]*/provider/[^\s)]*(?:\s+\"[^\"]*\")?\s*\)$")
+DURATION_RE = re.compile(r"^\d+(?:\.\d+)?\s*(?:hours?|minutes?|days?|weeks?|months?)\b.*$", re.IGNORECASE)
+COURSE_TYPE_RE = re.compile(r"^(?:free|paid)\b.*$|.*\b(?:course|video|certificate|trial)$", re.IGNORECASE)
+AVAILABILITY_RE = re.compile(r"^(?:on-demand|self[- ]paced|[a-z]{3} \d{1,2}(?:st|nd|rd|th)?,? \d{4})$", re.IGNORECASE)
+LEVEL_RE = re.compile(r"\b(beginner|intermediate|advanced)\b", re.IGNORECASE)
+ESCAPE_RE = re.compile(r"\\(.)")
+
+# Fields every listing must show in place; without them a parsed page always goes to Gemini
+REQUIRED_FIELDS = ("course_name", "url")
+
+# Weight of each field in a listing's overall confidence
+FIELD_WEIGHTS = {
+    "course_name": 3,
+    "url": 3,
+    "platform": 2,
+    "course_type": 1,
+    "duration": 1,
+    "overview": 1,
+    "thumbnail": 1,
+    "reviews_count": 0.5,
+}
+
+
+class ParsedCourse(NamedTuple):
+    course: dict  # Same fields as the LLM extraction produces
+    confidence: Dict[str, float]  # Per field: 1.0 found in place, 0.5 inferred, 0.0 defaulted
+
+    @property
+    def score(self) -> float:
+        total = sum(FIELD_WEIGHTS.values())
+        return sum(weight * self.confidence.get(field, 0.0) for field, weight in FIELD_WEIGHTS.items()) / total
+
+
+def _absolute_url(url: str) -> str:
+    if url.startswith("http"):
+        return url
+    return f"https://www.classcentral.com{url}" if url.startswith("/") else f"https://www.classcentral.com/{url}"
+
+
+def _finish_course(fields: dict) -> ParsedCourse:
+    """Fill defaults for anything the listing didn't show and record how each field was obtained."""
+    course_name = fields.get("course_name", "")
+    platform = fields.get("platform")
+    if platform is None:
+        platform = "YouTube" if "youtube" in fields.get("url", "").lower() else "Class Central"
+    course_type = fields.get("course_type")
+    if course_type is None:
+        course_type = "Free Video" if platform == "YouTube" else "Not available"
+    rating_value = fields.get("rating_value", "3.5")
+    reviews_count = fields.get("reviews_count", "10")
+    course = {
+        "course_name": course_name,
+        "platform": platform,
+        "course_type": course_type,
+        "duration": fields.get("duration", "Not available"),
+        "overview": fields.get("overview", "Not available"),
+        "url": fields.get("url", "Not available"),
+        "thumbnail": fields.get("thumbnail", "Not available"),
+        "thumbnail_alt": f"{course_name} thumbnail",
+        "rating": f"{platform} Rating: {rating_value} ({reviews_count} ratings)",
+        "rating_value": rating_value,
+        "reviews_count": reviews_count,
+        "level": fields.get("level", "Not available"),
+        "instructors": fields.get("instructors", []),
+        "subject": "Not available",
+        "start_date": fields.get("start_date", "Not available"),
+    }
+    confidence = {field: 1.0 if field in fields else 0.0 for field in course}
+    confidence["thumbnail_alt"] = confidence["course_name"]
+    confidence["rating"] = confidence["rating_value"]
+    # A YouTube URL is good evidence for the platform and that the course is a free video
+    if "platform" not in fields and platform == "YouTube":
+        confidence["platform"] = 0.5
+    if "course_type" not in fields and platform == "YouTube":
+        confidence["course_type"] = 0.5
+    return ParsedCourse(course, confidence)
+
+
+def parse_courses(markdown: str, max_courses: int) -> List[ParsedCourse]:
+    """
+    Parse up to `max_courses` listings from Class Central search results in a single pass.
+
+    Args:
+        markdown (str): The course section of a search results page.
+        max_courses (int): Listings to parse.
+
+    Returns:
+        List[ParsedCourse]: Parsed courses with per-field confidence, in page order.
+    """
+    parsed = []
+    fields = None
+    for line in markdown.splitlines():
+        header = HEADER_RE.match(line)
+        if header is None and COURSE_START_RE.match(line):
+            # A numbered listing without the usual thumbnail link
+            header = False
+        if header is not None:
+            if fields is not None and fields.get("course_name"):
+                parsed.append(_finish_course(fields))
+                if len(parsed) >= max_courses:
+                    return parsed
+            fields = {}
+            if header:
+                fields["course_name"] = ESCAPE_RE.sub(r"\1", header.group(1)).strip()
+                fields["thumbnail"] = header.group(2)
+                fields["url"] = _absolute_url(header.group(3))
+            continue
+        if fields is None:
+            continue
+
+        bullet = BULLET_RE.match(line)
+        if bullet:
+            value = bullet.group(1)
+            provider = PROVIDER_RE.match(value)
+            if provider:
+                fields.setdefault("platform", provider.group(1))
+            elif DURATION_RE.match(value):
+                fields.setdefault("duration", value)
+            elif COURSE_TYPE_RE.match(value):
+                fields.setdefault("course_type", value)
+            elif AVAILABILITY_RE.match(value):
+                fields.setdefault("start_date", value)
+            continue
+
+        title = TITLE_RE.search(line)
+        if title:
+            fields["course_name"] = " ".join(title.group(1).split())
+            fields.setdefault("url", _absolute_url(title.group(2)))
+            institution = INSTITUTION_RE.search(line[:title.start()])
+            if institution:
+                fields["instructors"] = [institution.group(1)]
+            reviews = REVIEWS_RE.search(line, title.end())
+            if reviews:
+                fields["reviews_count"] = reviews.group(1).replace(",", "")
+            rating = RATING_RE.search(line, title.end())
+            if rating:
+                fields["rating_value"] = rating.group(1)
+            continue
+
+        description = DESCRIPTION_RE.match(line)
+        if description and "overview" not in fields:
+            fields["overview"] = " ".join(description.group(1).split())
+            level = LEVEL_RE.search(fields["overview"])
+            if level:
+                fields["level"] = level.group(1).capitalize()
+
+    if fields is not None and fields.get("course_name") and len(parsed) < max_courses:
+        parsed.append(_finish_course(fields))
+    return parsed
+
+
+class ParsedTopic(NamedTuple):
+    courses: List[dict]
+    confidence: float  # Mean listing score, scaled down when listings are missing
+    field_confidence: List[Dict[str, float]]  # Per-field confidence of each course, parallel to `courses`
+
+    def weak_fields(self) -> List[str]:
+        """Fields that were inferred or defaulted in at least one course."""
+        return [field for field in FIELD_WEIGHTS if any(conf.get(field, 0.0) < 1.0 for conf in self.field_confidence)]
+
+    def trusted(self, threshold: float) -> bool:
+        """Whether the courses can skip Gemini: confident enough, and every listing shows its name and URL."""
+        if not self.courses or self.confidence < threshold:
+            return False
+        return all(conf.get(field, 0.0) >= 1.0 for conf in self.field_confidence for field in REQUIRED_FIELDS)
+
+
+def parse_topic_markdown(markdown: str, num_courses: int) -> ParsedTopic:
+    """
+    Parse a topic's search results and score how far the result can be trusted.
+
+    The score is the mean listing confidence, scaled down when fewer than `num_courses`
+    listings could be parsed.
+
+    Returns:
+        ParsedTopic: The course dicts, the overall confidence between 0 and 1, and each course's
+        per-field confidence.
+    """
+    parsed = parse_courses(markdown or "", num_courses)
+    if not parsed:
+        return ParsedTopic([], 0.0, [])
+    mean_score = sum(course.score for course in parsed) / len(parsed)
+    coverage = min(1.0, len(parsed) / max(1, num_courses))
+    return ParsedTopic(
+        [course.course for course in parsed],
+        round(mean_score * coverage, 3),
+        [course.confidence for course in parsed],
+    )
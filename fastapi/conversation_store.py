@@ -0,0 +1,408 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+from dotenv import load_dotenv
+from disk_cache import CACHE_DIR, open_sqlite, unpack
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Where chatbot conversations live: sqlite:///path/to/conversations.sqlite3 (default, shared by
+# workers on one host and kept across restarts) or memory:// (single process, for development)
+CONVERSATION_STORE_URL = os.getenv(
+    "CONVERSATION_STORE_URL", "sqlite:///" + os.path.join(CACHE_DIR, "conversations.sqlite3")
+)
+
+# Conversations nobody has written to for CONVERSATION_TTL seconds are dropped
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(7 * 24 * 3600)))
+
+# Per-worker hot tier of decoded conversations, bounded by their total JSON size. With memory://
+# this is the whole store, and least recently used conversations beyond it are lost.
+CONVERSATION_CACHE_MAX_BYTES = int(os.getenv("CONVERSATION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Upper bound on one conversation's JSON size; the oldest messages are trimmed beyond it
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", str(256 * 1024)))
+
+
+def _json_bytes(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def trim_messages(conversation: dict, size: int, max_bytes: int = CONVERSATION_MAX_BYTES) -> dict:
+    """
+    Drop the oldest messages until the conversation's JSON fits in `max_bytes`, always keeping the last two.
+
+    The number of dropped messages accumulates in `trimmed`, so positions counted over the whole
+    conversation stay meaningful.
+    """
+    messages = conversation["messages"]
+    sizes = [len(_json_bytes(message)) + 1 for message in messages]
+    total = size
+    drop = 0
+    while total > max_bytes and len(messages) - drop > 2:
+        total -= sizes[drop]
+        drop += 1
+    if not drop:
+        return conversation
+    return {**conversation, "messages": messages[drop:], "trimmed": conversation.get("trimmed", 0) + drop}
+
+
+def encode_conversation(conversation: dict, max_bytes: int = CONVERSATION_MAX_BYTES) -> tuple:
+    """
+    Serialize a conversation for storage, trimming it first if it has outgrown `max_bytes`.
+
+    Returns:
+        tuple: The (possibly trimmed) conversation and its JSON encoding.
+    """
+    raw = _json_bytes(conversation)
+    if len(raw) > max_bytes:
+        conversation = trim_messages(conversation, len(raw), max_bytes)
+        raw = _json_bytes(conversation)
+    return conversation, raw
+
+
+def new_conversation(messages: List[Dict]) -> dict:
+    return {"messages": list(messages), "created_at": datetime.now().isoformat()}
+
+
+class _Cached(NamedTuple):
+    conversation: dict
+    version: int
+    size: int
+    expires_at: float
+
+
+class ConversationCache:
+    """LRU of decoded conversations, bounded by the total of their encoded sizes."""
+
+    def __init__(self, max_bytes: int = CONVERSATION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._items: "OrderedDict[str, _Cached]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, conversation_id: str) -> Optional[_Cached]:
+        item = self._items.get(conversation_id)
+        if item is None:
+            return None
+        if item.expires_at < time.time():
+            self.remove(conversation_id)
+            return None
+        self._items.move_to_end(conversation_id)
+        return item
+
+    def put(self, conversation_id: str, item: _Cached):
+        self.remove(conversation_id)
+        if item.size > self.max_bytes:
+            return
+        self._items[conversation_id] = item
+        self.bytes += item.size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.bytes -= evicted.size
+            self.evictions += 1
+
+    def remove(self, conversation_id: str):
+        item = self._items.pop(conversation_id, None)
+        if item is not None:
+            self.bytes -= item.size
+
+    def remove_expired(self) -> int:
+        now = time.time()
+        expired = [conversation_id for conversation_id, item in self._items.items() if item.expires_at < now]
+        for conversation_id in expired:
+            self.remove(conversation_id)
+        return len(expired)
+
+
+class ConversationStore:
+    """
+    Interface shared by the conversation store backends.
+
+    A conversation is a dict with "messages" ([{"role", "content"}]), "created_at" and any fields
+    set through `update`. Returned conversations are shared with the store's cache and must be
+    treated as read-only; change them through `append`, `update` or `reset`.
+    """
+
+    name = "conversations"
+
+    def __init__(self, ttl: float = CONVERSATION_TTL, cache_max_bytes: int = CONVERSATION_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self._cache = ConversationCache(cache_max_bytes)
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+    async def get(self, conversation_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def create(self, messages: List[Dict]) -> str:
+        """Start a conversation with `messages`. Returns its new ID."""
+        conversation_id = str(uuid.uuid4())
+        await self._write(conversation_id, new_conversation(messages))
+        return conversation_id
+
+    async def append(self, conversation_id: str, messages: List[Dict]) -> Optional[dict]:
+        """Add messages to a conversation. Returns the updated conversation, or None if it doesn't exist."""
+        return await self._modify(
+            conversation_id, lambda conversation: {**conversation, "messages": conversation["messages"] + messages}
+        )
+
+    async def update(self, conversation_id: str, **fields) -> Optional[dict]:
+        """Set top-level fields on a conversation. Returns the updated conversation, or None if it doesn't exist."""
+        return await self._modify(conversation_id, lambda conversation: {**conversation, **fields})
+
+    async def update_if(self, conversation_id: str, expected: dict, **fields) -> Optional[dict]:
+        """
+        Set top-level fields on a conversation only if it still has the `expected` field values.
+
+        For writes computed from an earlier read (e.g. a summary) that must not land on a
+        conversation that has since been reset or changed by someone else.
+
+        Returns:
+            dict: The updated conversation, or None if it doesn't exist or no longer matches.
+        """
+        def change(conversation):
+            if any(conversation.get(key) != value for key, value in expected.items()):
+                return None
+            return {**conversation, **fields}
+
+        return await self._modify(conversation_id, change)
+
+    async def reset(self, conversation_id: str, messages: List[Dict]):
+        """Replace a conversation's history and fields with `messages`, keeping its ID."""
+        await self._write(conversation_id, new_conversation(messages))
+
+    async def delete(self, conversation_id: str):
+        raise NotImplementedError
+
+    async def evict_expired(self) -> int:
+        """Drop idle conversations. Returns how many were removed."""
+        return self._cache.remove_expired()
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        """Hit/miss counters and hot-tier size for this worker."""
+        return {
+            "name": self.name,
+            **self._stats,
+            "evictions": self._cache.evictions,
+            "cached_conversations": len(self._cache),
+            "cached_bytes": self._cache.bytes,
+            "cache_max_bytes": self._cache.max_bytes,
+        }
+
+    async def _write(self, conversation_id: str, conversation: dict):
+        raise NotImplementedError
+
+    async def _modify(self, conversation_id: str, change) -> Optional[dict]:
+        """Apply `change` to the stored conversation; a change returning None leaves it as it is."""
+        raise NotImplementedError
+
+
+class MemoryConversationStore(ConversationStore):
+    """Per-process store; the hot tier is the only copy, so evicted conversations are gone."""
+
+    async def get(self, conversation_id):
+        item = self._cache.get(conversation_id)
+        self._stats["hits" if item else "misses"] += 1
+        return item.conversation if item else None
+
+    async def delete(self, conversation_id):
+        self._cache.remove(conversation_id)
+
+    async def _write(self, conversation_id, conversation):
+        conversation, raw = encode_conversation(conversation)
+        self._cache.put(conversation_id, _Cached(conversation, 0, len(raw), time.time() + self.ttl))
+        self._stats["writes"] += 1
+        return conversation
+
+    async def _modify(self, conversation_id, change):
+        item = self._cache.get(conversation_id)
+        if item is None:
+            return None
+        conversation = change(item.conversation)
+        if conversation is None:
+            return None
+        return await self._write(conversation_id, conversation)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Store shared by every worker on a host, using SQLite in WAL mode, with a per-worker hot tier.
+
+    Every row carries a version that each write increments. Reads check it against the hot
+    tier's copy, so a conversation another worker has written to is reloaded, while an unchanged
+    one costs only a primary-key lookup instead of reading and decompressing the blob.
+    """
+
+    def __init__(self, path, ttl=CONVERSATION_TTL, cache_max_bytes=CONVERSATION_CACHE_MAX_BYTES):
+        super().__init__(ttl, cache_max_bytes)
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            conn = open_sqlite(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "conversation_id TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, "
+                "version INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_expires_at ON conversations (expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def _load(self, conversation_id, cached_version):
+        """Read the row's version, and its data only if the cached copy is out of date."""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT version, expires_at FROM conversations WHERE conversation_id = ? AND expires_at >= ?",
+                (conversation_id, time.time()),
+            ).fetchone()
+            if row is None or row[0] == cached_version:
+                return row, None
+            data = conn.execute(
+                "SELECT data, size FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return row, data
+
+    async def get(self, conversation_id):
+        cached = self._cache.get(conversation_id)
+        try:
+            row, data = await asyncio.to_thread(self._load, conversation_id, cached.version if cached else None)
+        except Exception as e:
+            logger.warning("Error reading conversation %s: %s", conversation_id, e)
+            self._stats["errors"] += 1
+            # Better a copy that may be a turn behind than no conversation at all
+            return cached.conversation if cached else None
+        if row is None:
+            self._cache.remove(conversation_id)
+            self._stats["misses"] += 1
+            return None
+        version, expires_at = row
+        if data is None:
+            self._stats["hits"] += 1
+            return cached.conversation
+        self._stats["misses"] += 1
+        conversation = unpack(data[0])
+        self._cache.put(conversation_id, _Cached(conversation, version, data[1], expires_at))
+        return conversation
+
+    async def delete(self, conversation_id):
+        self._cache.remove(conversation_id)
+        await asyncio.to_thread(self._execute, "DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+
+    async def evict_expired(self):
+        self._cache.remove_expired()
+        return await asyncio.to_thread(
+            lambda: self._execute("DELETE FROM conversations WHERE expires_at < ?", (time.time(),)).rowcount
+        )
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    async def _write(self, conversation_id, conversation):
+        def write():
+            stored, raw = encode_conversation(conversation)
+            blob, size = zlib.compress(raw, 6), len(raw)
+            expires_at = time.time() + self.ttl
+            with self._lock:
+                # The version keeps counting up across resets so no worker's cached copy can match
+                version = self._connection().execute(
+                    "INSERT INTO conversations (conversation_id, data, size, version, expires_at) VALUES (?, ?, ?, 1, ?) "
+                    "ON CONFLICT (conversation_id) DO UPDATE SET data = excluded.data, size = excluded.size, "
+                    "version = version + 1, expires_at = excluded.expires_at RETURNING version",
+                    (conversation_id, blob, size, expires_at),
+                ).fetchone()[0]
+            return _Cached(stored, version, size, expires_at)
+
+        self._cache.put(conversation_id, await asyncio.to_thread(write))
+        self._stats["writes"] += 1
+
+    async def _modify(self, conversation_id, change):
+        cached = self._cache.get(conversation_id)
+
+        def modify():
+            now = time.time()
+            with self._lock:
+                conn = self._connection()
+                # Read-modify-write under the database's write lock, so turns from two workers both land
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT version FROM conversations WHERE conversation_id = ? AND expires_at >= ?",
+                        (conversation_id, now),
+                    ).fetchone()
+                    if row is None:
+                        conn.execute("ROLLBACK")
+                        return None
+                    if cached is not None and cached.version == row[0]:
+                        current = cached.conversation
+                    else:
+                        current = unpack(conn.execute(
+                            "SELECT data FROM conversations WHERE conversation_id = ?", (conversation_id,)
+                        ).fetchone()[0])
+                    changed = change(current)
+                    if changed is None:
+                        conn.execute("ROLLBACK")
+                        return False  # Unchanged; the hot tier's copy stays valid
+                    conversation, raw = encode_conversation(changed)
+                    blob, size = zlib.compress(raw, 6), len(raw)
+                    conn.execute(
+                        "UPDATE conversations SET data = ?, size = ?, version = ?, expires_at = ? "
+                        "WHERE conversation_id = ?",
+                        (blob, size, row[0] + 1, now + self.ttl, conversation_id),
+                    )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            return _Cached(conversation, row[0] + 1, size, now + self.ttl)
+
+        item = await asyncio.to_thread(modify)
+        if item is False:
+            return None
+        if item is None:
+            self._cache.remove(conversation_id)
+            return None
+        self._cache.put(conversation_id, item)
+        self._stats["writes"] += 1
+        return item.conversation
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def create_conversation_store(url: str = CONVERSATION_STORE_URL) -> ConversationStore:
+    """
+    Build the conversation store described by a URL.
+
+    Args:
+        url (str): 'sqlite:///path' or 'memory://'.
+
+    Returns:
+        ConversationStore: The configured backend.
+    """
+    if url.startswith("sqlite:///"):
+        return SQLiteConversationStore(url[len("sqlite:///"):])
+    if url.startswith("memory://"):
+        return MemoryConversationStore()
+    raise ValueError(f"Unsupported CONVERSATION_STORE_URL: {url}")
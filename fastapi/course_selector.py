@@ -1,26 +1,15 @@
-from google import generativeai as genai
-from dotenv import load_dotenv
-import os
-import json
+from typing import List
+from pydantic import BaseModel
+from llm_client import DEFAULT_MODEL, generate_json
+import logging
 import re
 
-load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY")
-if not API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
-genai.configure(api_key=API_KEY)
+logger = logging.getLogger(__name__)
 
-def clean_response_text(response_text):
-    response_text = response_text.strip()
-    if response_text.startswith("```json"):
-        response_text = response_text[7:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-    elif response_text.startswith("```"):
-        response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-    return response_text.strip()
+class ResourceSelection(BaseModel):
+    """Response schema for resource selection."""
+    selected_resources: List[int]
+    explanation: str
 
 def parse_rating(rating_str):
     if rating_str == "Not available":
@@ -34,7 +23,7 @@ def parse_rating(rating_str):
         return rating_value, reviews_count
     return 0, 0
 
-def select_top_four_resources(topic, resources, include_paid=True):
+async def select_top_four_resources(topic, resources, include_paid=True):
     if not include_paid:
         resources = [r for r in resources if r.get('course_type', '').lower() in ["free course", "free", "self-paced"]]
 
@@ -89,16 +78,11 @@ Resources:
             prompt += f"   Duration: {r['duration']}\n"
 
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        chat = model.start_chat(history=[])
-        response = chat.send_message(prompt)
-        response_text = response.text
-        response_text = clean_response_text(response_text)
-        response_json = json.loads(response_text)
-        selected_numbers = [int(num) for num in response_json['selected_resources']]
-        explanation = response_json['explanation']
+        result = await generate_json(prompt, ResourceSelection, DEFAULT_MODEL)
+        selected_numbers = result.selected_resources
+        explanation = result.explanation
         selected_resources = [resources[num - 1] for num in selected_numbers if 1 <= num <= len(resources)]
         return selected_resources, explanation
     except Exception as e:
-        print(f"Error in select_top_four_resources: {e}, response: {response_text if 'response_text' in locals() else 'Not available'}")
+        logger.warning("Error in select_top_four_resources: %s", e)
         return resources[:4], "Failed to select resources; defaulting to first four available."
\ No newline at end of file
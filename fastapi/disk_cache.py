@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, NamedTuple, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# All on-disk caches live in one SQLite file so every worker on the host shares them
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(CACHE_DIR, "cache.sqlite3"))
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite database in WAL mode so several gunicorn workers can read and write it at once.
+
+    Args:
+        path (str): Path of the database file; parent directories are created if needed.
+
+    Returns:
+        sqlite3.Connection: A connection in autocommit mode that may be shared across threads.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def pack(value: Any) -> bytes:
+    """Serialize a JSON-compatible value into a compressed blob."""
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def unpack(blob: bytes) -> Any:
+    """Inverse of `pack`."""
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    stored_at: float
+    fresh: bool
+
+
+class DiskCache:
+    """
+    Compressed key/value cache on top of SQLite with TTL and stale-while-revalidate windows.
+
+    An entry is fresh for `ttl` seconds after it was written and is then served as stale for a
+    further `stale_ttl` seconds, giving callers a chance to refresh it in the background.
+    With `max_entries` set, the least recently used entries are evicted beyond that size.
+
+    Async code should use `aget`/`aset`: a lookup can wait up to the busy timeout for another
+    worker's write lock, which must not stall the event loop.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0, path: str = CACHE_DB_PATH,
+                 max_entries: Optional[int] = None):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+            raise ValueError(f"Invalid cache name: {name!r}")
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = open_sqlite(self.path)
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            if self.max_entries:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_accessed_at ON {self.name} (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str, allow_stale: bool = True) -> Optional[CacheEntry]:
+        """
+        Look up a key.
+
+        Args:
+            key (str): The cache key.
+            allow_stale (bool): Whether to return entries past their TTL but inside the stale window.
+
+        Returns:
+            CacheEntry or None: The cached value with its age information, or None on a miss.
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    f"SELECT value, stored_at FROM {self.name} WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Error reading %s cache: %s", self.name, e)
+            self._stats["errors"] += 1
+            self._stats["misses"] += 1
+            return None
+
+        if row is None:
+            self._stats["misses"] += 1
+            return None
+
+        blob, stored_at = row
+        age = now - stored_at
+        if age <= self.ttl:
+            fresh = True
+        elif allow_stale and age <= self.ttl + self.stale_ttl:
+            fresh = False
+        else:
+            self._stats["misses"] += 1
+            return None
+
+        try:
+            value = unpack(blob)
+        except (zlib.error, ValueError) as e:
+            logger.warning("Dropping corrupt %s cache entry: %s", self.name, e)
+            self.delete(key)
+            self._stats["misses"] += 1
+            return None
+
+        if self.max_entries:
+            # Recency only matters when the cache is size-bounded
+            try:
+                with self._lock:
+                    self._connection().execute(
+                        f"UPDATE {self.name} SET accessed_at = ? WHERE key = ?", (now, key)
+                    )
+            except sqlite3.Error as e:
+                logger.warning("Error updating %s cache recency: %s", self.name, e)
+
+        self._stats["hits" if fresh else "stale_hits"] += 1
+        return CacheEntry(value, stored_at, fresh)
+
+    async def aget(self, key: str, allow_stale: bool = True) -> Optional[CacheEntry]:
+        """`get` on a worker thread."""
+        return await asyncio.to_thread(self.get, key, allow_stale)
+
+    async def aset(self, key: str, value: Any):
+        """`set` on a worker thread."""
+        await asyncio.to_thread(self.set, key, value)
+
+    def set(self, key: str, value: Any):
+        """Store a JSON-compatible value under `key`, replacing any previous entry."""
+        now = time.time()
+        try:
+            blob = pack(value)
+            with self._lock:
+                self._connection().execute(
+                    f"INSERT OR REPLACE INTO {self.name} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, blob, now, now),
+                )
+                if self.max_entries:
+                    evicted = self._connection().execute(
+                        f"DELETE FROM {self.name} WHERE key IN ("
+                        f"SELECT key FROM {self.name} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    ).rowcount
+                    self._stats["evictions"] += max(0, evicted)
+            self._stats["writes"] += 1
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning("Error writing %s cache: %s", self.name, e)
+            self._stats["errors"] += 1
+
+    def delete(self, key: str):
+        """Remove `key` from the cache if present."""
+        try:
+            with self._lock:
+                self._connection().execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning("Error deleting from %s cache: %s", self.name, e)
+            self._stats["errors"] += 1
+
+    def purge_expired(self) -> int:
+        """Delete entries past their stale window. Returns the number of rows removed."""
+        cutoff = time.time() - (self.ttl + self.stale_ttl)
+        try:
+            with self._lock:
+                cursor = self._connection().execute(f"DELETE FROM {self.name} WHERE stored_at < ?", (cutoff,))
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.warning("Error purging %s cache: %s", self.name, e)
+            self._stats["errors"] += 1
+            return 0
+
+    def stats(self) -> dict:
+        """Return this process's hit/miss counters for the cache."""
+        lookups = self._stats["hits"] + self._stats["stale_hits"] + self._stats["misses"]
+        hit_ratio = (self._stats["hits"] + self._stats["stale_hits"]) / lookups if lookups else 0.0
+        return {"name": self.name, **self._stats, "hit_ratio": round(hit_ratio, 4)}
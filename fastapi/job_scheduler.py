@@ -0,0 +1,176 @@
+import asyncio
+import itertools
+import logging
+import math
+import os
+import time
+from typing import Awaitable, Callable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Each roadmap pipeline drives browsers and Gemini calls, so only a few run at once per worker;
+# the rest wait in a bounded queue and anything beyond that is turned away with a 429.
+MAX_CONCURRENT_JOBS = int(os.getenv("JOB_SCHEDULER_MAX_CONCURRENT", "2"))
+MAX_QUEUED_JOBS = int(os.getenv("JOB_SCHEDULER_MAX_QUEUE", "20"))
+DEFAULT_RETRY_AFTER = int(os.getenv("JOB_SCHEDULER_RETRY_AFTER", "30"))  # Seconds, until run times are known
+
+# Priority classes; lower values are dequeued first
+PRIORITY_CHEAP = 0  # e.g. topics already cached, so no topic generation call is needed
+PRIORITY_NORMAL = 1
+PRIORITY_NAMES = {PRIORITY_CHEAP: "cheap", PRIORITY_NORMAL: "normal"}
+
+
+class QueueFull(Exception):
+    """Raised by `JobScheduler.submit` when the queue is at capacity."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Timing:
+    """Running count/total/max of a duration, in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 3),
+            "avg_seconds": round(self.mean, 3),
+            "max_seconds": round(self.max, 3),
+        }
+
+
+class JobScheduler:
+    """
+    In-process admission control for roadmap jobs.
+
+    Jobs are queued by (priority, arrival order) and run by `max_concurrent` worker tasks.
+    Time spent waiting in the queue and time spent running are tracked separately.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(1, max_queued)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers = []
+        self._order = itertools.count()
+        self._running = 0
+        self._queued_by_priority = {}
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "dropped": 0}
+        self._wait = _Timing()
+        self._run = _Timing()
+
+    def start(self):
+        """Start the worker tasks. Must be called from the running event loop; safe to call twice."""
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_queued)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)]
+
+    async def stop(self):
+        """Cancel the workers. Jobs still queued are dropped, calling their `on_drop`."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        dropped = []
+        while self._queue is not None and not self._queue.empty():
+            dropped.append(self._queue.get_nowait())
+        self._queue = None
+        self._queued_by_priority.clear()
+        for _, _, _, job_id, _, args, on_drop in dropped:
+            self._counters["dropped"] += 1
+            if on_drop is None:
+                continue
+            try:
+                await on_drop(*args)
+            except Exception as e:
+                logger.exception("Error dropping queued job %s: %s", job_id, e)
+
+    def submit(self, job_id: str, func: Callable[..., Awaitable], *args, priority: int = PRIORITY_NORMAL,
+               on_drop: Optional[Callable[..., Awaitable]] = None):
+        """
+        Queue `func(*args)` to run when a slot is free.
+
+        Args:
+            job_id (str): ID of the job, for logging.
+            func (callable): Coroutine function running the job.
+            priority (int): One of the PRIORITY_* classes.
+            on_drop (callable, optional): Coroutine function called with the same arguments instead,
+                if the scheduler stops before the job starts.
+
+        Raises:
+            QueueFull: If `max_queued` jobs are already waiting.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((priority, next(self._order), time.monotonic(), job_id, func, args, on_drop))
+        except asyncio.QueueFull:
+            self._counters["rejected"] += 1
+            raise QueueFull(self.retry_after()) from None
+        self._counters["submitted"] += 1
+        self._queued_by_priority[priority] = self._queued_by_priority.get(priority, 0) + 1
+
+    def retry_after(self) -> int:
+        """Estimate how many seconds until a queue slot frees up."""
+        if not self._run.count:
+            return DEFAULT_RETRY_AFTER
+        # With every worker busy, one job finishes (and one queued job starts) this often on average
+        return max(1, math.ceil(self._run.mean / self.max_concurrent))
+
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        """Return queue depth, concurrency and wait/run time figures for this worker."""
+        return {
+            "running": self._running,
+            "queued": self.queued(),
+            "queued_by_priority": {
+                PRIORITY_NAMES.get(priority, str(priority)): count
+                for priority, count in sorted(self._queued_by_priority.items())
+            },
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            **self._counters,
+            "wait": self._wait.snapshot(),
+            "run": self._run.snapshot(),
+        }
+
+    async def _worker(self):
+        while True:
+            priority, _, enqueued_at, job_id, func, args, _ = await self._queue.get()
+            self._queued_by_priority[priority] -= 1
+            started = time.monotonic()
+            self._wait.add(started - enqueued_at)
+            self._running += 1
+            try:
+                await func(*args)
+                self._counters["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Jobs record their own failures; this only guards the worker loop
+                logger.exception("Unhandled error in scheduled job %s: %s", job_id, e)
+                self._counters["failed"] += 1
+            finally:
+                self._running -= 1
+                self._run.add(time.monotonic() - started)
+                self._queue.task_done()
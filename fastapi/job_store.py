@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from disk_cache import CACHE_DIR, open_sqlite, pack, unpack
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Where jobs live: sqlite:///path/to/jobs.sqlite3 (default, shared by workers on one host),
+# redis://host:port/db (shared across hosts) or memory:// (single process, for development)
+JOB_STORE_URL = os.getenv("JOB_STORE_URL", "sqlite:///" + os.path.join(CACHE_DIR, "jobs.sqlite3"))
+
+# Finished jobs are kept for JOB_TTL seconds; jobs stuck in "processing" expire after JOB_PROCESSING_TTL
+JOB_TTL = float(os.getenv("JOB_TTL", str(24 * 3600)))
+JOB_PROCESSING_TTL = float(os.getenv("JOB_PROCESSING_TTL", str(2 * 3600)))
+
+# Upper bound on a single stored job, and on everything the in-memory backend may hold (compressed bytes)
+JOB_MAX_RESULT_BYTES = int(os.getenv("JOB_MAX_RESULT_BYTES", str(1024 * 1024)))
+MEMORY_JOB_STORE_MAX_BYTES = int(os.getenv("MEMORY_JOB_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def job_ttl(job: dict) -> float:
+    return JOB_PROCESSING_TTL if job.get("status") == "processing" else JOB_TTL
+
+
+def encode_job(job_id: str, job: dict) -> bytes:
+    """Compress a job for storage, replacing oversized results with a failure."""
+    blob = pack(job)
+    if len(blob) > JOB_MAX_RESULT_BYTES:
+        logger.warning("Job %s result is %d bytes compressed, over the %d byte limit", job_id, len(blob), JOB_MAX_RESULT_BYTES)
+        blob = pack({"status": "failed", "error": "Generated roadmap was too large to store"})
+    return blob
+
+
+class JobStore:
+    """Interface shared by the job store backends. All values are JSON-compatible dicts."""
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def set(self, job_id: str, job: dict):
+        raise NotImplementedError
+
+    async def delete(self, job_id: str):
+        raise NotImplementedError
+
+    async def evict_expired(self) -> int:
+        """Drop expired jobs. Returns how many were removed."""
+        return 0
+
+    async def claim(self, key: str, job_id: str, ttl: float = JOB_PROCESSING_TTL) -> str:
+        """
+        Atomically register `job_id` as the in-flight job for `key` unless another job holds it.
+
+        Returns:
+            str: The job ID that owns the key: `job_id` if the claim succeeded, otherwise the holder's.
+        """
+        raise NotImplementedError
+
+    async def release(self, key: str, job_id: str):
+        """Remove the in-flight claim on `key` if `job_id` still holds it."""
+        raise NotImplementedError
+
+    async def append_event(self, job_id: str, event: dict) -> int:
+        """
+        Append a progress event to a job's event log.
+
+        Returns:
+            int: The event's sequence number, starting at 1 for each job.
+        """
+        raise NotImplementedError
+
+    async def get_events(self, job_id: str, after: int = 0) -> List[Tuple[int, dict]]:
+        """Return `(sequence, event)` pairs logged for a job after sequence number `after`."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """Per-process store, bounded by total compressed size; oldest jobs are evicted first."""
+
+    def __init__(self, max_bytes=MEMORY_JOB_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._jobs = OrderedDict()  # job_id -> (blob, expires_at)
+        self._bytes = 0
+        self._claims = {}  # key -> (job_id, expires_at)
+        self._events = {}  # job_id -> [event, ...], dropped together with the job
+
+    async def get(self, job_id):
+        item = self._jobs.get(job_id)
+        if item is None:
+            return None
+        blob, expires_at = item
+        if expires_at < time.time():
+            self._drop_job(job_id)
+            return None
+        return unpack(blob)
+
+    async def set(self, job_id, job):
+        blob = encode_job(job_id, job)
+        self._remove(job_id)
+        self._jobs[job_id] = (blob, time.time() + job_ttl(job))
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes and len(self._jobs) > 1:
+            oldest = next(iter(self._jobs))
+            self._drop_job(oldest)
+
+    async def delete(self, job_id):
+        self._drop_job(job_id)
+
+    async def evict_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, (_, expires_at) in self._jobs.items() if expires_at < now]
+        for job_id in expired:
+            self._drop_job(job_id)
+        return len(expired)
+
+    async def claim(self, key, job_id, ttl=JOB_PROCESSING_TTL):
+        holder = self._claims.get(key)
+        if holder is None or holder[1] < time.time():
+            self._claims[key] = (job_id, time.time() + ttl)
+            return job_id
+        return holder[0]
+
+    async def release(self, key, job_id):
+        holder = self._claims.get(key)
+        if holder is not None and holder[0] == job_id:
+            del self._claims[key]
+
+    async def append_event(self, job_id, event):
+        events = self._events.setdefault(job_id, [])
+        events.append(event)
+        return len(events)
+
+    async def get_events(self, job_id, after=0):
+        events = self._events.get(job_id, [])
+        return list(enumerate(events, 1))[after:]
+
+    def _remove(self, job_id):
+        # Drops only the job blob: `set` replaces it on every status write and the events must survive that.
+        item = self._jobs.pop(job_id, None)
+        if item is not None:
+            self._bytes -= len(item[0])
+
+    def _drop_job(self, job_id):
+        self._remove(job_id)
+        self._events.pop(job_id, None)
+
+
+class SQLiteJobStore(JobStore):
+    """Store shared by every worker on a host, using SQLite in WAL mode."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            conn = open_sqlite(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_claims ("
+                "key TEXT PRIMARY KEY, job_id TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "job_id TEXT NOT NULL, seq INTEGER NOT NULL, data BLOB NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (job_id, seq))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    async def get(self, job_id):
+        rows = await asyncio.to_thread(
+            self._execute, "SELECT data FROM jobs WHERE job_id = ? AND expires_at >= ?", (job_id, time.time())
+        )
+        return unpack(rows[0][0]) if rows else None
+
+    async def set(self, job_id, job):
+        now = time.time()
+        blob = encode_job(job_id, job)
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO jobs (job_id, data, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+            (job_id, blob, now, now + job_ttl(job)),
+        )
+
+    async def delete(self, job_id):
+        def delete_job():
+            with self._lock:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                    conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        await asyncio.to_thread(delete_job)
+
+    async def evict_expired(self):
+        def delete_expired():
+            now = time.time()
+            with self._lock:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute("DELETE FROM job_claims WHERE expires_at < ?", (now,))
+                    removed = conn.execute("DELETE FROM jobs WHERE expires_at < ?", (now,)).rowcount
+                    # Events go with their job, including jobs that expired before their events would
+                    conn.execute(
+                        "DELETE FROM job_events WHERE expires_at < ? OR job_id NOT IN (SELECT job_id FROM jobs)",
+                        (now,),
+                    )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            return removed
+        return await asyncio.to_thread(delete_expired)
+
+    async def claim(self, key, job_id, ttl=JOB_PROCESSING_TTL):
+        def claim_key():
+            now = time.time()
+            with self._lock:
+                conn = self._connection()
+                conn.execute("DELETE FROM job_claims WHERE key = ? AND expires_at < ?", (key, now))
+                # INSERT OR IGNORE makes the first writer win, even across workers
+                conn.execute(
+                    "INSERT OR IGNORE INTO job_claims (key, job_id, expires_at) VALUES (?, ?, ?)",
+                    (key, job_id, now + ttl),
+                )
+                row = conn.execute("SELECT job_id FROM job_claims WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else job_id
+        return await asyncio.to_thread(claim_key)
+
+    async def release(self, key, job_id):
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM job_claims WHERE key = ? AND job_id = ?", (key, job_id)
+        )
+
+    async def append_event(self, job_id, event):
+        # The sequence number is computed inside the INSERT so concurrent writers can't collide
+        rows = await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO job_events (job_id, seq, data, expires_at) "
+            "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM job_events WHERE job_id = ? RETURNING seq",
+            (job_id, pack(event), time.time() + JOB_TTL, job_id),
+        )
+        return rows[0][0]
+
+    async def get_events(self, job_id, after=0):
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after),
+        )
+        return [(seq, unpack(data)) for seq, data in rows]
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class RedisJobStore(JobStore):
+    """Store shared across hosts through any Redis-compatible server; expiry uses native key TTLs."""
+
+    def __init__(self, url, prefix="roadmap:job:", claim_prefix="roadmap:inflight:", events_prefix="roadmap:events:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("The redis package is required for a redis:// JOB_STORE_URL") from e
+        self.prefix = prefix
+        self.claim_prefix = claim_prefix
+        self.events_prefix = events_prefix
+        self._redis = redis.from_url(url)
+
+    async def get(self, job_id):
+        blob = await self._redis.get(self.prefix + job_id)
+        return unpack(blob) if blob is not None else None
+
+    async def set(self, job_id, job):
+        await self._redis.set(self.prefix + job_id, encode_job(job_id, job), ex=int(job_ttl(job)))
+
+    async def delete(self, job_id):
+        await self._redis.delete(self.prefix + job_id, self.events_prefix + job_id)
+
+    async def claim(self, key, job_id, ttl=JOB_PROCESSING_TTL):
+        if await self._redis.set(self.claim_prefix + key, job_id, nx=True, ex=int(ttl)):
+            return job_id
+        holder = await self._redis.get(self.claim_prefix + key)
+        if holder is None:
+            # The claim expired between the two calls; try once more
+            if await self._redis.set(self.claim_prefix + key, job_id, nx=True, ex=int(ttl)):
+                return job_id
+            holder = await self._redis.get(self.claim_prefix + key)
+        return holder.decode("utf-8") if holder is not None else job_id
+
+    async def release(self, key, job_id):
+        holder = await self._redis.get(self.claim_prefix + key)
+        if holder is not None and holder.decode("utf-8") == job_id:
+            await self._redis.delete(self.claim_prefix + key)
+
+    async def append_event(self, job_id, event):
+        key = self.events_prefix + job_id
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, pack(event))
+            pipe.expire(key, int(JOB_TTL))
+            seq, _ = await pipe.execute()
+        return seq
+
+    async def get_events(self, job_id, after=0):
+        blobs = await self._redis.lrange(self.events_prefix + job_id, after, -1)
+        return [(after + i, unpack(blob)) for i, blob in enumerate(blobs, 1)]
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_job_store(url: str = JOB_STORE_URL) -> JobStore:
+    """
+    Build the job store described by a URL.
+
+    Args:
+        url (str): 'sqlite:///path', 'redis://...', 'rediss://...' or 'memory://'.
+
+    Returns:
+        JobStore: The configured backend.
+    """
+    if url.startswith("sqlite:///"):
+        return SQLiteJobStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisJobStore(url)
+    if url.startswith("memory://"):
+        return MemoryJobStore()
+    raise ValueError(f"Unsupported JOB_STORE_URL: {url}")
@@ -0,0 +1,556 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, NamedTuple
+from dotenv import load_dotenv
+import telemetry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# google.generativeai is imported and configured on first use so importing the app stays fast
+# and works without network access. The SDK holds a single global configuration, so one key
+# serves every module: GEMINI_API_KEY, falling back to the chatbot's OUR_KEY.
+_genai = None
+_lock = threading.Lock()
+
+# Model names used across the app
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")  # Extraction, selection and chat
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.0-flash")  # Short structured prompts
+
+# Client-side rate limits, per worker process. GEMINI_RATE_LIMITS overrides them per model as
+# "model=rpm/tpm,..." (e.g. "gemini-1.5-pro=150/2000000"); other models use the defaults.
+DEFAULT_RPM = int(os.getenv("GEMINI_DEFAULT_RPM", "60"))
+DEFAULT_TPM = int(os.getenv("GEMINI_DEFAULT_TPM", "1000000"))
+RATE_LIMITS = os.getenv("GEMINI_RATE_LIMITS", "")
+
+# Retries for rate limiting and server errors, with full-jitter exponential backoff
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1"))  # Seconds
+RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "20"))  # Seconds
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Latencies kept per model for the percentiles in `stats()`
+LATENCY_WINDOW = int(os.getenv("GEMINI_LATENCY_WINDOW", "500"))
+
+# Optional base URL of a Gemini-compatible REST API (e.g. a local stand-in for benchmarks).
+# When set, calls are made with httpx instead of the SDK, whose async client can't use REST.
+API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "").rstrip("/")
+HTTP_TIMEOUT = float(os.getenv("GEMINI_HTTP_TIMEOUT", "120"))  # Seconds
+_http_client = None
+
+
+def get_api_key():
+    return os.getenv("GEMINI_API_KEY") or os.getenv("OUR_KEY")
+
+
+class GeminiHTTPError(Exception):
+    """A non-200 response from the REST endpoint; `code` matches the SDK's API errors."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"Gemini API error {code}: {message}")
+        self.code = code
+
+
+def get_genai():
+    """
+    Return the configured google.generativeai module, importing it on first use.
+
+    Raises:
+        ValueError: If no Gemini API key is configured.
+    """
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                api_key = get_api_key()
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY not found in .env file")
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                _genai = genai
+    return _genai
+
+
+def strip_json_fences(text: str) -> str:
+    """Remove a surrounding ```json ... ``` (or bare ```) fence from a model response."""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    else:
+        return text
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for rate limiting (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+class LLMResponse(NamedTuple):
+    text: str
+    model: str
+    prompt_tokens: int
+    output_tokens: int
+    latency: float  # Seconds, including retries and rate-limit waits
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Wait until `amount` tokens are available and take them. Returns the seconds waited."""
+        amount = min(float(amount), self.capacity)
+        started = time.monotonic()
+        # Held while waiting so callers are served in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return time.monotonic() - started
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        """Take tokens without waiting; the balance may go negative and is repaid by later refills."""
+        self._refill()
+        self.tokens -= amount
+
+
+class _ModelLimiter:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+
+class _ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cancelled = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.first_token_latencies = deque(maxlen=LATENCY_WINDOW)  # Streamed calls only
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies)
+        first_token_latencies = sorted(self.first_token_latencies)
+
+        def percentile(p, values=latencies):
+            return round(values[min(len(values) - 1, int(p * len(values)))], 3) if values else 0.0
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "cancelled": self.cancelled,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_max": round(latencies[-1], 3) if latencies else 0.0,
+            "first_token_p50": percentile(0.5, first_token_latencies),
+            "first_token_p95": percentile(0.95, first_token_latencies),
+        }
+
+
+def parse_rate_limits(spec: str) -> Dict[str, tuple]:
+    """Parse GEMINI_RATE_LIMITS ("model=rpm/tpm,...") into {model: (rpm, tpm)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            model, values = item.split("=", 1)
+            rpm, tpm = values.split("/", 1)
+            limits[model.strip()] = (int(rpm), int(tpm))
+        except ValueError:
+            logger.warning("Ignoring invalid GEMINI_RATE_LIMITS entry: %r", item)
+    return limits
+
+
+_models = {}
+_limiters: Dict[str, _ModelLimiter] = {}
+_stats: Dict[str, _ModelStats] = {}
+_rate_limits = parse_rate_limits(RATE_LIMITS)
+
+
+class _RestUsage(NamedTuple):
+    prompt_token_count: int
+    candidates_token_count: int
+
+
+class _RestResponse(NamedTuple):
+    text: str
+    usage_metadata: _RestUsage
+
+
+def _rest_generation_config(generation_config) -> dict:
+    config = {}
+    for key, value in (generation_config or {}).items():
+        if key == "response_schema":
+            # The REST API takes plain JSON Schema, which pydantic produces directly
+            config["responseJsonSchema"] = value.model_json_schema()
+            continue
+        head, *rest = key.split("_")
+        config[head + "".join(word.title() for word in rest)] = value
+    return config
+
+
+def _get_http_client():
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        import httpx
+        _http_client = httpx.AsyncClient(base_url=API_ENDPOINT, timeout=HTTP_TIMEOUT)
+    return _http_client
+
+
+async def _rest_generate(model_name: str, contents: List[Dict], generation_config=None) -> _RestResponse:
+    """Call `models/{model}:generateContent` on GEMINI_API_ENDPOINT."""
+    body = {"contents": contents}
+    if generation_config:
+        body["generationConfig"] = _rest_generation_config(generation_config)
+    response = await _get_http_client().post(
+        f"/v1beta/models/{model_name}:generateContent", params={"key": get_api_key() or ""}, json=body
+    )
+    if response.status_code != 200:
+        raise GeminiHTTPError(response.status_code, response.text[:200])
+    data = response.json()
+    parts = data.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+    usage = data.get("usageMetadata", {})
+    return _RestResponse(
+        "".join(part.get("text", "") for part in parts),
+        _RestUsage(usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0)),
+    )
+
+
+async def _rest_stream(model_name: str, contents: List[Dict]) -> AsyncIterator[tuple]:
+    """Call `models/{model}:streamGenerateContent` on GEMINI_API_ENDPOINT, yielding (text, usage) per event."""
+    async with _get_http_client().stream(
+        "POST", f"/v1beta/models/{model_name}:streamGenerateContent",
+        params={"alt": "sse", "key": get_api_key() or ""}, json={"contents": contents},
+    ) as response:
+        if response.status_code != 200:
+            raise GeminiHTTPError(response.status_code, (await response.aread()).decode(errors="replace")[:200])
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[len("data:"):])
+            parts = (data.get("candidates") or [{}])[0].get("content", {}).get("parts", [])
+            usage = data.get("usageMetadata")
+            yield (
+                "".join(part.get("text", "") for part in parts),
+                _RestUsage(usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0)) if usage else None,
+            )
+
+
+def _rest_contents(message: str, history: List[Dict]) -> List[Dict]:
+    contents = [
+        {"role": turn["role"], "parts": [{"text": str(part)} for part in turn.get("parts", [])]}
+        for turn in history
+    ]
+    contents.append({"role": "user", "parts": [{"text": message}]})
+    return contents
+
+
+async def close_client():
+    """Close the REST client, if one was opened (called from the app's shutdown hook)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_model(model_name: str = DEFAULT_MODEL):
+    """Return a shared GenerativeModel instance for `model_name`."""
+    model = _models.get(model_name)
+    if model is None:
+        model = _models[model_name] = get_genai().GenerativeModel(model_name)
+    return model
+
+
+def _limiter(model_name: str) -> _ModelLimiter:
+    limiter = _limiters.get(model_name)
+    if limiter is None:
+        rpm, tpm = _rate_limits.get(model_name, (DEFAULT_RPM, DEFAULT_TPM))
+        limiter = _limiters[model_name] = _ModelLimiter(rpm, tpm)
+    return limiter
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed call is worth retrying (rate limiting, server errors, timeouts)."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code in TRANSIENT_STATUS_CODES:
+        return True
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+def _usage(response, fallback_prompt_tokens: int, text: str):
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or fallback_prompt_tokens
+    output_tokens = getattr(usage, "candidates_token_count", 0) or estimate_tokens(text)
+    return prompt_tokens, output_tokens
+
+
+def _record_latency(model_name: str, model_stats: _ModelStats, seconds: float):
+    # The window feeds /llm/stats percentiles; the histogram feeds /metrics
+    model_stats.latencies.append(seconds)
+    telemetry.llm_latency.observe(seconds, model=model_name)
+
+
+async def _call(model_name: str, prompt_tokens: int, send) -> LLMResponse:
+    limiter = _limiter(model_name)
+    model_stats = _stats.setdefault(model_name, _ModelStats())
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        model_stats.throttled_seconds += await limiter.requests.acquire(1)
+        model_stats.throttled_seconds += await limiter.tokens.acquire(prompt_tokens)
+        try:
+            response = await send()
+            text = response.text
+            break
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not is_transient(e):
+                model_stats.calls += 1
+                model_stats.errors += 1
+                _record_latency(model_name, model_stats, time.monotonic() - started)
+                raise
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            logger.warning("Transient Gemini error on %s (%s); retrying in %.1fs", model_name, e, delay)
+            attempt += 1
+            model_stats.retries += 1
+            await asyncio.sleep(delay)
+
+    used_prompt_tokens, output_tokens = _usage(response, prompt_tokens, text)
+    # Charge what the call really used beyond the up-front estimate
+    limiter.tokens.consume(max(0, used_prompt_tokens + output_tokens - prompt_tokens))
+    latency = time.monotonic() - started
+    model_stats.calls += 1
+    model_stats.prompt_tokens += used_prompt_tokens
+    model_stats.output_tokens += output_tokens
+    _record_latency(model_name, model_stats, latency)
+    telemetry.record_llm_usage(used_prompt_tokens, output_tokens)
+    return LLMResponse(text, model_name, used_prompt_tokens, output_tokens, latency)
+
+
+async def generate(prompt: str, model_name: str = DEFAULT_MODEL, **kwargs) -> LLMResponse:
+    """
+    Send a single prompt to Gemini, subject to the model's rate limits and retry policy.
+
+    Args:
+        prompt (str): The prompt text.
+        model_name (str): Which Gemini model to use.
+        **kwargs: Passed through to `generate_content_async` (e.g. generation_config).
+
+    Returns:
+        LLMResponse: The response text with token usage and latency.
+    """
+    if API_ENDPOINT:
+        return await _call(
+            model_name,
+            estimate_tokens(prompt),
+            lambda: _rest_generate(model_name, _rest_contents(prompt, []), kwargs.get("generation_config")),
+        )
+    model = get_model(model_name)
+    return await _call(model_name, estimate_tokens(prompt), lambda: model.generate_content_async(prompt, **kwargs))
+
+
+async def generate_json(prompt: str, schema, model_name: str = DEFAULT_MODEL):
+    """
+    Ask Gemini for JSON constrained to a pydantic model and validate the reply against it.
+
+    Schema models must not declare defaults and must use lists of objects rather than
+    free-form dicts, which Gemini's response schemas can't express.
+
+    Args:
+        prompt (str): The prompt text.
+        schema (type): A pydantic BaseModel subclass describing the response object.
+        model_name (str): Which Gemini model to use.
+
+    Returns:
+        An instance of `schema`.
+
+    Raises:
+        pydantic.ValidationError: If the response doesn't match the schema.
+    """
+    response = await generate(
+        prompt,
+        model_name,
+        generation_config={"response_mime_type": "application/json", "response_schema": schema},
+    )
+    return schema.model_validate_json(strip_json_fences(response.text))
+
+
+async def chat(message: str, history: List[Dict], model_name: str = DEFAULT_MODEL) -> LLMResponse:
+    """
+    Continue a conversation with Gemini.
+
+    Args:
+        message (str): The new user message.
+        history (list): Prior turns as [{"role": "user"|"model", "parts": [str]}].
+        model_name (str): Which Gemini model to use.
+
+    Returns:
+        LLMResponse: The reply text with token usage and latency.
+    """
+    prompt_tokens = estimate_tokens(message) + sum(
+        estimate_tokens(str(part)) for turn in history for part in turn.get("parts", [])
+    )
+    if API_ENDPOINT:
+        return await _call(model_name, prompt_tokens, lambda: _rest_generate(model_name, _rest_contents(message, history)))
+    model = get_model(model_name)
+    # A fresh ChatSession per attempt so a failed try doesn't leave a half-recorded turn behind
+    return await _call(
+        model_name, prompt_tokens, lambda: model.start_chat(history=history).send_message_async(message)
+    )
+
+
+async def _sdk_stream(start) -> AsyncIterator[tuple]:
+    """Yield (text, usage) per chunk of an SDK streaming response opened by `start()`."""
+    response = await start()
+    try:
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks carrying only a finish reason or safety ratings have no text
+                text = ""
+            yield text, getattr(chunk, "usage_metadata", None)
+    finally:
+        # Closing the chunk iterator ends the underlying RPC when the caller stops early
+        iterator = getattr(response, "_iterator", None)
+        if iterator is not None and hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+async def _stream(model_name: str, prompt_tokens: int, open_stream) -> AsyncIterator[str]:
+    limiter = _limiter(model_name)
+    model_stats = _stats.setdefault(model_name, _ModelStats())
+    started = time.monotonic()
+    attempt = 0
+    chunks = []
+    usage = None
+    opened = False
+    try:
+        while True:
+            model_stats.throttled_seconds += await limiter.requests.acquire(1)
+            model_stats.throttled_seconds += await limiter.tokens.acquire(prompt_tokens)
+            opened = True
+            try:
+                # `async for` alone wouldn't close the upstream when we stop early; aclosing ends the HTTP stream or RPC
+                async with aclosing(open_stream()) as upstream:
+                    async for text, chunk_usage in upstream:
+                        if chunk_usage is not None:
+                            usage = chunk_usage
+                        if text:
+                            if not chunks:
+                                first_token = time.monotonic() - started
+                                model_stats.first_token_latencies.append(first_token)
+                                telemetry.llm_first_token.observe(first_token, model=model_name)
+                            chunks.append(text)
+                            yield text
+                break
+            except Exception as e:
+                # Text already handed to the caller can't be taken back, so only retry before the first chunk
+                if chunks or attempt >= MAX_RETRIES or not is_transient(e):
+                    model_stats.errors += 1
+                    raise
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+                logger.warning("Transient Gemini error on %s (%s); retrying in %.1fs", model_name, e, delay)
+                attempt += 1
+                model_stats.retries += 1
+                await asyncio.sleep(delay)
+    except (asyncio.CancelledError, GeneratorExit):
+        model_stats.cancelled += 1
+        raise
+    finally:
+        # Cancelled and failed streams still used the prompt and whatever was generated
+        if opened:
+            text = "".join(chunks)
+            used_prompt_tokens = getattr(usage, "prompt_token_count", 0) or prompt_tokens
+            output_tokens = getattr(usage, "candidates_token_count", 0) or (estimate_tokens(text) if text else 0)
+            limiter.tokens.consume(max(0, used_prompt_tokens + output_tokens - prompt_tokens))
+            model_stats.calls += 1
+            model_stats.prompt_tokens += used_prompt_tokens
+            model_stats.output_tokens += output_tokens
+            _record_latency(model_name, model_stats, time.monotonic() - started)
+            telemetry.record_llm_usage(used_prompt_tokens, output_tokens)
+
+
+def stream_generate(prompt: str, model_name: str = DEFAULT_MODEL) -> AsyncIterator[str]:
+    """
+    Stream Gemini's reply to a single prompt as text chunks, as soon as each is generated.
+
+    Rate limits and retries apply as in `generate`, except that a stream which fails after
+    yielding text is not retried. Closing the iterator early (e.g. `aclose()` or cancelling the
+    consuming task) stops the upstream generation.
+
+    Args:
+        prompt (str): The prompt text.
+        model_name (str): Which Gemini model to use.
+
+    Returns:
+        AsyncIterator[str]: The reply text, chunk by chunk.
+    """
+    if API_ENDPOINT:
+        return _stream(model_name, estimate_tokens(prompt), lambda: _rest_stream(model_name, _rest_contents(prompt, [])))
+    model = get_model(model_name)
+    return _stream(
+        model_name, estimate_tokens(prompt), lambda: _sdk_stream(lambda: model.generate_content_async(prompt, stream=True))
+    )
+
+
+def stream_chat(message: str, history: List[Dict], model_name: str = DEFAULT_MODEL) -> AsyncIterator[str]:
+    """
+    Continue a conversation with Gemini, streaming the reply as text chunks; see `stream_generate`.
+
+    Args:
+        message (str): The new user message.
+        history (list): Prior turns as [{"role": "user"|"model", "parts": [str]}].
+        model_name (str): Which Gemini model to use.
+
+    Returns:
+        AsyncIterator[str]: The reply text, chunk by chunk.
+    """
+    prompt_tokens = estimate_tokens(message) + sum(
+        estimate_tokens(str(part)) for turn in history for part in turn.get("parts", [])
+    )
+    if API_ENDPOINT:
+        return _stream(model_name, prompt_tokens, lambda: _rest_stream(model_name, _rest_contents(message, history)))
+    model = get_model(model_name)
+    return _stream(
+        model_name,
+        prompt_tokens,
+        lambda: _sdk_stream(lambda: model.start_chat(history=history).send_message_async(message, stream=True)),
+    )
+
+
+def stats() -> dict:
+    """Per-model call counts, retries, rate-limit waits, token usage and latency percentiles."""
+    return {model_name: model_stats.snapshot() for model_name, model_stats in _stats.items()}
@@ -0,0 +1,176 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from contextlib import contextmanager
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Log records are queued by the calling code and written to stdout by a background thread, so a
+# slow or blocked stdout never stalls the event loop. Debug lines cost a single level check while
+# LOG_LEVEL is above DEBUG, which is the production default.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # Per-module overrides, e.g. "web_scraper=DEBUG,main=WARNING"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))  # Share of enabled debug lines kept
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Records buffered before new ones are dropped
+
+# Request or job the current code is working for; asyncio tasks and to_thread calls inherit it
+correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+
+# LogRecord attributes that are not `extra=` fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime",
+                                                                                   "correlation_id"}
+
+
+def get_correlation_id() -> Optional[str]:
+    return correlation_id.get()
+
+
+@contextmanager
+def correlation_scope(value: Optional[str]):
+    """Tag every log line written inside the block, including by tasks it starts, with `value`."""
+    token = correlation_id.set(value)
+    try:
+        yield value
+    finally:
+        correlation_id.reset(token)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps a random share of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, correlation ID and any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "correlation_id", None):
+            entry["correlation_id"] = record.correlation_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = None
+        return super().format(record)
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without ever blocking; drops them if the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only resolve what can't cross threads (args, traceback, context); formatting is the writer's job
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        record.correlation_id = correlation_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_exception_formatter = logging.Formatter()
+_handler: Optional[QueueingHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _start_listener():
+    global _listener
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS):
+    """
+    Route the root logger through the non-blocking queue. Safe to call more than once.
+
+    Args:
+        level (str): Default level for every logger.
+        levels (str): Per-logger overrides as "name=LEVEL,name=LEVEL".
+    """
+    global _handler
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, module_level in _parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+    if _handler is not None:
+        return
+
+    _handler = QueueingHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    if LOG_DEBUG_SAMPLE_RATE < 1:
+        _handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+    # Replace handlers installed by basicConfig so every line goes out once, through the queue
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    _start_listener()
+    atexit.register(stop_logging)
+    # The writer thread doesn't survive a fork (e.g. gunicorn --preload); restart it in the child
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_start_listener)
@@ -1,11 +1,16 @@
 import asyncio
-from web_scraper import scrape_class_central, genai
+import logging
+from telemetry import span
+from log_config import configure_logging, get_correlation_id
+from web_scraper import batch_scrape_class_central, get_fallback_courses
 from topic_generator import get_topics_for_degree
-from youtube_api import search_youtube
-import pycountry
+from youtube_api import search_youtube_batch, close_client as close_youtube_client
+from browser_pool import stop_browser_pool
 import json
 import re
 
+logger = logging.getLogger(__name__)
+
 
 def sanitize_value(value):
     """Make sure all values are of hashable types by converting lists to tuples and dicts to strings"""
@@ -29,7 +34,8 @@ def clean_dict(obj):
     else:
         return str(obj)  # Convert other types to string
 
-async def generate_roadmap(degree, country=None, language='en', include_paid=True, preferred_language=None):
+async def generate_roadmap(degree, country=None, language='en', include_paid=True, preferred_language=None,
+                           on_progress=None):
     """
     Generate a learning roadmap for a given degree or job role with optimized API calls.
     This implementation batches requests to minimize API calls and rate limits.
@@ -40,154 +46,309 @@ async def generate_roadmap(degree, country=None, language='en', include_paid=Tru
         language (str, optional): Preferred language for content
         include_paid (bool, optional): Whether to include paid courses
         preferred_language (str, optional): Preferred programming language
+        on_progress (callable, optional): Coroutine function called as `on_progress(event, data)` on
+            every stage transition ("stage"), once the topics are known ("topics") and with each
+            topic's selected options as soon as its Class Central and YouTube results are in
+            ("topic"; topics can finish out of order, so the event carries its `index`)
         
     Returns:
         dict: Complete roadmap with topics and course options
     """
+    # The correlation ID links the trace to the job's log lines
+    with span("roadmap", degree=str(degree), correlation_id=get_correlation_id()) as roadmap_span:
+        roadmap = await _generate_roadmap(degree, country, language, include_paid, preferred_language, on_progress)
+        roadmap_span.set("topics", len(roadmap["options"][0]["topics"]) if roadmap["options"] else 0)
+        return roadmap
+
+async def _generate_roadmap(degree, country=None, language='en', include_paid=True, preferred_language=None,
+                            on_progress=None):
+    """Build the roadmap; see `generate_roadmap`."""
+    async def report(event, **data):
+        # Progress is best-effort; a failing listener must not break generation
+        if on_progress is None:
+            return
+        try:
+            await on_progress(event, clean_dict(data))
+        except Exception as e:
+            logger.warning("Error reporting roadmap progress: %s", e)
+    
     roadmap = {
         "degree": str(degree),  # Ensure string
         "topics": []
     }
     
     # Step 1: Get all topics for the specified degree in a single call
-    try:
-        topics, is_programming_related = get_topics_for_degree(
-            degree, 
-            country=country, 
-            preferred_language=preferred_language
-        )
-        print(f"Generated {len(topics)} topics for '{degree}'")
-    except Exception as e:
-        print(f"Error generating topics: {str(e)}")
-        topics = [f"Topic {i+1}" for i in range(6)]  # Fallback topics
-        is_programming_related = False
+    await report("stage", stage="topics")
+    with span("topic_generation", degree=str(degree)) as topic_span:
+        try:
+            topics, is_programming_related = await get_topics_for_degree(
+                degree, 
+                country=country, 
+                preferred_language=preferred_language
+            )
+            logger.info("Generated %d topics for '%s'", len(topics), degree)
+        except Exception as e:
+            logger.exception("Error generating topics: %s", e)
+            topics = [f"Topic {i+1}" for i in range(6)]  # Fallback topics
+            is_programming_related = False
+            topic_span.set("fallback", True)
+        topic_span.set("topics", len(topics))
     
-    # Step 2: Batch fetch all resources for all topics in parallel
-    print(f"Starting batch fetch for all {len(topics)} topics")
+    await report("topics", topics=topics, is_programming_related=is_programming_related)
     
-    # Create coroutines for Class Central (async)
-    class_central_coroutines = [scrape_class_central(topic) for topic in topics]
+    # Step 2: Fetch every topic's resources, Class Central and YouTube at the same time, and
+    # assemble each topic as soon as both of its results are in
+    logger.info("Starting batch fetch for all %d topics", len(topics))
+    await report("stage", stage="resources")
+    loop = asyncio.get_running_loop()
+    class_central_ready = [loop.create_future() for _ in topics]
+    youtube_ready = [loop.create_future() for _ in topics]
     
-    # Execute Class Central scraping in parallel (async)
-    all_class_central_results = await asyncio.gather(*class_central_coroutines, return_exceptions=True)
+    def class_central_done(topic, courses):
+        for index, name in enumerate(topics):
+            if name != topic or class_central_ready[index].done():
+                continue
+            if not courses:
+                logger.info("No courses found for %s, returning fallback data", topic)
+                courses = get_fallback_courses(topic, 7)
+            class_central_ready[index].set_result(courses)
     
-    # YouTube API is synchronous, so process normally
-    all_youtube_results = []
-    for topic in topics:
-        try:
-            # Direct call to search_youtube (no await)
-            result = search_youtube(topic, language)
-            all_youtube_results.append(result)
-        except Exception as e:
-            print(f"Error fetching YouTube content for {topic}: {str(e)}")
-            all_youtube_results.append([])
+    def youtube_done(index, result):
+        if not youtube_ready[index].done():
+            youtube_ready[index].set_result(result)
     
-    print(f"Completed batch fetch for all topics")
+    async def fetch_class_central():
+        # One shared crawl plus a single extraction call for the topics that aren't cached;
+        # cached topics are handed over straight away
+        with span("scraping", topics=len(topics)) as scraping_span:
+            try:
+                await batch_scrape_class_central(topics, num_courses_per_topic=7, on_topic=class_central_done)
+            except Exception as e:
+                logger.exception("Error in Class Central batch scraping: %s", e)
+                scraping_span.fail(f"{type(e).__name__}: {e}")
+            finally:
+                for topic in topics:
+                    class_central_done(topic, None)
     
-    # Step 3: Process results and build roadmap
-    topic_descriptions = []
+    async def fetch_youtube():
+        # Searches run concurrently on the shared async client and the follow-up videos.list
+        # lookups are coalesced across all topics
+        with span("youtube", topics=len(topics)) as youtube_span:
+            unresolved = []  # What topics the batch didn't answer get: no videos, or its error
+            try:
+                await search_youtube_batch(topics, language, on_result=youtube_done)
+            except Exception as e:
+                logger.exception("Error fetching YouTube content: %s", e)
+                youtube_span.fail(f"{type(e).__name__}: {e}")
+                unresolved = e
+            finally:
+                for index in range(len(topics)):
+                    youtube_done(index, unresolved)
     
-    for i, topic in enumerate(topics):
-        topic_data = {
-            "name": topic,
-            "is_programming_related": is_programming_related,
-            "options": []
-        }
-        
-        # Process Class Central results for this topic
-        if i < len(all_class_central_results) and isinstance(all_class_central_results[i], list):
-            class_central_courses = all_class_central_results[i]
-            print(f"Got {len(class_central_courses)} courses from Class Central for '{topic}'")
-        else:
-            class_central_courses = []
-            if i < len(all_class_central_results):
-                print(f"Class Central scraping failed for topic '{topic}': {str(all_class_central_results[i])}")
-        
-        # Process YouTube results for this topic
-        if i < len(all_youtube_results) and isinstance(all_youtube_results[i], list):
-            youtube_courses = all_youtube_results[i]
-            print(f"Got {len(youtube_courses)} results from YouTube for '{topic}'")
-            # Print the first YouTube result for debugging if there are results
-            if len(youtube_courses) > 0:
-                print(f"First YouTube result for '{topic}': {youtube_courses[0].get('course_name', 'Unnamed')}")
-                print(f"URL: {youtube_courses[0].get('url', 'No URL')}")
-                print(f"Thumbnail: {youtube_courses[0].get('thumbnail', 'No thumbnail')}")
-        else:
-            youtube_courses = []
-            if i < len(all_youtube_results):
-                # If it's an exception, print the exception details
-                if isinstance(all_youtube_results[i], Exception):
-                    print(f"YouTube API failed for topic '{topic}': {str(all_youtube_results[i])}")
-                    import traceback
-                    print(f"Error details: {traceback.format_exc()}")
-                else:
-                    print(f"YouTube API returned no results for topic '{topic}'")
+    async def topic_resources(index):
+        return index, await class_central_ready[index], await youtube_ready[index]
+    
+    fetches = [asyncio.create_task(fetch_class_central()), asyncio.create_task(fetch_youtube())]
+    try:
+        assembled = [None] * len(topics)
+        for ready in asyncio.as_completed([topic_resources(index) for index in range(len(topics))]):
+            index, class_central_result, youtube_result = await ready
+            topic_data = assemble_topic(topics[index], is_programming_related, class_central_result, youtube_result)
+            assembled[index] = topic_data
+            await report("topic", index=index, name=topics[index], options=topic_data["options"])
+        await asyncio.gather(*fetches)
+    finally:
+        for fetch in fetches:
+            fetch.cancel()
+    roadmap["topics"] = assembled
+    logger.info("Completed batch fetch for all topics")
+    
+    # Step 3: Build the roadmap's paths through the topics
+    await report("stage", stage="assembly")
+    topic_descriptions = [
+        f"Learn {topic} through carefully selected resources that cover both theory and practice." for topic in topics
+    ]
+    
+    # Create the final roadmap structure - following exact format required
+    final_roadmap = {
+        "title": f"Your Path to {degree} Mastery",
+        "description": " ".join(topic_descriptions),
+        "topic": degree.split()[0].lower(),  # One to two word topic (e.g., "web" from "Web Development")
+        "selected_option": "1",  # Default selected option - IMPORTANT: should be a string
+        "options": []
+    }
+    
+    with span("assembly", topics=len(roadmap["topics"])):
+        # Create options (different paths through the topics)
+        for i in range(1, 5):  # Generate 4 options
+            option_topics = []
+            for step, topic_data in enumerate(roadmap["topics"], 1):
+                # Find the right course option to use
+                topic_options = topic_data["options"]
+                option_index = min(i-1, len(topic_options)-1) if topic_options else 0
+            
+                if topic_options and option_index < len(topic_options):
+                    course = topic_options[option_index]
+                    # Create a new dictionary instead of using references to avoid unhashable type issues
+                    # Handle potential conversion errors for numeric values
+                    try:
+                        rating_value = course.get("rating_value", "4.0")
+                        # Replace commas and convert to float
+                        rating = float(rating_value.replace(",", "")) if isinstance(rating_value, str) else float(rating_value)
+                    except (ValueError, TypeError):
+                        rating = 4.0  # Default if conversion fails
                 
-                # Create fallback YouTube search link
-                search_query = topic.replace(' ', '+')
-                youtube_courses = [{
-                    "course_name": f"YouTube search for {topic}",
-                    "platform": "YouTube",
-                    "description": f"Search results for {topic} on YouTube",
-                    "url": f"https://www.youtube.com/results?search_query={search_query}",
-                    "thumbnail": "https://www.gstatic.com/youtube/img/branding/youtubelogo/svg/youtubelogo.svg",
-                    "thumbnail_alt": f"YouTube search for {topic}",
-                    "views": "0",
-                    "rating": "Not available",
-                    "course_type": "Free",
-                    "duration": "Various videos"
-                }]
-        
-        # Ensure YouTube resources have all required fields
-        for course in youtube_courses:
-            if 'rating_value' not in course:
-                course['rating_value'] = '0'
-            if 'reviews_count' not in course:
-                course['reviews_count'] = '0'
-            if 'overview' not in course and 'description' in course:
-                course['overview'] = course['description']
-        
-        # Combine both sources - prioritize YouTube content over generic fallbacks
-        all_courses = []
+                    try:
+                        reviews_count = course.get("reviews_count", "0")
+                        # Replace commas and convert to int
+                        reviews = int(reviews_count.replace(",", "")) if isinstance(reviews_count, str) else int(reviews_count)
+                    except (ValueError, TypeError):
+                        reviews = 0  # Default if conversion fails
+                
+                    step_data = {
+                        "step_number": step,  # Integer not string
+                        "topic": str(topic_data["name"]),  # String
+                        "thumbnail": str(course.get("thumbnail", "https://via.placeholder.com/300x200.png?text=Resource")),  # String
+                        "url": str(course.get("url", "#")),  # String
+                        "rating": rating,  # Float
+                        "reviews_count": reviews,  # Integer
+                        "completed": False  # Boolean
+                    }
+                else:
+                    # Fallback if no course options exist
+                    step_data = {
+                        "step_number": step,  # Integer
+                        "topic": str(topic_data["name"]),  # String
+                        "thumbnail": "https://via.placeholder.com/300x200.png?text=Resource",  # String
+                        "url": f"https://www.youtube.com/results?search_query={topic_data['name'].replace(' ', '+')}",  # String
+                        "rating": 4.0,  # Float (explicitly a number, not string)
+                        "reviews_count": 0,  # Integer (explicitly a number, not string)
+                        "completed": False  # Boolean (explicitly a boolean, not string)
+                    }
+                option_topics.append(step_data)
         
-        # Always add YouTube resources first when available (up to 3)
+            final_roadmap["options"].append({
+                "option_id": i,  # Integer (not string) as in the example
+                "option_name": f"Option {i}",  # String
+                "topics": option_topics  # Array
+            })
+    
+    # Clean the entire roadmap to ensure all values are JSON serializable
+    cleaned_roadmap = clean_dict(final_roadmap)
+    return cleaned_roadmap
+
+
+def assemble_topic(topic, is_programming_related, class_central_result, youtube_result):
+    """
+    Select a topic's course options from its Class Central and YouTube results.
+
+    Args:
+        topic (str): The topic.
+        is_programming_related (bool): Whether the roadmap is about programming.
+        class_central_result (list): Class Central courses for the topic.
+        youtube_result (list | Exception): YouTube results, or the error the search failed with.
+
+    Returns:
+        dict: The topic's name and selected options.
+    """
+    topic_data = {
+        "name": topic,
+        "is_programming_related": is_programming_related,
+        "options": []
+    }
+    
+    # Process Class Central results for this topic
+    if isinstance(class_central_result, list):
+        class_central_courses = class_central_result
+        logger.debug("Got %d courses from Class Central for '%s'", len(class_central_courses), topic)
+    else:
+        class_central_courses = []
+        logger.warning("Class Central scraping failed for topic '%s': %s", topic, class_central_result)
+    
+    # Process YouTube results for this topic
+    if isinstance(youtube_result, list):
+        youtube_courses = youtube_result
+        logger.debug("Got %d results from YouTube for '%s'", len(youtube_courses), topic)
+        # Log the first YouTube result for debugging if there are results
         if youtube_courses:
-            # Make copies of course dictionaries to avoid reference issues
-            for course in youtube_courses[:3]:
-                all_courses.append(dict(course))
-            
-        # Then add Class Central resources if available
-        if class_central_courses:
-            # Make copies of course dictionaries to avoid reference issues
-            for course in class_central_courses[:3-len(all_courses)]:
-                all_courses.append(dict(course))
-            
-        # If we still need more courses, add more YouTube resources
-        if len(all_courses) < 3 and len(youtube_courses) > 3:
-            # Make copies of course dictionaries to avoid reference issues
-            for course in youtube_courses[3:6-len(all_courses)]:
-                all_courses.append(dict(course))
-        
-        # Process and select courses with Gemini API
-        all_courses_with_scores = []
+            logger.debug("First YouTube result for '%s': %s (%s, thumbnail %s)", topic,
+                         youtube_courses[0].get('course_name', 'Unnamed'), youtube_courses[0].get('url', 'No URL'),
+                         youtube_courses[0].get('thumbnail', 'No thumbnail'))
+    else:
+        youtube_courses = []
+        # If it's an exception, log it with its own traceback
+        if isinstance(youtube_result, Exception):
+            logger.warning("YouTube API failed for topic '%s': %s", topic, youtube_result, exc_info=youtube_result)
+        else:
+            logger.info("YouTube API returned no results for topic '%s'", topic)
         
-        # Add Class Central courses with source tracking
-        for idx, course in enumerate(class_central_courses):
-            course_copy = course.copy()
-            course_copy["source"] = "ClassCentral"
-            course_copy["source_index"] = idx
-            all_courses_with_scores.append(course_copy)
+        # Create fallback YouTube search link
+        search_query = topic.replace(' ', '+')
+        youtube_courses = [{
+            "course_name": f"YouTube search for {topic}",
+            "platform": "YouTube",
+            "description": f"Search results for {topic} on YouTube",
+            "url": f"https://www.youtube.com/results?search_query={search_query}",
+            "thumbnail": "https://www.gstatic.com/youtube/img/branding/youtubelogo/svg/youtubelogo.svg",
+            "thumbnail_alt": f"YouTube search for {topic}",
+            "views": "0",
+            "rating": "Not available",
+            "course_type": "Free",
+            "duration": "Various videos"
+        }]
+    
+    # Ensure YouTube resources have all required fields
+    for course in youtube_courses:
+        if 'rating_value' not in course:
+            course['rating_value'] = '0'
+        if 'reviews_count' not in course:
+            course['reviews_count'] = '0'
+        if 'overview' not in course and 'description' in course:
+            course['overview'] = course['description']
+    
+    # Combine both sources - prioritize YouTube content over generic fallbacks
+    all_courses = []
+    
+    # Always add YouTube resources first when available (up to 3)
+    if youtube_courses:
+        # Make copies of course dictionaries to avoid reference issues
+        for course in youtube_courses[:3]:
+            all_courses.append(dict(course))
         
-        # Add YouTube courses with source tracking
-        for idx, course in enumerate(youtube_courses):
-            course_copy = course.copy()
-            course_copy["source"] = "YouTube"
-            course_copy["source_index"] = idx
-            all_courses_with_scores.append(course_copy)
+    # Then add Class Central resources if available
+    if class_central_courses:
+        # Make copies of course dictionaries to avoid reference issues
+        for course in class_central_courses[:3-len(all_courses)]:
+            all_courses.append(dict(course))
         
+    # If we still need more courses, add more YouTube resources
+    if len(all_courses) < 3 and len(youtube_courses) > 3:
+        # Make copies of course dictionaries to avoid reference issues
+        for course in youtube_courses[3:6-len(all_courses)]:
+            all_courses.append(dict(course))
+    
+    # Process and select courses with Gemini API
+    all_courses_with_scores = []
+    
+    # Add Class Central courses with source tracking
+    for idx, course in enumerate(class_central_courses):
+        course_copy = course.copy()
+        course_copy["source"] = "ClassCentral"
+        course_copy["source_index"] = idx
+        all_courses_with_scores.append(course_copy)
+    
+    # Add YouTube courses with source tracking
+    for idx, course in enumerate(youtube_courses):
+        course_copy = course.copy()
+        course_copy["source"] = "YouTube"
+        course_copy["source_index"] = idx
+        all_courses_with_scores.append(course_copy)
+    
+    with span("selection", topic=topic) as selection_span:
         # Only create fallback course if no courses found
         if not all_courses_with_scores:
-            print(f"No resources found for topic '{topic}', creating fallback")
+            logger.info("No resources found for topic '%s', creating fallback", topic)
+            selection_span.set("fallback", True)
             fallback_course = {
                 "course_name": f"Search for {topic}",
                 "platform": "Multiple",
@@ -208,7 +369,7 @@ async def generate_roadmap(degree, country=None, language='en', include_paid=Tru
         else:
             # Manual selection method: prioritize Class Central over YouTube when possible
             selected_resources = []
-            
+        
             # Prioritize Class Central courses (2-3 spots)
             class_central_courses = [c for c in all_courses_with_scores if c["source"] == "ClassCentral"]
             class_central_other = [c for c in class_central_courses if c.get("platform", "").lower() not in ["coursera", "edx", "udacity", "harvard", "mit", "stanford"]]
@@ -216,152 +377,88 @@ async def generate_roadmap(degree, country=None, language='en', include_paid=Tru
             youtube_courses = [c for c in all_courses_with_scores if c["source"] == "YouTube"]
             youtube_with_views = [c for c in youtube_courses if int(c.get("views", "0").replace(",", "")) > 10000]
             youtube_other = [c for c in youtube_courses if int(c.get("views", "0").replace(",", "")) <= 10000]
-            
+        
             for course in class_central_with_premium[:3]:  # Get up to 3 Class Central courses
                 selected_resources.append(course)
-            
+        
             # Fill remaining spots with YouTube courses
             remaining_slots = 4 - len(selected_resources)
             for course in youtube_with_views[:remaining_slots]:
                 selected_resources.append(course)
-                
+            
             # Ensure we have 4 resources in total
             remaining_courses = [c for c in all_courses_with_scores if c not in selected_resources]
             while len(selected_resources) < 4 and remaining_courses:
                 selected_resources.append(remaining_courses.pop(0))
-            
-            # Set relevance scores for each resource based on its position
-            for i, resource in enumerate(selected_resources):
-                resource["relevance_score"] = 80 - (i * 10)
-        
-        # Generate an explanation for the selection
-        source_types = []
-        platforms = []
-        for resource in selected_resources:
-            if resource["source"] not in source_types:
-                source_types.append(resource["source"])
-            platform = resource.get("platform", "")
-            if platform and platform not in platforms:
-                platforms.append(platform)
-        
-        resources_explanation = f"These resources were selected because they are the most relevant for learning {topic}. "
-        if "ClassCentral" in source_types and "YouTube" in source_types:
-            resources_explanation += "They provide a mix of structured courses and video content for different learning styles. "
-        if platforms:
-            if len(platforms) > 1:
-                resources_explanation += f"They come from reputable platforms including {', '.join(platforms[:-1])} and {platforms[-1]}. "
-            else:
-                resources_explanation += f"They come from {platforms[0]}, a reputable learning platform. "
         
-        # Add the selected resources as options for this topic
-        for option_index, course in enumerate(selected_resources):
-            option = {
-                "option_id": option_index + 1,
-                "course_name": course["course_name"],
-                "selected_course": course["course_name"],
-                "platform": course.get("platform", "Not specified"),
-                "course_type": course.get("course_type", "Free") if "course_type" in course else "Free",
-                "duration": course.get("duration", "Not specified"),
-                "url": course.get("url", "#"),
-                "thumbnail": course.get("thumbnail", "https://via.placeholder.com/300x200.png?text=Resource"),
-                "thumbnail_alt": course.get("thumbnail_alt", "Course thumbnail"),
-                "rating_value": course.get("rating_value", "0"),
-                "reviews_count": course.get("reviews_count", "0"),
-                "overview": course.get("description", course.get("overview", "No overview available"))
-            }
-            topic_data["options"].append(option)
-            
-        # Log the resource selection process
-        print(f"For topic '{topic}': Selected {len(selected_resources)} resources from {len(all_courses)} available")
-        
-        # Create a topic description
-        topic_descriptions.append(f"Learn {topic} through carefully selected resources that cover both theory and practice.")
-        
-        # Add the topic to the roadmap
-        roadmap["topics"].append(topic_data)
+            # Set relevance scores for each resource based on its position
+            for rank, resource in enumerate(selected_resources):
+                resource["relevance_score"] = 80 - (rank * 10)
+        selection_span.set("candidates", len(all_courses_with_scores))
     
-    # Create the final roadmap structure - following exact format required
-    final_roadmap = {
-        "title": f"Your Path to {degree} Mastery",
-        "description": " ".join(topic_descriptions),
-        "topic": degree.split()[0].lower(),  # One to two word topic (e.g., "web" from "Web Development")
-        "selected_option": "1",  # Default selected option - IMPORTANT: should be a string
-        "options": []
-    }
+    # Generate an explanation for the selection
+    source_types = []
+    platforms = []
+    for resource in selected_resources:
+        if resource["source"] not in source_types:
+            source_types.append(resource["source"])
+        platform = resource.get("platform", "")
+        if platform and platform not in platforms:
+            platforms.append(platform)
     
-    # Create options (different paths through the topics)
-    for i in range(1, 5):  # Generate 4 options
-        option_topics = []
-        for step, topic_data in enumerate(roadmap["topics"], 1):
-            # Find the right course option to use
-            topic_options = topic_data["options"]
-            option_index = min(i-1, len(topic_options)-1) if topic_options else 0
-            
-            if topic_options and option_index < len(topic_options):
-                course = topic_options[option_index]
-                # Create a new dictionary instead of using references to avoid unhashable type issues
-                # Handle potential conversion errors for numeric values
-                try:
-                    rating_value = course.get("rating_value", "4.0")
-                    # Replace commas and convert to float
-                    rating = float(rating_value.replace(",", "")) if isinstance(rating_value, str) else float(rating_value)
-                except (ValueError, TypeError):
-                    rating = 4.0  # Default if conversion fails
-                
-                try:
-                    reviews_count = course.get("reviews_count", "0")
-                    # Replace commas and convert to int
-                    reviews = int(reviews_count.replace(",", "")) if isinstance(reviews_count, str) else int(reviews_count)
-                except (ValueError, TypeError):
-                    reviews = 0  # Default if conversion fails
-                
-                step_data = {
-                    "step_number": step,  # Integer not string
-                    "topic": str(topic_data["name"]),  # String
-                    "thumbnail": str(course.get("thumbnail", "https://via.placeholder.com/300x200.png?text=Resource")),  # String
-                    "url": str(course.get("url", "#")),  # String
-                    "rating": rating,  # Float
-                    "reviews_count": reviews,  # Integer
-                    "completed": False  # Boolean
-                }
-            else:
-                # Fallback if no course options exist
-                step_data = {
-                    "step_number": step,  # Integer
-                    "topic": str(topic_data["name"]),  # String
-                    "thumbnail": "https://via.placeholder.com/300x200.png?text=Resource",  # String
-                    "url": f"https://www.youtube.com/results?search_query={topic_data['name'].replace(' ', '+')}",  # String
-                    "rating": 4.0,  # Float (explicitly a number, not string)
-                    "reviews_count": 0,  # Integer (explicitly a number, not string)
-                    "completed": False  # Boolean (explicitly a boolean, not string)
-                }
-            option_topics.append(step_data)
-        
-        final_roadmap["options"].append({
-            "option_id": i,  # Integer (not string) as in the example
-            "option_name": f"Option {i}",  # String
-            "topics": option_topics  # Array
-        })
+    resources_explanation = f"These resources were selected because they are the most relevant for learning {topic}. "
+    if "ClassCentral" in source_types and "YouTube" in source_types:
+        resources_explanation += "They provide a mix of structured courses and video content for different learning styles. "
+    if platforms:
+        if len(platforms) > 1:
+            resources_explanation += f"They come from reputable platforms including {', '.join(platforms[:-1])} and {platforms[-1]}. "
+        else:
+            resources_explanation += f"They come from {platforms[0]}, a reputable learning platform. "
     
-    # Clean the entire roadmap to ensure all values are JSON serializable
-    cleaned_roadmap = clean_dict(final_roadmap)
-    return cleaned_roadmap
+    # Add the selected resources as options for this topic
+    for option_index, course in enumerate(selected_resources):
+        option = {
+            "option_id": option_index + 1,
+            "course_name": course["course_name"],
+            "selected_course": course["course_name"],
+            "platform": course.get("platform", "Not specified"),
+            "course_type": course.get("course_type", "Free") if "course_type" in course else "Free",
+            "duration": course.get("duration", "Not specified"),
+            "url": course.get("url", "#"),
+            "thumbnail": course.get("thumbnail", "https://via.placeholder.com/300x200.png?text=Resource"),
+            "thumbnail_alt": course.get("thumbnail_alt", "Course thumbnail"),
+            "rating_value": course.get("rating_value", "0"),
+            "reviews_count": course.get("reviews_count", "0"),
+            "overview": course.get("description", course.get("overview", "No overview available"))
+        }
+        topic_data["options"].append(option)
+        
+    # Log the resource selection process
+    logger.debug("For topic '%s': Selected %d resources from %d available", topic, len(selected_resources), len(all_courses))
+    return topic_data
 
 
 def get_region_code(country):
     """Convert country name to ISO region code"""
     if not country:
         return None
+    import pycountry  # Only needed here; keeps it out of the app's import path
     try:
         return pycountry.countries.search_fuzzy(country)[0].alpha_2
     except LookupError:
-        print(f"Country '{country}' not found.")
+        logger.warning("Country '%s' not found.", country)
         return None
 
 
 if __name__ == "__main__":
+    configure_logging()
+
     async def main():
-        roadmap = await generate_roadmap("Software Engineering", country="US", preferred_language="Python")
-        print(json.dumps(roadmap, indent=2))
+        try:
+            roadmap = await generate_roadmap("Software Engineering", country="US", preferred_language="Python")
+            print(json.dumps(roadmap, indent=2))
+        finally:
+            await stop_browser_pool()
+            await close_youtube_client()
 
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,59 @@
+import asyncio
+import json
+from typing import AsyncIterator
+from fastapi import Request
+
+# Headers for text/event-stream responses: no caching, and no proxy buffering that would hold
+# events back until the response ends
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def format_sse(event: str, data, event_id: int | None = None) -> str:
+    """Encode one server-sent event"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def wait_for_disconnect(request: Request):
+    """Return once the client has closed the connection. Call after the request body is read."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def until_disconnect(request: Request, items: AsyncIterator) -> AsyncIterator:
+    """
+    Yield from `items` until it ends or the client disconnects, whichever comes first.
+
+    `items` is closed either way, so work it does upstream (e.g. a model generation) is cancelled
+    as soon as the client goes away rather than when the next item fails to send.
+
+    Args:
+        request (Request): The request being answered.
+        items (AsyncIterator): An async generator to forward.
+
+    Yields:
+        The items, in order.
+    """
+    disconnected = asyncio.create_task(wait_for_disconnect(request))
+    next_item = None
+    try:
+        while True:
+            next_item = asyncio.ensure_future(anext(items))
+            await asyncio.wait({next_item, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_item.done():
+                return
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        disconnected.cancel()
+        if next_item is not None and not next_item.done():
+            # Cancelling the pending step unwinds and closes `items` from inside; waiting for it here
+            # isn't possible when this task is itself being cancelled
+            next_item.cancel()
+        else:
+            await items.aclose()
@@ -0,0 +1,331 @@
+import contextvars
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Timing spans for the roadmap pipeline. Every finished span feeds the stage histograms and
+# counters served on /metrics (per worker process); when OTEL_EXPORTER_OTLP_ENDPOINT is set the
+# spans are also batched to an OpenTelemetry collector as OTLP/HTTP JSON from a background thread.
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "").rstrip("/")
+OTLP_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "roadmap-api")
+OTLP_EXPORT_INTERVAL = float(os.getenv("OTLP_EXPORT_INTERVAL", "5"))  # Seconds between batches
+OTLP_MAX_QUEUE = int(os.getenv("OTLP_MAX_QUEUE", "2048"))  # Spans buffered before new ones are dropped
+OTLP_BATCH_SIZE = 512
+
+# Bucket bounds in seconds: cache hits take milliseconds, crawls and Gemini calls tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(zip(self.labels, key))} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, list] = {}  # key -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(series)) for key, series in self._values.items())
+        lines = []
+        for key, series in values:
+            labels = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+stage_duration = Histogram(
+    "roadmap_stage_duration_seconds", "Time spent in each roadmap pipeline stage.", ("stage", "outcome")
+)
+stage_runs = Counter("roadmap_stage_runs_total", "Roadmap pipeline stage runs by outcome.", ("stage", "outcome"))
+stage_tokens = Counter("roadmap_stage_tokens_total", "Gemini tokens used within each stage.", ("stage", "kind"))
+llm_latency = Histogram(
+    "llm_latency_seconds", "Gemini call latency, including retries and rate-limit waits.", ("model",)
+)
+llm_first_token = Histogram("llm_first_token_seconds", "Time to the first chunk of a streamed Gemini call.", ("model",))
+METRICS = [stage_duration, stage_runs, stage_tokens, llm_latency, llm_first_token]
+
+
+class Span:
+    """A timed pipeline stage with attributes such as topic, cache_hit, fallback and token counts."""
+
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, attributes: dict, parent: Optional["Span"]):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def fail(self, message: str):
+        """Mark the span as failed for an error that was handled rather than raised."""
+        self.error = message
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    @property
+    def outcome(self) -> str:
+        if self.error is not None:
+            return "error"
+        if self.attributes.get("cache_hit"):
+            return "cache_hit"
+        if self.attributes.get("fallback"):
+            return "fallback"
+        return "ok"
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attributes(**attributes):
+    """Set attributes on the innermost open span, if there is one."""
+    open_span = _current_span.get()
+    if open_span is not None:
+        open_span.attributes.update(attributes)
+
+
+def count_stage(stage: str, outcome: str = "cache_hit"):
+    """Count a stage that was skipped without doing timed work, e.g. served from a cache."""
+    stage_runs.inc(stage=stage, outcome=outcome)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block of pipeline work as a span named `name`.
+
+    Works in sync and async code; spans opened inside the block (including in tasks it
+    gathers) become its children.
+
+    Args:
+        name (str): The stage, e.g. "topic_generation" or "crawl".
+        **attributes: Initial attributes; more can be set on the yielded Span.
+
+    Yields:
+        Span: The open span.
+    """
+    current = Span(name, attributes, _current_span.get())
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        _record(current)
+
+
+def _record(finished: Span):
+    outcome = finished.outcome
+    stage_duration.observe(finished.duration, stage=finished.name, outcome=outcome)
+    stage_runs.inc(stage=finished.name, outcome=outcome)
+    if _exporter is not None:
+        _exporter.submit(finished)
+
+
+def record_llm_usage(prompt_tokens: int, output_tokens: int):
+    """Add a Gemini call's token usage to the innermost open span and the stage token counters."""
+    open_span = _current_span.get()
+    stage = open_span.name if open_span else "none"
+    stage_tokens.inc(prompt_tokens, stage=stage, kind="prompt")
+    stage_tokens.inc(output_tokens, stage=stage, kind="output")
+    if open_span is not None:
+        open_span.add("prompt_tokens", prompt_tokens)
+        open_span.add("output_tokens", output_tokens)
+
+
+def render_metric(name: str, kind: str, help: str, samples: Iterable[Tuple[dict, float]]) -> str:
+    """Render one metric family in the Prometheus text format from (labels, value) pairs."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(labels.items())} {_format_value(value)}")
+    return "\n".join(lines)
+
+
+def render_prometheus(extra: Iterable[str] = ()) -> str:
+    """
+    Render the span metrics, plus any pre-rendered families, in the Prometheus text format.
+
+    Args:
+        extra (iterable): Metric families from `render_metric`.
+
+    Returns:
+        str: The exposition text, ending in a newline.
+    """
+    families = []
+    for metric in METRICS:
+        families.append("\n".join([f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+                                  + metric.collect()))
+    families.extend(extra)
+    return "\n".join(families) + "\n"
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(finished: Span) -> dict:
+    data = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.end_ns),
+        "attributes": [
+            {"key": key, "value": _otlp_value(value)}
+            for key, value in finished.attributes.items() if value is not None
+        ],
+        "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+    }
+    if finished.parent_id:
+        data["parentSpanId"] = finished.parent_id
+    return data
+
+
+class OTLPExporter:
+    """Sends finished spans to an OTLP/HTTP collector in batches from a daemon thread."""
+
+    def __init__(self, endpoint: str, service_name: str = OTLP_SERVICE_NAME, interval: float = OTLP_EXPORT_INTERVAL,
+                 max_queue: int = OTLP_MAX_QUEUE):
+        self.url = f"{endpoint}/v1/traces"
+        self.service_name = service_name
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, finished: Span):
+        # Never blocks the pipeline; a stalled collector only costs us spans
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        import httpx
+        with httpx.Client(timeout=10) as client:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.interval
+                while len(batch) < OTLP_BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                self._send(client, batch)
+
+    def _send(self, client, batch: List[Span]):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "roadmap"}, "spans": [_otlp_span(item) for item in batch]}],
+        }]}
+        try:
+            response = client.post(self.url, json=body)
+            if response.status_code >= 300:
+                logger.warning("OTLP export failed with status %s", response.status_code)
+        except Exception as e:
+            logger.warning("OTLP export failed: %s", e)
+
+
+_exporter = OTLPExporter(OTLP_ENDPOINT) if OTLP_ENDPOINT else None
@@ -1,27 +1,110 @@
-from google import generativeai as genai
 from dotenv import load_dotenv
+from cachetools import TTLCache
+from disk_cache import DiskCache
+from typing import List
+from pydantic import BaseModel
+from llm_client import FAST_MODEL, generate_json
+from telemetry import set_attributes
 import os
 import json
+import logging
 
 load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY")
-if not API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
-genai.configure(api_key=API_KEY)
-
-def clean_response_text(response_text):
-    response_text = response_text.strip()
-    if response_text.startswith("```json"):
-        response_text = response_text[7:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-    elif response_text.startswith("```"):
-        response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-    return response_text.strip()
-
-def get_topics_for_degree(degree, num_topics=6, country=None, preferred_language=None):
+
+logger = logging.getLogger(__name__)
+
+# Topic cache: served from memory, then disk, then the curated seed file before calling the LLM.
+# Entries past their TTL are kept for TOPIC_CACHE_STALE_TTL and only used if the LLM call fails.
+TOPIC_CACHE_TTL = float(os.getenv("TOPIC_CACHE_TTL", str(7 * 24 * 3600)))
+TOPIC_CACHE_STALE_TTL = float(os.getenv("TOPIC_CACHE_STALE_TTL", str(30 * 24 * 3600)))
+TOPIC_CACHE_MAX_ENTRIES = int(os.getenv("TOPIC_CACHE_MAX_ENTRIES", "1024"))
+TOPIC_SEED_FILE = os.getenv(
+    "TOPIC_SEED_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "popular_topics.json"),
+)
+
+_memory_topic_cache = TTLCache(maxsize=TOPIC_CACHE_MAX_ENTRIES, ttl=TOPIC_CACHE_TTL)
+topic_cache = DiskCache("topics", ttl=TOPIC_CACHE_TTL, stale_ttl=TOPIC_CACHE_STALE_TTL)
+_seeded_topics = None
+
+def _normalize(value):
+    return " ".join(str(value).lower().split()) if value else ""
+
+def topic_cache_key(degree, num_topics=6, country=None, preferred_language=None):
+    """Build the cache key for a topic request from its normalized inputs."""
+    return json.dumps([_normalize(degree), num_topics, _normalize(country), _normalize(preferred_language)])
+
+def load_topic_seeds(path=TOPIC_SEED_FILE):
+    """
+    Load curated topic lists for popular degrees/roles.
+
+    The file is a JSON list of objects with 'degree', 'topics', 'is_programming_related' and optionally
+    'preferred_language' and 'country'. Entries without a country match requests from any country.
+
+    Args:
+        path (str): Path to the seed file.
+
+    Returns:
+        dict: Mapping of cache key to (topics, is_programming_related).
+    """
+    seeds = {}
+    if not path or not os.path.exists(path):
+        return seeds
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in entries:
+            topics = entry.get("topics") or []
+            if not entry.get("degree") or not topics:
+                continue
+            key = topic_cache_key(entry["degree"], len(topics), entry.get("country"), entry.get("preferred_language"))
+            seeds[key] = (list(topics), bool(entry.get("is_programming_related", False)))
+        logger.info("Loaded %d seeded topic lists from %s", len(seeds), path)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        logger.warning("Error loading topic seed file %s: %s", path, e)
+    return seeds
+
+class TopicList(BaseModel):
+    """Response schema for topic generation."""
+    topics: List[str]
+    is_programming_related: bool
+
+async def get_cached_topics(degree, num_topics=6, country=None, preferred_language=None):
+    """
+    Look up topics for a degree without calling the LLM.
+
+    Returns:
+        tuple or None: (list of topic strings, is_programming_related) on a hit, otherwise None.
+    """
+    global _seeded_topics
+    key = topic_cache_key(degree, num_topics, country, preferred_language)
+
+    cached = _memory_topic_cache.get(key)
+    if cached is None:
+        entry = await topic_cache.aget(key, allow_stale=False)
+        if entry is not None:
+            cached = (entry.value["topics"], entry.value["is_programming_related"])
+        else:
+            if _seeded_topics is None:
+                _seeded_topics = load_topic_seeds()
+            cached = _seeded_topics.get(key) or _seeded_topics.get(
+                topic_cache_key(degree, num_topics, None, preferred_language)
+            )
+        if cached is not None:
+            _memory_topic_cache[key] = cached
+
+    if cached is None:
+        return None
+    topics, is_programming_related = cached
+    return list(topics), is_programming_related
+
+async def remember_topics(degree, num_topics, country, preferred_language, topics, is_programming_related):
+    """Store a generated topic list in the memory and disk caches."""
+    key = topic_cache_key(degree, num_topics, country, preferred_language)
+    _memory_topic_cache[key] = (list(topics), is_programming_related)
+    await topic_cache.aset(key, {"topics": list(topics), "is_programming_related": is_programming_related})
+
+async def get_topics_for_degree(degree, num_topics=6, country=None, preferred_language=None):
     """
     Generate a list of topics for a given degree or role using an LLM, appending the preferred language to programming-related topics when applicable, and indicate if the degree/role is programming-related.
 
@@ -34,6 +117,12 @@ def get_topics_for_degree(degree, num_topics=6, country=None, preferred_language
     Returns:
         tuple: (list of topic strings, bool indicating if degree/role is programming-related)
     """
+    cached = await get_cached_topics(degree, num_topics, country=country, preferred_language=preferred_language)
+    if cached is not None:
+        logger.info("Topic cache hit for '%s'", degree)
+        set_attributes(cache_hit=True)
+        return cached
+
     # Include preferred_language in the prompt only if provided
     language_info = f"with a preferred programming language of '{preferred_language}'" if preferred_language else "without a preferred programming language"
 
@@ -64,21 +153,25 @@ Example response for 'UI/UX Designer':
 """
 
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        chat = model.start_chat(history=[])
-        response = chat.send_message(prompt)
-        response_text = response.text
-        response_text = clean_response_text(response_text)
-        response_json = json.loads(response_text)
-        topics = response_json['topics']
-        is_programming_related = response_json.get('is_programming_related', False)
+        result = await generate_json(prompt, TopicList, FAST_MODEL)
+        topics = result.topics
+        is_programming_related = result.is_programming_related
 
         # Ensure the correct number of topics
         if len(topics) != num_topics:
-            print(f"Warning: Expected {num_topics} topics, but got {len(topics)}. Adjusting...")
+            logger.warning("Expected %d topics, but got %d. Adjusting...", num_topics, len(topics))
+            set_attributes(fallback=len(topics) < num_topics)
             topics = topics[:num_topics] if len(topics) > num_topics else topics + [f"Generic Topic {i + 1}" for i in range(num_topics - len(topics))]
+        else:
+            await remember_topics(degree, num_topics, country, preferred_language, topics, is_programming_related)
         return topics, is_programming_related
     except Exception as e:
-        print(f"Error parsing LLM response: {e}, response_text: {response_text if 'response_text' in locals() else 'Not available'}")
-        # Fallback: return generic topics and assume not programming-related
+        logger.warning("Error generating topics with LLM: %s", e)
+        set_attributes(fallback=True)
+        # Fallback: an expired cache entry beats generic topics
+        stale = await topic_cache.aget(topic_cache_key(degree, num_topics, country, preferred_language))
+        if stale is not None:
+            logger.info("Using expired cached topics for '%s'", degree)
+            return list(stale.value["topics"]), stale.value["is_programming_related"]
+        # Last resort: return generic topics and assume not programming-related
         return [f"Topic {i + 1}" for i in range(num_topics)], False
\ No newline at end of file
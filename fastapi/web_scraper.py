@@ -1,102 +1,246 @@
 import asyncio
+import logging
 import os
 import re
 import json
 from typing import List, Dict, Any, Tuple
 from dotenv import load_dotenv
-from crawl4ai import AsyncWebCrawler
-import google.generativeai as genai
+from pydantic import BaseModel
+from browser_pool import get_browser_pool, stop_browser_pool
+from disk_cache import DiskCache
+from llm_client import generate_json
+from telemetry import count_stage, set_attributes, span
+from classcentral_markdown import (
+    PARSER_CONFIDENCE_THRESHOLD, UrlRefs, compact_markdown, compact_topic_markdowns, parse_topic_markdown,
+)
 
 # Load environment variables
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-MODEL_NAME = 'gemini-1.5-pro'  # Use pro model for batch processing
 
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
+logger = logging.getLogger(__name__)
 
-async def batch_scrape_class_central(topics: List[str], num_courses_per_topic=5):
+# Batch crawl limits (overridable per deployment)
+SCRAPE_MAX_CONCURRENCY = int(os.getenv("SCRAPE_MAX_CONCURRENCY", "6"))  # Search pages fetched at once per batch
+SCRAPE_TOPIC_TIMEOUT = float(os.getenv("SCRAPE_TOPIC_TIMEOUT", "45"))  # Seconds before a single topic is given up on
+
+# Class Central site root; overridable to point scraping at a mirror or a local stand-in
+CLASSCENTRAL_BASE_URL = os.getenv("CLASSCENTRAL_BASE_URL", "https://www.classcentral.com").rstrip("/")
+
+# Class Central search cache: fresh for SEARCH_CACHE_TTL, then served stale while refreshing
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", str(7 * 24 * 3600)))
+search_cache = DiskCache("classcentral_search", ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL)
+
+# Search URLs being refreshed by this worker, and strong references to their tasks
+_refreshing_search_urls = set()
+_background_tasks = set()
+
+# Response schemas for the extraction prompts. Gemini's structured output can't express
+# free-form dict keys, so per-topic and per-URL results come back as lists of objects.
+class ExtractedCourse(BaseModel):
+    course_name: str
+    platform: str
+    course_type: str
+    duration: str
+    overview: str
+    url: str
+    instructors: List[str]
+    reviews_count: str
+    thumbnail: str
+
+class TopicCourses(BaseModel):
+    topic: str
+    courses: List[ExtractedCourse]
+
+class CourseExtraction(BaseModel):
+    results: List[TopicCourses]
+
+class CourseList(BaseModel):
+    courses: List[ExtractedCourse]
+
+class CourseDetails(BaseModel):
+    url: str
+    rating: str
+    overview: str
+
+class CourseDetailsList(BaseModel):
+    courses: List[CourseDetails]
+
+def match_topic(name, topics):
+    """Map a topic name echoed back by the model onto one of the requested topics."""
+    if name in topics:
+        return name
+    normalized = " ".join(name.lower().split())
+    for topic in topics:
+        if " ".join(topic.lower().split()) == normalized:
+            return topic
+    return None
+
+def normalize_search_url(topic):
+    """Build the cache key for a topic: its search URL with case and whitespace normalized."""
+    normalized_topic = " ".join(topic.lower().split())
+    return build_search_url(normalized_topic)
+
+def build_search_url(topic):
+    """Build the Class Central search URL for a topic."""
+    # Replace spaces with %20 for URL encoding
+    encoded_topic = topic.replace(" ", "%20")
+    return f"{CLASSCENTRAL_BASE_URL}/search?q={encoded_topic}"
+
+def find_thumbnail_urls(markdown):
+    """Return the course thumbnail URLs on a search results page, in page order."""
+    # Extract thumbnail URLs using all known patterns
+    thumbnails = re.findall(r'!\[.*?\]\((https://d3f1iyfxxz8i1e\.cloudfront\.net/courses/course_image/[^\)]+)\)', markdown)
+    if not thumbnails:
+        # Fallback to direct URL pattern if markdown pattern doesn't work
+        thumbnails = re.findall(r'https://(?:[^\s)]+/course[_-]image/[^\s)]+\.(?:png|jpg|jpeg)|d3f1iyfxxz8i1e\.cloudfront\.net/courses/course_image/[^\s)]+\.(?:jpg|jpeg|png))', markdown)
+    return thumbnails
+
+async def fetch_topic_markdown(pool, topic):
+    """
+    Fetch one topic's Class Central search page and cut it down to the course listings.
+    
+    Args:
+        pool (BrowserPool): The shared browser pool to fetch the page with.
+        topic (str): The topic to search for.
+        
+    Returns:
+        Tuple[str, List[str]]: The course section markdown (empty on failure) and the thumbnail URLs found.
+    """
+    url = build_search_url(topic)
+    logger.debug("Fetching search results for topic: %s", topic)
+    result = await pool.arun(url)
+    
+    if not (hasattr(result, 'markdown') and result.markdown and len(result.markdown) > 100):
+        logger.warning("Invalid or empty response received for topic: %s", topic)
+        return "", []
+    
+    # Skip the header/filter section and focus on course listings
+    course_section_match = re.search(r'Show.*?Clear Filters(.*)', result.markdown, re.DOTALL)
+    if course_section_match:
+        course_section = course_section_match.group(1)
+    else:
+        # Fallback to using the whole markdown if we can't find the course section
+        course_section = result.markdown
+        logger.info("Using full markdown for topic: %s", topic)
+    
+    thumbnails = find_thumbnail_urls(result.markdown)
+    # The YouTube reference count is only worth scanning the page for when someone reads it
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Fetched search results for topic: %s (%d chars, %d YouTube references, %d thumbnails)",
+                     topic, len(course_section), len(re.findall(r'YouTube|youtube\.com|youtu\.be', course_section)),
+                     len(thumbnails))
+    return course_section, thumbnails
+
+async def batch_scrape_class_central(topics: List[str], num_courses_per_topic=5,
+                                     max_concurrency=SCRAPE_MAX_CONCURRENCY, topic_timeout=SCRAPE_TOPIC_TIMEOUT,
+                                     on_topic=None):
     """
     Batch scrape course details from Class Central for multiple topics efficiently.
+    Topics found in the search cache are served straight away (stale entries are refreshed
+    in the background); the rest are fetched concurrently and extracted in a single Gemini call.
     Process only the main search pages without fetching individual course detail pages.
     
     Args:
         topics (List[str]): List of topics to search for courses.
         num_courses_per_topic (int): Number of courses to scrape per topic (default: 5).
+        max_concurrency (int): Maximum number of search pages fetched at the same time.
+        topic_timeout (float): Seconds to wait for a single topic's page before skipping it.
+        on_topic (callable, optional): Called as `on_topic(topic, courses)` for each topic as soon as
+            its courses are known: cached topics straight away, scraped ones as they are extracted.
         
     Returns:
         Dict[str, List[Dict]]: Dictionary mapping each topic to its list of course dictionaries.
     """
-    # Create a single crawler instance for all operations
-    crawler = None
+    all_courses = {}
+    stale_topics = []
+    cached_pages = {}
+    topics_to_scrape = []
+    
+    for topic in topics:
+        entry = await search_cache.aget(normalize_search_url(topic))
+        if entry is None:
+            topics_to_scrape.append(topic)
+            continue
+        
+        cached = entry.value
+        if cached.get("courses") and cached.get("num_courses", 0) >= num_courses_per_topic:
+            logger.debug("Search cache %s for topic: %s", 'hit' if entry.fresh else 'stale hit', topic)
+            all_courses[topic] = cached["courses"][:num_courses_per_topic]
+            count_stage("crawl")
+            if on_topic is not None:
+                on_topic(topic, all_courses[topic])
+        elif cached.get("markdown"):
+            # We have the page but not enough extracted courses; re-extract without re-crawling
+            logger.debug("Search cache page hit for topic: %s, re-extracting %d courses", topic, num_courses_per_topic)
+            cached_pages[topic] = (cached["markdown"], cached.get("thumbnails", []))
+            topics_to_scrape.append(topic)
+            continue
+        else:
+            topics_to_scrape.append(topic)
+            continue
+        
+        if not entry.fresh:
+            stale_topics.append(topic)
     
+    if topics_to_scrape:
+        all_courses.update(await scrape_and_extract(
+            topics_to_scrape, num_courses_per_topic, max_concurrency, topic_timeout, cached_pages, on_topic
+        ))
+    
+    if stale_topics:
+        schedule_search_refresh(stale_topics, num_courses_per_topic)
+    
+    return all_courses
+
+async def scrape_and_extract(topics, num_courses_per_topic, max_concurrency=SCRAPE_MAX_CONCURRENCY,
+                             topic_timeout=SCRAPE_TOPIC_TIMEOUT, cached_pages=None, on_topic=None):
+    """
+    Crawl and extract courses for topics that could not be served from the search cache,
+    storing each successful result back in the cache.
+    
+    Args:
+        topics (List[str]): Topics to scrape.
+        num_courses_per_topic (int): Number of courses to extract per topic.
+        max_concurrency (int): Maximum number of search pages fetched at the same time.
+        topic_timeout (float): Seconds to wait for a single topic's page before skipping it.
+        cached_pages (Dict[str, Tuple[str, List[str]]], optional): Already-cached course section markdown
+            and thumbnails by topic; these topics are extracted without being crawled again.
+        on_topic (callable, optional): Called as `on_topic(topic, courses)` for each topic once it is
+            done. Pages the parser handles finish as they arrive; the rest wait for the Gemini call.
+        
+    Returns:
+        Dict[str, List[Dict]]: Dictionary mapping each topic to its list of course dictionaries.
+    """
+    cached_pages = cached_pages or {}
+    all_courses = {}
     try:
-        print(f"Initializing crawler for batch scraping {len(topics)} topics")
-        crawler = AsyncWebCrawler(
-            verbose=True,
-            headless=True,
-            timeout=60  # Reasonable timeout for main pages
-        )
+        # Pages come from the shared, pre-warmed browser pool instead of a fresh Chromium per call
+        pool = get_browser_pool()
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        logger.info("Batch scraping %d topics using the shared browser pool", len(topics))
         
-        # Step 1: Fetch main search page markdown for all topics
-        topic_markdowns = {}
-        thumbnail_urls_by_topic = {}
+        async def fetch_with_limits(topic):
+            if topic in cached_pages:
+                count_stage("crawl")
+                return cached_pages[topic]
+            async with semaphore:
+                with span("crawl", topic=topic) as crawl:
+                    try:
+                        markdown, thumbnails = await asyncio.wait_for(fetch_topic_markdown(pool, topic), topic_timeout)
+                        crawl.set("markdown_chars", len(markdown))
+                        crawl.set("fallback", not markdown)
+                        return markdown, thumbnails
+                    except asyncio.TimeoutError:
+                        logger.warning("Timed out after %ss fetching search results for topic: %s", topic_timeout, topic)
+                        crawl.fail(f"Timed out after {topic_timeout}s")
+                    except Exception as e:
+                        logger.warning("Error fetching search results for topic %s: %s", topic, e)
+                        crawl.fail(f"{type(e).__name__}: {e}")
+                    return "", []
         
-        for topic in topics:
-            # Replace spaces with %20 for URL encoding
-            encoded_topic = topic.replace(" ", "%20")
-            url = f"https://www.classcentral.com/search?q={encoded_topic}"
-            
-            try:
-                print(f"Fetching search results for topic: {topic}")
-                result = await crawler.arun(url=url)
-                
-                if hasattr(result, 'markdown') and result.markdown and len(result.markdown) > 100:
-                    # Check if there's any YouTube content in the markdown
-                    youtube_matches = re.findall(r'YouTube|youtube\.com|youtu\.be', result.markdown)
-                    if youtube_matches:
-                        print(f"Found {len(youtube_matches)} YouTube references in content for topic: {topic}")
-                    
-                    # Skip the header/filter section and focus on course listings
-                    course_section_match = re.search(r'Show.*?Clear Filters(.*)', result.markdown, re.DOTALL)
-                    if course_section_match:
-                        course_section = course_section_match.group(1)
-                        topic_markdowns[topic] = course_section
-                        print(f"Extracted course section for topic: {topic}")
-                        
-                        # Double-check for YouTube content in the extracted section
-                        youtube_in_section = re.findall(r'YouTube|youtube\.com|youtu\.be', course_section)
-                        if youtube_in_section:
-                            print(f"Found {len(youtube_in_section)} YouTube references in course section for topic: {topic}")
-                        else:
-                            print(f"No YouTube references in extracted course section for topic: {topic}")
-                    else:
-                        # Fallback to using the whole markdown if we can't find the course section
-                        topic_markdowns[topic] = result.markdown
-                        print(f"Using full markdown for topic: {topic}")
-                    
-                    # Extract thumbnail URLs using all known patterns
-                    thumbnails = re.findall(r'!\[.*?\]\((https://d3f1iyfxxz8i1e\.cloudfront\.net/courses/course_image/[^\)]+)\)', result.markdown)
-                    if not thumbnails:
-                        # Fallback to direct URL pattern if markdown pattern doesn't work
-                        thumbnails = re.findall(r'https://(?:[^\s)]+/course[_-]image/[^\s)]+\.(?:png|jpg|jpeg)|d3f1iyfxxz8i1e\.cloudfront\.net/courses/course_image/[^\s)]+\.(?:jpg|jpeg|png))', result.markdown)
-                    
-                    thumbnail_urls_by_topic[topic] = thumbnails
-                    print(f"Found {len(thumbnails)} thumbnails for topic: {topic}")
-                else:
-                    print(f"Invalid or empty response received for topic: {topic}")
-                    topic_markdowns[topic] = ""
-                    thumbnail_urls_by_topic[topic] = []
-            except Exception as e:
-                print(f"Error fetching search results for topic {topic}: {e}")
-                topic_markdowns[topic] = ""
-                thumbnail_urls_by_topic[topic] = []
-        
-        # Step 2: Extract course details from all topic markdowns in a single Gemini API call
-        all_courses = await extract_all_courses_from_markdowns(topic_markdowns, num_courses_per_topic, thumbnail_urls_by_topic)
-        
-        # Ensure all courses have the required fields with default values
-        for topic, courses in all_courses.items():
+        async def finish(topic, courses, markdown, thumbnails):
+            # Ensure all courses have the required fields with default values
             for course in courses:
                 # Add default values for fields that would normally come from detail pages
                 if 'rating_value' not in course:
@@ -107,26 +251,74 @@ async def batch_scrape_class_central(topics: List[str], num_courses_per_topic=5)
                     course['rating'] = 'Not available'
                 if 'overview' not in course or not course['overview']:
                     course['overview'] = f"Course about {topic}. Visit the course page for more details."
+            # Remember both the page and the extracted courses for next time
+            if markdown and courses:
+                await search_cache.aset(normalize_search_url(topic), {
+                    "markdown": markdown,
+                    "thumbnails": thumbnails,
+                    "courses": courses,
+                    "num_courses": num_courses_per_topic,
+                })
+            all_courses[topic] = courses
+            if on_topic is not None:
+                on_topic(topic, courses)
+        
+        async def fetch_and_parse(topic):
+            # Topics the parser handles are finished as soon as their page is in
+            markdown, thumbnails = await fetch_with_limits(topic)
+            courses = parse_listing(topic, markdown, num_courses_per_topic, thumbnails)
+            if courses:
+                await finish(topic, courses, markdown, thumbnails)
+                return None
+            return topic, markdown, thumbnails
+        
+        # Step 1: Fetch and parse main search page markdown for all topics concurrently
+        fetched = await asyncio.gather(*(fetch_and_parse(topic) for topic in topics))
+        remaining = [item for item in fetched if item is not None]
+        
+        # Step 2: Extract course details for the rest in a single Gemini API call
+        if remaining:
+            extracted = await extract_all_courses_from_markdowns(
+                {topic: markdown for topic, markdown, _ in remaining}, num_courses_per_topic,
+                {topic: thumbnails for topic, _, thumbnails in remaining}, needs_llm=True
+            )
+            for topic, markdown, thumbnails in remaining:
+                await finish(topic, extracted.get(topic, []), markdown, thumbnails)
+        set_attributes(parsed_topics=len(topics) - len(remaining), llm_topics=len(remaining))
         
         return all_courses
     except Exception as e:
-        print(f"Error in batch scraping: {e}")
-        return {topic: get_fallback_courses(topic, num_courses_per_topic) for topic in topics}
-    finally:
-        # Ensure crawler is properly closed
-        if crawler:
-            try:
-                print("Closing crawler instance")
-                if hasattr(crawler, 'browser') and crawler.browser is not None:
-                    if not crawler.browser._closed:
-                        await crawler.close()
-                        print("Crawler closed successfully")
-                    else:
-                        print("Browser already closed, skipping crawler.close()")
-                else:
-                    print("No active browser found, skipping crawler.close()")
-            except Exception as e:
-                print(f"Error closing crawler: {e}")
+        logger.exception("Error in batch scraping: %s", e)
+        for topic in topics:
+            if topic not in all_courses:
+                all_courses[topic] = get_fallback_courses(topic, num_courses_per_topic)
+                if on_topic is not None:
+                    on_topic(topic, all_courses[topic])
+        return all_courses
+
+def schedule_search_refresh(topics, num_courses_per_topic):
+    """
+    Re-crawl stale topics in the background so the next request gets fresh results.
+    Topics already being refreshed by this worker are skipped.
+    """
+    topics = [topic for topic in topics if normalize_search_url(topic) not in _refreshing_search_urls]
+    if not topics:
+        return
+    keys = {normalize_search_url(topic) for topic in topics}
+    _refreshing_search_urls.update(keys)
+    
+    async def refresh():
+        try:
+            logger.info("Refreshing stale search cache entries for %d topics", len(topics))
+            await scrape_and_extract(topics, num_courses_per_topic)
+        except Exception as e:
+            logger.exception("Error refreshing search cache: %s", e)
+        finally:
+            _refreshing_search_urls.difference_update(keys)
+    
+    task = asyncio.create_task(refresh())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 async def fetch_course_page(crawler, url):
     """
@@ -145,7 +337,7 @@ async def fetch_course_page(crawler, url):
             return result.markdown
         return ""
     except Exception as e:
-        print(f"Error fetching course page {url}: {e}")
+        logger.warning("Error fetching course page %s: %s", url, e)
         return ""
 
 def get_fallback_courses(topic, num_courses):
@@ -175,7 +367,30 @@ def get_fallback_courses(topic, num_courses):
         } for i in range(1, num_courses + 1)
     ]
 
-async def extract_all_courses_from_markdowns(topic_markdowns, num_courses_per_topic, thumbnail_urls_by_topic):
+def parse_listing(topic, markdown, num_courses_per_topic, thumbnails):
+    """
+    Parse a topic's search page without Gemini.
+
+    Returns:
+        List[Dict]: The courses, or None if the page is too short or the parser isn't confident
+        enough and the topic needs Gemini extraction.
+    """
+    if not markdown or len(markdown) <= 100:
+        return None
+    parsed = parse_topic_markdown(markdown, num_courses_per_topic)
+    if not parsed.trusted(PARSER_CONFIDENCE_THRESHOLD):
+        logger.info("Parser confidence %.2f for '%s' is below %s (weak fields: %s), extracting with Gemini",
+                    parsed.confidence, topic, PARSER_CONFIDENCE_THRESHOLD, ", ".join(parsed.weak_fields()) or "none")
+        return None
+    courses = parsed.courses
+    for i, course in enumerate(courses):
+        if not course['thumbnail'].startswith('http'):
+            course_name_slug = course['course_name'].replace(' ', '+')
+            course['thumbnail'] = thumbnails[i] if i < len(thumbnails) else f"https://via.placeholder.com/300x200.png?text={course_name_slug}"
+    return courses
+
+async def extract_all_courses_from_markdowns(topic_markdowns, num_courses_per_topic, thumbnail_urls_by_topic,
+                                             needs_llm=False):
     """
     Extract comprehensive course details from multiple topic markdowns using a single Gemini API call.
     Optimized to extract as much information as possible from the main search pages without visiting course pages.
@@ -184,6 +399,8 @@ async def extract_all_courses_from_markdowns(topic_markdowns, num_courses_per_to
         topic_markdowns (Dict[str, str]): Dictionary mapping topic to its markdown content
         num_courses_per_topic (int): Number of courses to extract per topic
         thumbnail_urls_by_topic (Dict[str, List[str]]): Dictionary mapping topic to its thumbnail URLs
+        needs_llm (bool): True when the caller already ran the parser on these topics and it wasn't
+            confident, so they go straight to Gemini
     
     Returns:
         Dict[str, List[Dict]]: Dictionary mapping topic to its list of course dictionaries
@@ -192,152 +409,158 @@ async def extract_all_courses_from_markdowns(topic_markdowns, num_courses_per_to
     valid_topic_markdowns = {k: v for k, v in topic_markdowns.items() if v and len(v) > 100}
     
     if not valid_topic_markdowns:
-        print("No valid markdowns to process")
+        logger.warning("No valid markdowns to process")
         return {topic: [] for topic in topic_markdowns.keys()}
     
-    # Construct a prompt to extract courses for all topics in a single call
+    # The listing layout is regular enough to parse directly; only topics the parser
+    # isn't confident about are sent to Gemini
+    parsed_courses = {}
+    llm_topic_markdowns = {}
+    if needs_llm:
+        llm_topic_markdowns = valid_topic_markdowns
+    else:
+        for topic, markdown in valid_topic_markdowns.items():
+            courses = parse_listing(topic, markdown, num_courses_per_topic, thumbnail_urls_by_topic.get(topic, []))
+            if courses:
+                parsed_courses[topic] = courses
+            else:
+                llm_topic_markdowns[topic] = markdown
+        set_attributes(parsed_topics=len(parsed_courses), llm_topics=len(llm_topic_markdowns))
+    
+    if not llm_topic_markdowns:
+        logger.info("Parsed courses for all %d topics without Gemini", len(parsed_courses))
+        return {topic: parsed_courses.get(topic, []) for topic in topic_markdowns.keys()}
+    
+    # Construct a prompt to extract courses for all remaining topics in a single call
     prompt = """
     Extract comprehensive information for courses from the following Class Central search results.
     For each search topic, extract information for the specified number of courses.
     
-    Pay special attention to the Class Central markdown structure. Here are EXACT examples of what the course listings look like:
+    The listings have been compacted. Links and images are given as short reference IDs (U1, U2, ...).
+    Here is an EXACT example of what a course listing looks like:
 
     ```
-    1. [ ![Modern React Tutorial](https://d3f1iyfxxz8i1e.cloudfront.net/courses/course_image/83158888fa94.jpg) ](https://www.classcentral.com/classroom/youtube-full-modern-react-tutorial-45814)
-    [ Net Ninja ](https://www.classcentral.com/institution/netninja) ## [Modern React Tutorial ](https://www.classcentral.com/classroom/youtube-full-modern-react-tutorial-45814) [ 35 reviews ](https://www.classcentral.com/classroom/youtube-full-modern-react-tutorial-45814)
-    [ Hey gang, in this full React tutorial series, I'll take you from novice to ninja. We'll cover all the basics - what React is, setting up, components & routing - before diving into state management, async code, built-in hooks & custom hooks too. ](https://www.classcentral.com/classroom/youtube-full-modern-react-tutorial-45814)
-    Add to list 
-        * [ YouTube ](https://www.classcentral.com/provider/youtube "List of YouTube MOOCs")
-        * 3 hours 30 minutes 
-        * On-Demand 
-        * Free Video 
-    ```
-
-    ```
-    2. [ ![Modern React with Redux \[2024 Update\]](https://d3f1iyfxxz8i1e.cloudfront.net/courses/course_image/a0506c47cdce.jpg) ](https://www.classcentral.com/course/udemy-react-redux-23704)
-    ## [Modern React with Redux [2024 Update] ](https://www.classcentral.com/course/udemy-react-redux-23704) [ 88169 ratings at Udemy ](https://www.classcentral.com/course/udemy-react-redux-23704)
-    [ Master React and Redux. Apply modern design patterns to build apps with React Router, TailwindCSS, Context, and Hooks! ](https://www.classcentral.com/course/udemy-react-redux-23704)
-    Add to list 
-        * [ Udemy ](https://www.classcentral.com/provider/udemy "List of Udemy MOOCs")
-        * 3 days 3 hours 42 minutes 
-        * On-Demand 
-        * Paid Course 
+    1. [![Modern React Tutorial](U1)](U2)
+    Net Ninja ## Modern React Tutorial 35 reviews
+    Hey gang, in this full React tutorial series, I'll take you from novice to ninja.
+    * YouTube
+    * 3 hours 30 minutes
+    * On-Demand
+    * Free Video
     ```
     
     For each numbered course entry (1., 2., etc.), extract ALL of the following information:
 
-    1. course_name (the exact title, e.g. "Modern React Tutorial" or "Modern React with Redux [2024 Update]")
+    1. course_name (the exact title, e.g. "Modern React Tutorial")
     2. platform (the platform shown in bullet points, e.g., "YouTube", "Udemy")
     3. course_type (the last bullet point, e.g., "Free Video", "Paid Course")
-    4. duration (the time shown in bullet points, e.g., "3 hours 30 minutes", "3 days 3 hours 42 minutes")
-    5. overview (the description text in square brackets after the title)
-    6. url (the URL in the first link of each course - after the thumbnail image)
-    7. instructors (if shown, like "Net Ninja")
+    4. duration (the time shown in bullet points, e.g., "3 hours 30 minutes")
+    5. overview (the description line after the title)
+    6. url (the reference ID of the link wrapping the thumbnail, e.g. "U2")
+    7. instructors (if shown before the title, like "Net Ninja")
     8. reviews_count (number of reviews, e.g. "35" from "35 reviews" or "88169" from "88169 ratings at Udemy")
-    9. thumbnail (the exact URL in the image link, e.g., "https://d3f1iyfxxz8i1e.cloudfront.net/courses/course_image/83158888fa94.jpg")
+    9. thumbnail (the reference ID inside the image, e.g. "U1")
     
     CRITICAL INSTRUCTIONS: 
-    - Each course starts with a number followed by a period (e.g., "1." or "2.")
-    - The pattern is very consistent: thumbnail link -> instructor/institution -> course title -> review count -> description -> bullet points
+    - Copy reference IDs exactly as written; never invent URLs
     - The bullet points always contain: platform, duration, availability ("On-Demand"), and course type ("Free Video", "Paid Course")
-    - Extract the EXACT thumbnail URL from the image link - it will be a cloudfront.net URL
-    - ALWAYS get the full course URL from the first link in each course listing (the link that contains the thumbnail)
-    - PAY SPECIAL ATTENTION to YouTube content - these will have "YouTube" in the platform field and "Free Video" in the course type
     - For any course where the platform is YouTube, make sure to label it as a YouTube video in the course_type field
     - If information truly isn't available in the listing, use "Not available" as the value
     
-    Return the data as a valid JSON object where each key is the search topic and each value is an array of course objects containing ALL the above fields.
+    Return one entry per search topic, with the topic name exactly as given after "TOPIC:" and an array of course objects containing ALL the above fields.
 
-    Be extremely accurate and precise in your extraction - the data is consistently formatted in the listings.
-    
     Here are the search results for different topics:
     """
     
-    # Add each topic's markdown content to the prompt
-    for topic, markdown in valid_topic_markdowns.items():
-        # Truncate to avoid token limit issues
-        truncated_markdown = markdown[:12000] if len(markdown) > 12000 else markdown
-        prompt += f"\n\nTOPIC: {topic}\nNumber of courses to extract: {num_courses_per_topic}\n\n{truncated_markdown}\n"
+    # Add each topic's listings to the prompt, cut down to what extraction needs
+    compacted_markdowns, refs, report = compact_topic_markdowns(llm_topic_markdowns, num_courses_per_topic)
+    logger.info("Compacted Class Central markdown for %d topics: ~%d -> ~%d tokens", report['topics'],
+                report['tokens_before'], report['tokens_after'])
+    for topic, markdown in compacted_markdowns.items():
+        prompt += f"\n\nTOPIC: {topic}\nNumber of courses to extract: {num_courses_per_topic}\n\n{markdown}\n"
     
     try:
-        # Call Gemini API
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(prompt)
+        # Call Gemini API; the response is constrained to the CourseExtraction schema
+        all_courses = dict(parsed_courses)
         
-        # Extract valid JSON from response text
-        response_text = response.text
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        
-        all_courses = {}
-        
-        if json_match:
+        with span("llm_extraction", topics=len(llm_topic_markdowns), prompt_chars=len(prompt)) as extraction_span:
             try:
-                parsed_data = json.loads(json_match.group(0))
-                print(f"Successfully extracted courses data for {len(parsed_data)} topics")
+                extraction = await generate_json(prompt, CourseExtraction)
+                logger.info("Successfully extracted courses data for %d topics", len(extraction.results))
+            except ValueError as e:
+                # pydantic's ValidationError is a ValueError
+                logger.warning("Gemini response did not match the course schema: %s", e)
+                extraction_span.set("fallback", True)
+                extraction = CourseExtraction(results=[])
+        
+        if extraction.results:
+            # Process each topic's courses
+            for entry in extraction.results:
+                topic = match_topic(entry.topic, llm_topic_markdowns)
+                if topic is None:
+                    logger.info("Ignoring courses for unrequested topic: %s", entry.topic)
+                    continue
+                courses = [refs.restore_course(course.model_dump()) for course in entry.courses]
+                valid_courses = []
                 
-                # Process each topic's courses
-                for topic, courses in parsed_data.items():
-                    valid_courses = []
+                for i, course in enumerate(courses[:num_courses_per_topic]):
+                    # Ensure required fields exist
+                    if 'course_name' not in course or not course['course_name']:
+                        continue
                     
-                    for i, course in enumerate(courses[:num_courses_per_topic]):
-                        # Ensure required fields exist
-                        if 'course_name' not in course or not course['course_name']:
-                            continue
-                        
-                        # Fix relative URLs
-                        if 'url' in course and course['url']:
-                            if not course['url'].startswith('http'):
-                                if course['url'].startswith('/'):
-                                    course['url'] = f"https://www.classcentral.com{course['url']}"
-                                else:
-                                    course['url'] = f"https://www.classcentral.com/{course['url']}"
-                        
-                        # Handle thumbnails - prioritize the ones extracted by Gemini API if available
-                        if 'thumbnail' in course and course['thumbnail'] and course['thumbnail'].startswith('http'):
-                            # Use the thumbnail extracted by Gemini
-                            pass
-                        elif topic in thumbnail_urls_by_topic and i < len(thumbnail_urls_by_topic[topic]):
-                            # Use the thumbnail from our regex extraction
-                            course['thumbnail'] = thumbnail_urls_by_topic[topic][i]
-                        else:
-                            # Use a placeholder
-                            course_name_slug = course['course_name'].replace(' ', '+')
-                            course['thumbnail'] = f"https://via.placeholder.com/300x200.png?text={course_name_slug}"
-                        
-                        # Ensure thumbnail_alt is set
-                        if 'thumbnail_alt' not in course:
-                            course['thumbnail_alt'] = f"{course['course_name']} thumbnail"
-                        
-                        # Set any missing fields with default values
-                        for field in ['rating', 'rating_value', 'reviews_count', 'overview', 'duration', 
-                                     'course_type', 'level', 'instructors', 'subject', 'start_date']:
-                            if field not in course or not course[field]:
-                                if field == 'rating_value':
-                                    course[field] = '3.5'  # Default rating value
-                                elif field == 'reviews_count':
-                                    course[field] = '10'   # Default reviews count
-                                elif field == 'instructors':
-                                    course[field] = []     # Empty list for instructors
-                                else:
-                                    course[field] = "Not available"
-                        
-                        # Ensure rating is properly formatted if we have rating_value but no rating
-                        if course['rating'] == "Not available" and course['rating_value'] != "Not available":
-                            course['rating'] = f"{course['platform']} Rating: {course['rating_value']} ({course['reviews_count']} ratings)"
-                        
-                        valid_courses.append(course)
+                    # Fix relative URLs
+                    if 'url' in course and course['url']:
+                        if not course['url'].startswith('http'):
+                            if course['url'].startswith('/'):
+                                course['url'] = f"https://www.classcentral.com{course['url']}"
+                            else:
+                                course['url'] = f"https://www.classcentral.com/{course['url']}"
+                    
+                    # Handle thumbnails - prioritize the ones extracted by Gemini API if available
+                    if 'thumbnail' in course and course['thumbnail'] and course['thumbnail'].startswith('http'):
+                        # Use the thumbnail extracted by Gemini
+                        pass
+                    elif topic in thumbnail_urls_by_topic and i < len(thumbnail_urls_by_topic[topic]):
+                        # Use the thumbnail from our regex extraction
+                        course['thumbnail'] = thumbnail_urls_by_topic[topic][i]
+                    else:
+                        # Use a placeholder
+                        course_name_slug = course['course_name'].replace(' ', '+')
+                        course['thumbnail'] = f"https://via.placeholder.com/300x200.png?text={course_name_slug}"
                     
-                    all_courses[topic] = valid_courses
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from Gemini response: {e}")
+                    # Ensure thumbnail_alt is set
+                    if 'thumbnail_alt' not in course:
+                        course['thumbnail_alt'] = f"{course['course_name']} thumbnail"
+                    
+                    # Set any missing fields with default values
+                    for field in ['rating', 'rating_value', 'reviews_count', 'overview', 'duration', 
+                                 'course_type', 'level', 'instructors', 'subject', 'start_date']:
+                        if field not in course or not course[field]:
+                            if field == 'rating_value':
+                                course[field] = '3.5'  # Default rating value
+                            elif field == 'reviews_count':
+                                course[field] = '10'   # Default reviews count
+                            elif field == 'instructors':
+                                course[field] = []     # Empty list for instructors
+                            else:
+                                course[field] = "Not available"
+                    
+                    # Ensure rating is properly formatted if we have rating_value but no rating
+                    if course['rating'] == "Not available" and course['rating_value'] != "Not available":
+                        course['rating'] = f"{course['platform']} Rating: {course['rating_value']} ({course['reviews_count']} ratings)"
+                    
+                    valid_courses.append(course)
+                
+                all_courses[topic] = valid_courses
         else:
-            print("No valid JSON object found in Gemini response")
+            logger.warning("No courses found in Gemini response")
         
         # For any topics that weren't in the response or failed to parse,
         # use regex fallback method
         for topic in topic_markdowns.keys():
             if topic not in all_courses and topic in topic_markdowns and topic_markdowns[topic]:
-                print(f"Using fallback regex method for topic: {topic}")
+                logger.info("Using fallback regex method for topic: %s", topic)
+                count_stage("llm_extraction", "fallback")
                 thumbnail_urls = thumbnail_urls_by_topic.get(topic, [])
                 all_courses[topic] = extract_courses_with_regex(
                     topic_markdowns[topic], 
@@ -349,9 +572,9 @@ async def extract_all_courses_from_markdowns(topic_markdowns, num_courses_per_to
         
         return all_courses
     except Exception as e:
-        print(f"Error in batch course extraction: {e}")
-        # Return empty lists for all topics
-        return {topic: [] for topic in topic_markdowns.keys()}
+        logger.exception("Error in batch course extraction: %s", e)
+        # Keep what the parser found; return empty lists for the other topics
+        return {topic: parsed_courses.get(topic, []) for topic in topic_markdowns.keys()}
 
 async def extract_all_course_details(url_to_markdown):
     """
@@ -367,7 +590,7 @@ async def extract_all_course_details(url_to_markdown):
     valid_url_markdowns = {k: v for k, v in url_to_markdown.items() if v and len(v) > 100}
     
     if not valid_url_markdowns:
-        print("No valid course page markdowns to process")
+        logger.warning("No valid course page markdowns to process")
         return {}
     
     # Construct a prompt to extract details for all courses in a single call
@@ -381,7 +604,8 @@ async def extract_all_course_details(url_to_markdown):
     
     2. Overview: Extract a comprehensive course overview or description.
     
-    Return the data as a valid JSON object where each key is the course URL and each value is a JSON object with these fields:
+    Return one entry per course page with these fields:
+    - url: The course URL exactly as given after "COURSE URL:"
     - rating: Format as "Platform Rating: X.X (N ratings)" - use the actual platform name, not Class Central
     - overview: The course description
     
@@ -397,36 +621,29 @@ async def extract_all_course_details(url_to_markdown):
         prompt += f"\n\nCOURSE URL: {url}\n\n{truncated_markdown}\n"
     
     try:
-        # Call Gemini API
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(prompt)
-        
-        # Extract valid JSON from response text
-        response_text = response.text
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        
+        # Call Gemini API; the response is constrained to the CourseDetailsList schema
         course_details = {}
         
-        if json_match:
-            try:
-                parsed_data = json.loads(json_match.group(0))
-                print(f"Successfully extracted details for {len(parsed_data)} courses")
-                course_details = parsed_data
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from Gemini response: {e}")
-        else:
-            print("No valid JSON object found in Gemini response")
+        try:
+            details = await generate_json(prompt, CourseDetailsList)
+            course_details = {
+                entry.url: {"rating": entry.rating, "overview": entry.overview}
+                for entry in details.courses if entry.url in valid_url_markdowns
+            }
+            logger.info("Successfully extracted details for %d courses", len(course_details))
+        except ValueError as e:
+            logger.warning("Gemini response did not match the course details schema: %s", e)
         
         # For any URLs that weren't in the response or failed to parse,
         # use fallback method
         for url in url_to_markdown.keys():
             if url not in course_details and url in url_to_markdown and url_to_markdown[url]:
-                print(f"Using fallback method for course URL: {url}")
+                logger.info("Using fallback method for course URL: %s", url)
                 course_details[url] = fallback_course_details_extraction(url_to_markdown[url])
         
         return course_details
     except Exception as e:
-        print(f"Error in batch course details extraction: {e}")
+        logger.exception("Error in batch course details extraction: %s", e)
         # Return empty dictionary
         return {}
 
@@ -450,10 +667,10 @@ async def scrape_class_central(search_keyword, num_courses=7):
         if search_keyword in results and results[search_keyword]:
             return results[search_keyword]
         else:
-            print(f"No courses found for {search_keyword}, returning fallback data")
+            logger.info("No courses found for %s, returning fallback data", search_keyword)
             return get_fallback_courses(search_keyword, num_courses)
     except Exception as e:
-        print(f"Error in scrape_class_central: {e}")
+        logger.exception("Error in scrape_class_central: %s", e)
         return get_fallback_courses(search_keyword, num_courses)
 
 async def extract_courses_from_markdown(markdown_content, num_courses, thumbnail_urls):
@@ -470,9 +687,22 @@ async def extract_courses_from_markdown(markdown_content, num_courses, thumbnail
     """
     # First check if we have a valid markdown content to work with
     if not markdown_content or len(markdown_content) < 100:
-        print("Warning: Markdown content too short, likely invalid response")
+        logger.warning("Markdown content too short, likely invalid response")
         return []
     
+    parsed = parse_topic_markdown(markdown_content, num_courses)
+    if parsed.trusted(PARSER_CONFIDENCE_THRESHOLD):
+        courses = parsed.courses
+        logger.info("Parsed %d courses without Gemini (confidence %.2f)", len(courses), parsed.confidence)
+        for i, course in enumerate(courses):
+            if not course['thumbnail'].startswith('http') and thumbnail_urls and i < len(thumbnail_urls):
+                course['thumbnail'] = thumbnail_urls[i]
+        return courses
+    
+    # Only the listings we need go into the prompt, with URLs replaced by reference IDs
+    refs = UrlRefs()
+    compacted_markdown = compact_markdown(markdown_content, num_courses, refs)
+    
     # Prompt for the Gemini API to extract course details
     prompt = f"""
     Extract detailed information for {num_courses} courses from the following Class Central search results. 
@@ -485,75 +715,69 @@ async def extract_courses_from_markdown(markdown_content, num_courses, thumbnail
     6. URL
     7. Any image URLs for thumbnails
     
+    Links and images are given as short reference IDs (U1, U2, ...); copy them exactly into url and thumbnail.
+    
     Markdown content:
-    {markdown_content[:15000]}  # Limit content length to prevent token limit issues
+    {compacted_markdown}
     
-    Return the data as a valid JSON array of course objects with these fields:
+    Return the courses with these fields:
     - course_name
     - platform
     - course_type
     - duration
     - overview
     - url
+    - instructors (a list; empty if not shown)
+    - reviews_count ("Not available" if not shown)
     - thumbnail
-    - thumbnail_alt (description of the thumbnail)
     
-    Be precise about correctly extracting URLs. Make sure they are complete, not relative paths.
+    Be precise about correctly extracting reference IDs.
     """
     
     try:
-        # Call Gemini API
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(prompt)
-        
-        # Extract valid JSON from response text
-        response_text = response.text
-        # Look for a JSON array
-        json_match = re.search(r'\[\s*\{.*\}\s*\]', response_text, re.DOTALL)
-        if json_match:
-            # Process the matched JSON
-            try:
-                courses_data = json.loads(json_match.group(0))
-                print(f"Successfully extracted {len(courses_data)} courses from markdown")
+        # Call Gemini API; the response is constrained to the CourseList schema
+        with span("llm_extraction", topics=1, prompt_chars=len(prompt)):
+            result = await generate_json(prompt, CourseList)
+        if result.courses:
+            courses_data = [refs.restore_course(course.model_dump()) for course in result.courses]
+            logger.info("Successfully extracted %d courses from markdown", len(courses_data))
+            
+            # Validate and clean the extracted data
+            valid_courses = []
+            for i, course in enumerate(courses_data[:num_courses]):  # Limit to requested number
+                # Ensure all required fields exist
+                if 'course_name' not in course or not course['course_name']:
+                    continue
                 
-                # Validate and clean the extracted data
-                valid_courses = []
-                for i, course in enumerate(courses_data[:num_courses]):  # Limit to requested number
-                    # Ensure all required fields exist
-                    if 'course_name' not in course or not course['course_name']:
-                        continue
-                    
-                    # Fix relative URLs
-                    if 'url' in course and course['url']:
-                        if not course['url'].startswith('http'):
-                            if course['url'].startswith('/'):
-                                course['url'] = f"https://www.classcentral.com{course['url']}"
-                            else:
-                                course['url'] = f"https://www.classcentral.com/{course['url']}"
-                    
-                    # Use extracted thumbnail URLs if available
-                    if thumbnail_urls and i < len(thumbnail_urls):
-                        course['thumbnail'] = thumbnail_urls[i]
-                    else:
-                        course_name_slug = course['course_name'].replace(' ', '+')
-                        course['thumbnail'] = f"https://via.placeholder.com/300x200.png?text={course_name_slug}"
-                    
-                    # Ensure thumbnail_alt is set
-                    if 'thumbnail_alt' not in course or not course['thumbnail_alt']:
-                        course['thumbnail_alt'] = f"{course['course_name']} thumbnail"
-                    
-                    valid_courses.append(course)
+                # Fix relative URLs
+                if 'url' in course and course['url']:
+                    if not course['url'].startswith('http'):
+                        if course['url'].startswith('/'):
+                            course['url'] = f"https://www.classcentral.com{course['url']}"
+                        else:
+                            course['url'] = f"https://www.classcentral.com/{course['url']}"
+                
+                # Use extracted thumbnail URLs if available
+                if thumbnail_urls and i < len(thumbnail_urls):
+                    course['thumbnail'] = thumbnail_urls[i]
+                else:
+                    course_name_slug = course['course_name'].replace(' ', '+')
+                    course['thumbnail'] = f"https://via.placeholder.com/300x200.png?text={course_name_slug}"
+                
+                # Ensure thumbnail_alt is set
+                if 'thumbnail_alt' not in course or not course['thumbnail_alt']:
+                    course['thumbnail_alt'] = f"{course['course_name']} thumbnail"
                 
-                return valid_courses
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON: {e}")
+                valid_courses.append(course)
+            
+            return valid_courses
         else:
-            print("No valid JSON array found in response")
+            logger.warning("No courses found in Gemini response")
     except Exception as e:
-        print(f"Error processing Gemini API response: {e}")
+        logger.exception("Error processing Gemini API response: %s", e)
     
     # If we get here, use regex fallback method
-    print("Using fallback regex method to extract courses")
+    logger.info("Using fallback regex method to extract courses")
     return extract_courses_with_regex(markdown_content, num_courses, thumbnail_urls)
 
 def extract_courses_with_regex(markdown_content, num_courses, thumbnail_urls=None):
@@ -582,7 +806,7 @@ def extract_courses_with_regex(markdown_content, num_courses, thumbnail_urls=Non
         alt_pattern = r'\d+\.\s+\[\s*!\[([^\]]+)\]\(([^\)]+)\)\s*\]\(([^\)]+)\)'
         course_matches = re.findall(alt_pattern, markdown_content)
         if course_matches:
-            print(f"Found {len(course_matches)} courses using alternative pattern")
+            logger.debug("Found %d courses using alternative pattern", len(course_matches))
     
     if not course_blocks:
         # Fallback to simpler patterns if we couldn't identify course blocks
@@ -618,7 +842,7 @@ def extract_courses_with_regex(markdown_content, num_courses, thumbnail_urls=Non
         free_paid_pattern = r'(Free|Paid)\s*(?:Course|Video|Certificate)'
         free_paid = re.findall(free_paid_pattern, markdown_content, re.IGNORECASE)
     else:
-        print(f"Found {len(course_blocks)} course blocks using pattern matching")
+        logger.debug("Found %d course blocks using pattern matching", len(course_blocks))
 
     # If thumbnail_urls wasn't passed, extract them now
     if thumbnail_urls is None:
@@ -632,7 +856,7 @@ def extract_courses_with_regex(markdown_content, num_courses, thumbnail_urls=Non
         
         # Combine both patterns
         thumbnail_urls = thumbnail_matches + direct_matches
-        print(f"Regex fallback found {len(thumbnail_urls)} thumbnails")
+        logger.debug("Regex fallback found %d thumbnails", len(thumbnail_urls))
     
     # Process course blocks if we found them
     matches = []
@@ -723,11 +947,11 @@ def extract_courses_with_regex(markdown_content, num_courses, thumbnail_urls=Non
         is_youtube = False
         if platform.lower() == "youtube":
             is_youtube = True
-            print(f"Found YouTube content: {course_name}")
+            logger.debug("Found YouTube content: %s", course_name)
         elif "youtube" in url.lower() or "youtu.be" in url.lower():
             platform = "YouTube"
             is_youtube = True
-            print(f"Detected YouTube content from URL: {course_name}")
+            logger.debug("Detected YouTube content from URL: %s", course_name)
         
         # Get thumbnail - prioritize the one extracted from the course block if available
         if extracted_thumbnail and extracted_thumbnail != "Not available" and extracted_thumbnail.startswith('http'):
@@ -797,9 +1021,15 @@ def extract_courses_with_regex(markdown_content, num_courses, thumbnail_urls=Non
     return courses
 
 if __name__ == "__main__":
+    from log_config import configure_logging
+    configure_logging()
+
     async def main():
         keyword = input("Enter search keyword for courses: ")
-        courses = await scrape_class_central(keyword)
-        print(json.dumps(courses, indent=2))
+        try:
+            courses = await scrape_class_central(keyword)
+            print(json.dumps(courses, indent=2))
+        finally:
+            await stop_browser_pool()
     
     asyncio.run(main())
\ No newline at end of file
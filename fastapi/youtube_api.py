@@ -1,20 +1,119 @@
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
+from disk_cache import DiskCache
+from youtube_quota import QuotaManager, QuotaMode
+from telemetry import count_stage, set_attributes, span
+import asyncio
+import httpx
+import json
+import logging
 import os
 import re
-from datetime import datetime, timedelta
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Get the YouTube API key from environment variables
 API_KEY = os.getenv("YOUTUBE_API_KEY")
-if not API_KEY:
-    raise ValueError("YOUTUBE_API_KEY not found in .env file")
 
-# Initialize YouTube API client
-youtube = build('youtube', 'v3', developerKey=API_KEY)
+# Optional extra keys (comma-separated); quota is tracked and spent per key
+API_KEYS = [key.strip() for key in os.getenv("YOUTUBE_API_KEYS", API_KEY or "").split(",") if key.strip()]
+quota = QuotaManager(API_KEYS)
+
+# Search results cache, also the only source of results once the quota is nearly spent
+YOUTUBE_CACHE_TTL = float(os.getenv("YOUTUBE_CACHE_TTL", str(24 * 3600)))
+YOUTUBE_CACHE_STALE_TTL = float(os.getenv("YOUTUBE_CACHE_STALE_TTL", str(14 * 24 * 3600)))
+YOUTUBE_REDUCED_MAX_RESULTS = int(os.getenv("YOUTUBE_REDUCED_MAX_RESULTS", "3"))
+youtube_cache = DiskCache("youtube_search", ttl=YOUTUBE_CACHE_TTL, stale_ttl=YOUTUBE_CACHE_STALE_TTL)
+
+# YouTube Data API endpoint and HTTP client settings
+YOUTUBE_API_BASE_URL = os.getenv("YOUTUBE_API_BASE_URL", "https://www.googleapis.com/youtube/v3")
+YOUTUBE_HTTP_TIMEOUT = float(os.getenv("YOUTUBE_HTTP_TIMEOUT", "10"))
+YOUTUBE_MAX_CONNECTIONS = int(os.getenv("YOUTUBE_MAX_CONNECTIONS", "20"))
+
+# Shared async HTTP client with keep-alive connections (created on first use)
+_client = None
+
+class YouTubeApiError(Exception):
+    """An error response from the YouTube Data API."""
+
+    def __init__(self, status, message, reason=None):
+        super().__init__(f"YouTube API error {status}: {message}")
+        self.status = status
+        self.reason = reason
+
+    @property
+    def quota_exceeded(self):
+        return self.status == 403 and self.reason in ("quotaExceeded", "dailyLimitExceeded")
+
+class QuotaBudgetExhausted(YouTubeApiError):
+    """Raised without calling the API when no key has enough daily budget left."""
+
+    def __init__(self, resource):
+        super().__init__(403, f"Daily quota budget exhausted for {resource}.list", "quotaExceeded")
+
+def get_client():
+    """Return the shared YouTube HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=YOUTUBE_API_BASE_URL,
+            timeout=YOUTUBE_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=YOUTUBE_MAX_CONNECTIONS,
+                max_keepalive_connections=YOUTUBE_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+async def close_client():
+    """Close the shared HTTP client (called from the app's shutdown hook)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def api_get(resource, **params):
+    """
+    Call a YouTube Data API v3 list endpoint.
+
+    Args:
+        resource (str): The resource path, e.g. 'search' or 'videos'.
+        **params: Query parameters; None values are dropped.
+
+    Returns:
+        dict: The decoded JSON response.
+
+    Raises:
+        QuotaBudgetExhausted: If no API key has budget left for the call.
+        YouTubeApiError: If the API returns a non-200 response.
+    """
+    if not API_KEYS:
+        raise ValueError("YOUTUBE_API_KEY not found in .env file")
+    api_key = await quota.atry_spend(resource)
+    if api_key is None:
+        raise QuotaBudgetExhausted(resource)
+
+    query = {k: v for k, v in params.items() if v is not None}
+    query["key"] = api_key
+    response = await get_client().get(f"/{resource}", params=query)
+    if response.status_code != 200:
+        reason = None
+        message = response.text
+        try:
+            error = response.json().get("error", {})
+            message = error.get("message", message)
+            errors = error.get("errors") or [{}]
+            reason = errors[0].get("reason")
+        except ValueError:
+            pass
+        error = YouTubeApiError(response.status_code, message, reason)
+        if error.quota_exceeded:
+            # The API knows best; stop spending on this key until the quota resets
+            await quota.amark_exhausted(api_key)
+        raise error
+    return response.json()
 
 # Language mapping for common full names to ISO 639-1 codes
 LANGUAGE_MAP = {
@@ -42,7 +141,7 @@ def normalize_language_code(language):
         return language
     mapped_language = LANGUAGE_MAP.get(language, "en")
     if mapped_language == "en" and language not in LANGUAGE_MAP:
-        print(f"Warning: Unrecognized language '{language}', defaulting to 'en'")
+        logger.warning("Unrecognized language '%s', defaulting to 'en'", language)
     return mapped_language
 
 def parse_duration(duration):
@@ -71,142 +170,233 @@ def format_duration(seconds):
         else:
             return f"{hours} hours {minutes} minutes"
 
-def get_video_durations(video_ids):
-    """Retrieve durations for a list of video IDs without caching."""
-    if not video_ids:
+# videos.list accepts at most this many comma-separated IDs per call
+MAX_IDS_PER_VIDEOS_CALL = 50
+
+async def get_video_details(video_ids, parts=('contentDetails', 'statistics')):
+    """
+    Retrieve several parts for many videos in as few videos.list calls as possible.
+
+    Args:
+        video_ids (list): Video IDs to look up; duplicates are fetched once.
+        parts (tuple): The videos.list parts to request together.
+
+    Returns:
+        dict: Mapping of video ID to its videos.list item.
+    """
+    unique_ids = list(dict.fromkeys(video_ids))
+    if not unique_ids:
         return {}
 
-    try:
-        request = youtube.videos().list(
-            part='contentDetails',
-            id=','.join(video_ids)
+    chunks = [unique_ids[i:i + MAX_IDS_PER_VIDEOS_CALL] for i in range(0, len(unique_ids), MAX_IDS_PER_VIDEOS_CALL)]
+    with span("youtube_details", videos=len(unique_ids), calls=len(chunks)):
+        responses = await asyncio.gather(
+            *(api_get('videos', part=','.join(parts), id=','.join(chunk)) for chunk in chunks),
+            return_exceptions=True
         )
-        response = request.execute()
-        durations = {item['id']: parse_duration(item['contentDetails']['duration'])
-                     for item in response.get('items', [])}
-        return durations
-    except HttpError as e:
-        if e.resp.status == 403 and 'quotaExceeded' in str(e):
-            print(f"Quota exceeded fetching durations for {video_ids}.")
-            return {}
-        raise
-
-def get_video_statistics(video_ids):
+
+    details = {}
+    for chunk, response in zip(chunks, responses):
+        if isinstance(response, YouTubeApiError) and response.quota_exceeded:
+            logger.warning("Quota exceeded fetching video details for %d videos.", len(chunk))
+            continue
+        if isinstance(response, Exception):
+            logger.warning("Error fetching video details for %d videos: %s", len(chunk), response)
+            continue
+        for item in response.get('items', []):
+            details[item['id']] = item
+    return details
+
+async def get_video_durations(video_ids):
+    """Retrieve durations in seconds for a list of video IDs without caching."""
+    details = await get_video_details(video_ids, parts=('contentDetails',))
+    return {vid: parse_duration(item['contentDetails']['duration']) for vid, item in details.items()}
+
+async def get_video_statistics(video_ids):
     """Retrieve statistics for a list of video IDs without caching."""
-    if not video_ids:
-        return {}
+    details = await get_video_details(video_ids, parts=('statistics',))
+    return {vid: item['statistics'] for vid, item in details.items()}
 
-    try:
-        request = youtube.videos().list(
-            part='statistics',
-            id=','.join(video_ids)
-        )
-        response = request.execute()
-        stats = {item['id']: item['statistics'] for item in response.get('items', [])}
-        return stats
-    except HttpError as e:
-        if e.resp.status == 403 and 'quotaExceeded' in str(e):
-            print(f"Quota exceeded fetching statistics for {video_ids}.")
-            return {}
-        raise
-
-def search_youtube(query, language='en', region_code=None, max_results=5):
+async def search_candidates(query, language='en', region_code=None, max_results=5):
     """
-    Search YouTube for playlists and long videos (excluding Shorts) based on a query.
-    This is a synchronous function that should NOT be awaited.
-
-    Args:
-        query (str): The search query.
-        language (str): The preferred language (e.g., 'en' or 'english').
-        region_code (str): The region code (e.g., 'US').
-        max_results (int): Maximum number of results to return (default: 5).
+    Run search.list for a query and split the hits into playlists and videos.
 
     Returns:
-        list: A list of dictionaries containing YouTube content details.
+        tuple: (list of playlist dicts, list of video dicts, list of video IDs aligned with the videos)
     """
     # Normalize language code
     normalized_language = normalize_language_code(language)
 
-    try:
-        # Search for both videos and playlists
-        search_response = youtube.search().list(
+    # Search for both videos and playlists
+    with span("youtube_search", topic=query, max_results=max_results):
+        search_response = await api_get(
+            'search',
             q=query,
             part='id,snippet',
             maxResults=max_results * 2,  # Fetch more results to account for filtering
             type='video,playlist',
             relevanceLanguage=normalized_language,  # Use normalized code
             regionCode=region_code
-        ).execute()
-
-        # Separate videos and playlists
-        video_ids = []
-        playlists = []
-        videos = []
-
-        for item in search_response.get('items', []):
-            kind = item['id']['kind']
-            title = item['snippet']['title']
-            description = item['snippet']['description']
-            thumbnail = item['snippet']['thumbnails']['default']['url']
-            if kind == 'youtube#video':
-                video_ids.append(item['id']['videoId'])
-                videos.append({
-                    "course_name": title,
-                    "platform": "YouTube",
-                    "description": description,
-                    "url": f"https://www.youtube.com/watch?v={item['id']['videoId']}",
-                    "thumbnail": thumbnail,
-                    "thumbnail_alt": title,
-                    "views": "0",  # Will be updated later
-                    "rating": "Not available",
-                    "course_type": "Free",
-                    "duration": "Not available"  # Will be updated later
-                })
-            elif kind == 'youtube#playlist':
-                playlists.append({
-                    "course_name": title,
-                    "platform": "YouTube",
-                    "description": description,
-                    "url": f"https://www.youtube.com/playlist?list={item['id']['playlistId']}",
-                    "thumbnail": thumbnail,
-                    "thumbnail_alt": title,
-                    "views": "0",  # Playlists don't have view counts directly
-                    "rating": "Not available",
-                    "course_type": "Free",
-                    "duration": "Playlist"
-                })
-
-        # Filter out Shorts and add duration to videos
-        durations = get_video_durations(video_ids)
-        long_videos = []
-        for video, vid in zip(videos, video_ids):
-            duration_seconds = durations.get(vid, 0)
-            if duration_seconds > 60:  # Exclude videos under 60 seconds
-                video['duration'] = format_duration(duration_seconds)
-                long_videos.append(video)
-
-        # Get view counts for long videos
-        long_video_ids = [video['url'].split('v=')[1] for video in long_videos]
-        if long_video_ids:
-            stats = get_video_statistics(long_video_ids)
-            for video, vid in zip(long_videos, long_video_ids):
-                video['views'] = stats.get(vid, {}).get('viewCount', '0')
-
-        # Combine results, prioritizing playlists
-        results = playlists + long_videos
-        results = results[:max_results]  # Trim to max_results
-
-        print(f"Fetched new results for query: '{query}'")
+        )
+
+    # Separate videos and playlists
+    video_ids = []
+    playlists = []
+    videos = []
+
+    for item in search_response.get('items', []):
+        kind = item['id']['kind']
+        title = item['snippet']['title']
+        description = item['snippet']['description']
+        thumbnail = item['snippet']['thumbnails']['default']['url']
+        if kind == 'youtube#video':
+            video_ids.append(item['id']['videoId'])
+            videos.append({
+                "course_name": title,
+                "platform": "YouTube",
+                "description": description,
+                "url": f"https://www.youtube.com/watch?v={item['id']['videoId']}",
+                "thumbnail": thumbnail,
+                "thumbnail_alt": title,
+                "views": "0",  # Will be updated later
+                "rating": "Not available",
+                "course_type": "Free",
+                "duration": "Not available"  # Will be updated later
+            })
+        elif kind == 'youtube#playlist':
+            playlists.append({
+                "course_name": title,
+                "platform": "YouTube",
+                "description": description,
+                "url": f"https://www.youtube.com/playlist?list={item['id']['playlistId']}",
+                "thumbnail": thumbnail,
+                "thumbnail_alt": title,
+                "views": "0",  # Playlists don't have view counts directly
+                "rating": "Not available",
+                "course_type": "Free",
+                "duration": "Playlist"
+            })
+
+    return playlists, videos, video_ids
+
+def assemble_results(playlists, videos, video_ids, details, max_results):
+    """Drop Shorts, fill in durations and view counts, and order playlists first."""
+    long_videos = []
+    for video, vid in zip(videos, video_ids):
+        item = details.get(vid, {})
+        duration_seconds = parse_duration(item.get('contentDetails', {}).get('duration', ''))
+        if duration_seconds > 60:  # Exclude videos under 60 seconds
+            video['duration'] = format_duration(duration_seconds)
+            video['views'] = item.get('statistics', {}).get('viewCount', '0')
+            long_videos.append(video)
+
+    # Combine results, prioritizing playlists
+    results = playlists + long_videos
+    return results[:max_results]  # Trim to max_results
+
+def search_cache_key(query, language, region_code, max_results):
+    """Cache key for a search: the normalized query and every parameter that changes its results."""
+    normalized_query = " ".join(query.lower().split())
+    return json.dumps([normalized_query, normalize_language_code(language), region_code or "", max_results])
+
+async def search_youtube_batch(queries, language='en', region_code=None, max_results=5, on_result=None):
+    """
+    Search YouTube for several queries at once, sharing the follow-up videos.list lookups.
+
+    Fresh cached results are served without any API calls. Every remaining query's search.list
+    call runs concurrently; the video IDs from all of them are then resolved together
+    (contentDetails and statistics in one request per 50 IDs) and fanned back out, so N topics
+    cost N + ceil(videos / 50) calls instead of 3N. As the daily quota runs low the search
+    degrades: fewer results per topic, then no statistics, then cached results only.
+
+    Args:
+        queries (list): The search queries, one per topic.
+        language (str): The preferred language (e.g., 'en' or 'english').
+        region_code (str): The region code (e.g., 'US').
+        max_results (int): Maximum number of results to return per query (default: 5).
+        on_result (callable, optional): Called as `on_result(index, results)` for each query as soon
+            as its results are known, so callers can use cached queries before the rest finish.
+
+    Returns:
+        list: One list of YouTube content dictionaries per query, in the same order.
+    """
+    mode = await quota.amode()
+    if mode != QuotaMode.NORMAL:
+        logger.warning("YouTube quota running low, searching in '%s' mode", mode)
+    set_attributes(quota_mode=mode)
+
+    results = [None] * len(queries)
+
+    def resolve(index, value):
+        results[index] = value
+        if on_result is not None:
+            on_result(index, value)
+
+    pending = []
+    for index, query in enumerate(queries):
+        entry = await youtube_cache.aget(search_cache_key(query, language, region_code, max_results))
+        if entry is not None and (entry.fresh or mode == QuotaMode.CACHE_ONLY):
+            resolve(index, entry.value)
+            count_stage("youtube_search")
+        elif mode == QuotaMode.CACHE_ONLY:
+            logger.info("No cached YouTube results for query: '%s' and quota is exhausted", query)
+            resolve(index, [])
+            count_stage("youtube_search", "fallback")
+        else:
+            pending.append(index)
+
+    if not pending:
         return results
 
-    except HttpError as e:
-        if e.resp.status == 403 and 'quotaExceeded' in str(e):
-            print(f"YouTube API quota exceeded for query: '{query}'. Returning empty list.")
-            return []
-        print(f"Error searching YouTube: {e}")
-        return []
+    search_max_results = max_results if mode == QuotaMode.NORMAL else min(max_results, YOUTUBE_REDUCED_MAX_RESULTS)
+    parts = ('contentDetails',) if mode == QuotaMode.NO_STATISTICS else ('contentDetails', 'statistics')
+
+    searches = await asyncio.gather(
+        *(search_candidates(queries[index], language, region_code, search_max_results) for index in pending),
+        return_exceptions=True
+    )
+
+    all_video_ids = []
+    for index, search in zip(pending, searches):
+        if isinstance(search, YouTubeApiError) and search.quota_exceeded:
+            logger.warning("YouTube API quota exceeded for query: '%s'. Returning empty list.", queries[index])
+        elif isinstance(search, Exception):
+            logger.warning("Error searching YouTube: %s", search)
+        else:
+            all_video_ids.extend(search[2])
+
+    details = await get_video_details(all_video_ids, parts=parts)
+
+    for index, search in zip(pending, searches):
+        if isinstance(search, Exception):
+            # Better an old answer than none
+            stale = await youtube_cache.aget(search_cache_key(queries[index], language, region_code, max_results))
+            resolve(index, stale.value if stale is not None else [])
+            continue
+        playlists, videos, video_ids = search
+        assembled = assemble_results(playlists, videos, video_ids, details, search_max_results)
+        if mode == QuotaMode.NORMAL and assembled:
+            await youtube_cache.aset(search_cache_key(queries[index], language, region_code, max_results), assembled)
+        resolve(index, assembled)
+        logger.debug("Fetched new results for query: '%s'", queries[index])
+    return results
+
+async def search_youtube(query, language='en', region_code=None, max_results=5):
+    """
+    Search YouTube for playlists and long videos (excluding Shorts) based on a query.
+    Runs on the shared async HTTP client; use search_youtube_batch for several topics.
+
+    Args:
+        query (str): The search query.
+        language (str): The preferred language (e.g., 'en' or 'english').
+        region_code (str): The region code (e.g., 'US').
+        max_results (int): Maximum number of results to return (default: 5).
+
+    Returns:
+        list: A list of dictionaries containing YouTube content details.
+    """
+    try:
+        return (await search_youtube_batch([query], language, region_code, max_results))[0]
     except Exception as e:
-        print(f"Error searching YouTube: {e}")
+        logger.warning("Error searching YouTube: %s", e)
         return []
-
-# Nothing further needed - using the simplified implementation
\ No newline at end of file
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from disk_cache import CACHE_DB_PATH, open_sqlite
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Quota units charged by the YouTube Data API per call, keyed by resource
+QUOTA_COSTS = {
+    "search": 100,  # search.list
+    "videos": 1,    # videos.list, regardless of how many parts or IDs
+}
+
+# Daily budget per API key (the default project quota is 10,000 units)
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+
+# Degradation thresholds, as the fraction of the total daily budget still remaining
+REDUCED_RESULTS_BELOW = float(os.getenv("YOUTUBE_QUOTA_REDUCED_BELOW", "0.3"))
+NO_STATISTICS_BELOW = float(os.getenv("YOUTUBE_QUOTA_NO_STATISTICS_BELOW", "0.15"))
+CACHE_ONLY_BELOW = float(os.getenv("YOUTUBE_QUOTA_CACHE_ONLY_BELOW", "0.05"))
+
+# Quota days roll over at midnight Pacific time
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+except Exception:
+    QUOTA_TIMEZONE = timezone(timedelta(hours=-8))
+
+
+class QuotaMode:
+    """How much YouTube work a search may do given the remaining budget."""
+    NORMAL = "normal"                # Full searches with durations and statistics
+    REDUCED = "reduced"              # Fewer results per topic
+    NO_STATISTICS = "no_statistics"  # Fewer results and no view counts
+    CACHE_ONLY = "cache_only"        # No API calls; serve cached results only
+
+
+class QuotaManager:
+    """
+    Tracks YouTube Data API spend per key against a daily budget.
+
+    Spend is recorded in the shared SQLite cache database so it survives restarts and is
+    seen by every worker on the host. Keys are stored as short hashes, never in plain text.
+    """
+
+    def __init__(self, api_keys, daily_budget=YOUTUBE_DAILY_QUOTA, path=CACHE_DB_PATH):
+        self.api_keys = [key for key in api_keys if key]
+        self.daily_budget = daily_budget
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            conn = open_sqlite(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS youtube_quota ("
+                "key_id TEXT NOT NULL, day TEXT NOT NULL, units INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (key_id, day))"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key_id(api_key):
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+    @staticmethod
+    def today():
+        return datetime.now(QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+
+    def spent(self, api_key):
+        """Units spent today by `api_key`."""
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT units FROM youtube_quota WHERE key_id = ? AND day = ?",
+                    (self.key_id(api_key), self.today()),
+                ).fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            logger.warning("Error reading YouTube quota: %s", e)
+            return 0
+
+    def remaining(self, api_key=None):
+        """Units left today for one key, or summed over every key."""
+        keys = [api_key] if api_key else self.api_keys
+        return sum(max(0, self.daily_budget - self.spent(key)) for key in keys)
+
+    def try_spend(self, resource, calls=1):
+        """
+        Reserve quota for an API call on whichever key has the most budget left.
+
+        Args:
+            resource (str): The API resource being called ('search' or 'videos').
+            calls (int): Number of calls to reserve.
+
+        Returns:
+            str or None: The API key to use, or None if no key can afford the call.
+        """
+        cost = QUOTA_COSTS.get(resource, 1) * calls
+        day = self.today()
+        for api_key in sorted(self.api_keys, key=self.spent):
+            try:
+                with self._lock:
+                    conn = self._connection()
+                    conn.execute(
+                        "INSERT OR IGNORE INTO youtube_quota (key_id, day, units) VALUES (?, ?, 0)",
+                        (self.key_id(api_key), day),
+                    )
+                    # Conditional update keeps the check-and-spend atomic across workers
+                    cursor = conn.execute(
+                        "UPDATE youtube_quota SET units = units + ? WHERE key_id = ? AND day = ? AND units + ? <= ?",
+                        (cost, self.key_id(api_key), day, cost, self.daily_budget),
+                    )
+                if cursor.rowcount:
+                    return api_key
+            except sqlite3.Error as e:
+                # Never block YouTube calls because the local ledger is unavailable
+                logger.warning("Error recording YouTube quota: %s", e)
+                return api_key
+        return None
+
+    def mark_exhausted(self, api_key):
+        """Record that the API itself reported this key's quota as spent for today."""
+        try:
+            with self._lock:
+                self._connection().execute(
+                    "INSERT OR REPLACE INTO youtube_quota (key_id, day, units) VALUES (?, ?, ?)",
+                    (self.key_id(api_key), self.today(), self.daily_budget),
+                )
+        except sqlite3.Error as e:
+            logger.warning("Error recording YouTube quota: %s", e)
+
+    def mode(self):
+        """The degradation mode implied by the remaining budget."""
+        total_budget = self.daily_budget * len(self.api_keys)
+        if not total_budget:
+            return QuotaMode.CACHE_ONLY
+        remaining = self.remaining()
+        fraction = remaining / total_budget
+        if remaining < QUOTA_COSTS["search"] or fraction < CACHE_ONLY_BELOW:
+            return QuotaMode.CACHE_ONLY
+        if fraction < NO_STATISTICS_BELOW:
+            return QuotaMode.NO_STATISTICS
+        if fraction < REDUCED_RESULTS_BELOW:
+            return QuotaMode.REDUCED
+        return QuotaMode.NORMAL
+
+    def snapshot(self):
+        """Remaining budget per key and overall, for metrics."""
+        keys = []
+        for api_key in self.api_keys:
+            spent = self.spent(api_key)
+            keys.append({
+                "key_id": self.key_id(api_key),
+                "spent": spent,
+                "remaining": max(0, self.daily_budget - spent),
+            })
+        return {
+            "day": self.today(),
+            "daily_budget_per_key": self.daily_budget,
+            "remaining": sum(key["remaining"] for key in keys),
+            "mode": self.mode(),
+            "keys": keys,
+        }
+
+    async def atry_spend(self, resource, calls=1):
+        """`try_spend` on a worker thread."""
+        return await asyncio.to_thread(self.try_spend, resource, calls)
+
+    async def amark_exhausted(self, api_key):
+        """`mark_exhausted` on a worker thread."""
+        await asyncio.to_thread(self.mark_exhausted, api_key)
+
+    async def amode(self):
+        """`mode` on a worker thread."""
+        return await asyncio.to_thread(self.mode)
+
+    async def asnapshot(self):
+        """`snapshot` on a worker thread."""
+        return await asyncio.to_thread(self.snapshot)